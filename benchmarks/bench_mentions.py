@@ -0,0 +1,106 @@
+###
+# Mention detection: the old substring check from on_pubmsg against mentions.MentionDetector.
+# Reports messages checked per second for both and replays a log to count the triggers the
+# old check fired that the detector rejects. Each one is a topic call plus a reply not made.
+#
+#   python benchmarks/bench_mentions.py --log ~/.weechat/logs/irc.server.#channel.weechatlog [--nick wintermute]
+#   python benchmarks/bench_mentions.py --messages 500000 --aliases 200   # synthetic messages
+###
+
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import weechat_log
+from mentions import MentionDetector, DIRECT
+
+SAMPLE_LINES = 10 # Rejected triggers printed for a manual false-positive check
+
+
+def legacy_classify(nickname, message_text):
+    """The check on_pubmsg used before mentions.py."""
+    is_direct_command = message_text.lower().startswith(nickname.lower() + ':')
+    is_mention = nickname.lower() in message_text.lower()
+    return is_direct_command or is_mention
+
+
+def synthetic_messages(nickname, count):
+    rng = random.Random(42)
+    words = "the a bot channel log python regex works broken fixed deploy again why".split()
+    specials = [
+        f"{nickname}: what is the weather", f"hey {nickname} are you there", f"{nickname}s are everywhere",
+        f"see https://example.com/{nickname}/faq", f"<alice> {nickname}: that was wrong", f"{nickname}_ is my alt",
+        f"@{nickname}, thoughts?", f"[12:01] <bob> {nickname} said something",
+    ]
+    messages = []
+    for _ in range(count):
+        if rng.random() < 0.05:
+            messages.append(("#channel", rng.choice(["alice", "bob", "relaybot"]), rng.choice(specials)))
+        else:
+            messages.append(("#channel", rng.choice(["alice", "bob", "carol"]),
+                             " ".join(rng.choices(words, k=rng.randint(3, 20)))))
+    return messages
+
+
+def log_messages(path, channel):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return [(channel, r.nick, r.message) for r in weechat_log.iter_records(f, kinds=weechat_log.CHAT_KINDS)]
+
+
+def throughput(label, messages, check):
+    start = time.perf_counter()
+    triggered = sum(1 for channel, nick, text in messages if check(channel, nick, text))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {len(messages) / elapsed:>12,.0f} msgs/s  {elapsed:>7.2f} s  triggered {triggered:,}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark mention detection and replay false triggers.")
+    arg_parser.add_argument("--log", help="WeeChat log to replay")
+    arg_parser.add_argument("--channel", default="#channel", help="Channel the log belongs to (for policies)")
+    arg_parser.add_argument("--nick", default="wintermute")
+    arg_parser.add_argument("--messages", type=int, default=500000, help="Synthetic messages when --log is not given")
+    arg_parser.add_argument("--aliases", type=int, default=0, help="Extra synthetic aliases, to show scaling")
+    arg_parser.add_argument("--known-bots", default="relaybot", help="Comma-separated nicks to ignore")
+    args = arg_parser.parse_args()
+
+    messages = log_messages(args.log, args.channel) if args.log else synthetic_messages(args.nick, args.messages)
+    aliases = [f"alias{i}x" for i in range(args.aliases)]
+    known_bots = [n for n in args.known_bots.split(',') if n]
+    # Built once, as the bot does at startup
+    start = time.perf_counter()
+    detector = MentionDetector(args.nick, aliases, known_bots=known_bots)
+    print(f"## {len(messages):,} messages, {len(aliases) + 1} aliases, detector built in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    legacy_seconds = throughput("legacy substring check", messages, lambda c, n, t: legacy_classify(args.nick, t))
+    detector_seconds = throughput("MentionDetector.classify", messages, detector.classify)
+    print(f"{'':<28} {legacy_seconds / detector_seconds:>12.2f}x legacy")
+
+    # Replay: where do the two disagree?
+    replay = MentionDetector(args.nick, aliases, known_bots=known_bots)
+    rejected, added, legacy_total = [], 0, 0
+    kinds = Counter()
+    for channel, nick, text in messages:
+        legacy = legacy_classify(args.nick, text)
+        result = replay.classify(channel, nick, text)
+        legacy_total += legacy
+        kinds[result] += 1
+        if legacy and not result:
+            rejected.append((nick, text))
+        elif result and not legacy:
+            added += 1 # Aliases, or "@nick," / "nick," addresses the old check missed
+    stats = replay.stats()
+    rate = len(rejected) / legacy_total if legacy_total else 0.0
+    print(f"Old check triggered {legacy_total:,} times; detector: {kinds[DIRECT]:,} addressed + "
+          f"{kinds['mention']:,} mentions, {added:,} not seen by the old check.")
+    print(f"Rejected {len(rejected):,} old triggers ({rate:.1%}): {stats['suppressed_substring']:,} inside words/URLs, "
+          f"{stats['suppressed_relay']:,} relayed/pasted, {stats['suppressed_bot']:,} from known bots. "
+          f"~{len(rejected) * 2:,} model calls avoided.")
+    for nick, text in rejected[:SAMPLE_LINES]:
+        print(f"  rejected  <{nick}> {text[:100]}")
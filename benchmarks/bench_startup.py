@@ -0,0 +1,81 @@
+###
+# Startup cost of both entry points, measured in fresh interpreters with -X importtime.
+# Fails (exit 1) when an entry point exceeds its budget or loads a provider SDK at startup.
+#
+#   python benchmarks/bench_startup.py [--runs 5] [--top 10]
+###
+
+import os
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Median import wall time allowed per entry point, in ms. Provider SDKs alone take
+# several hundred ms, so loading one eagerly blows these budgets.
+STARTUP_BUDGET_MS = {
+    "wintermute.py": 350,
+    "prompt.generator.py": 150,
+}
+LAZY_MODULES = ("openai", "anthropic") # Must not be imported just by loading an entry point
+
+# Loads an entry point without running its __main__ block, then reports what got imported
+LOAD_SNIPPET = """
+import runpy, sys, time
+started = time.perf_counter()
+runpy.run_path({path!r}, run_name="startup_bench")
+elapsed_ms = (time.perf_counter() - started) * 1000
+print("ELAPSED_MS", elapsed_ms)
+print("EAGER_SDKS", ",".join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(script, runs):
+    """Returns (median_ms, eager_sdks, slowest top-level imports as [(cumulative_us, module)])."""
+    path = os.path.join(REPO_DIR, script)
+    env = dict(os.environ)
+    # The generator checks its key only in __main__, but a placeholder keeps older trees loadable
+    env.setdefault("OPENAI_API_KEY_PROMPT_GEN", "startup-bench")
+    code = LOAD_SNIPPET.format(path=path, lazy=LAZY_MODULES)
+    timings, eager, imports = [], set(), []
+    for run in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{script} failed to load:\n{result.stderr[-2000:]}")
+        for line in result.stdout.splitlines():
+            if line.startswith("ELAPSED_MS"):
+                timings.append(float(line.split()[1]))
+            elif line.startswith("EAGER_SDKS"):
+                eager.update(m for m in line.split(" ", 1)[1].split(",") if m)
+        if run == 0:
+            for line in result.stderr.splitlines():
+                match = IMPORTTIME_PATTERN.match(line)
+                if match and len(match.group(3)) <= 1: # Top-level imports only
+                    imports.append((int(match.group(2)), match.group(4)))
+    return statistics.median(timings), sorted(eager), sorted(imports, reverse=True)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Measure entry point startup against a budget.")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    args = arg_parser.parse_args()
+
+    failed = False
+    for script, budget_ms in STARTUP_BUDGET_MS.items():
+        median_ms, eager, imports = measure(script, args.runs)
+        over_budget = median_ms > budget_ms
+        failed = failed or over_budget or bool(eager)
+        print(f"{script:<22} median {median_ms:7.1f} ms (budget {budget_ms} ms) "
+              f"{'OVER BUDGET' if over_budget else 'ok'}")
+        if eager:
+            print(f"{'':<22} provider SDKs imported at startup: {', '.join(eager)}")
+        for cumulative_us, module in imports[:args.top]:
+            print(f"{'':<22} {cumulative_us / 1000:7.1f} ms  {module}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,161 @@
+###
+# Parser throughput: the original regex + strptime + startswith chain from prompt.generator.py
+# against weechat_log.iter_records / parse_columns, plus the cost of a 24 hour lookback.
+#
+#   python benchmarks/bench_weechat_log.py --log ~/.weechat/logs/irc.server.#channel.weechatlog
+#   python benchmarks/bench_weechat_log.py --lines 2000000   # synthetic log in a temp file
+###
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import weechat_log
+
+SERVER_NAMES = ("irc.serverName.org",)
+COLUMN_CHUNK_LINES = 100000
+
+# --- The parser as it was in prompt.generator.py, without the cutoff/reversal ---
+LEGACY_LOG_PATTERN = re.compile(
+    r"^(?P<timestamp_str>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\t"
+    r"(?P<sender_field>[^\t]+)\t"
+    r"(?P<message>.+)$"
+)
+LEGACY_NICK_PREFIXES = re.compile(r"^[~&@%+\s]+")
+
+
+def legacy_parse(line_content):
+    line_content = line_content.strip()
+    match = LEGACY_LOG_PATTERN.match(line_content)
+    if not match:
+        return None
+    parts = match.groupdict()
+    try:
+        msg_datetime = datetime.datetime.strptime(parts["timestamp_str"], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+    sender_field = parts["sender_field"].strip()
+    message = parts["message"].strip()
+    if sender_field in ["-->", "<--", "---"] or "irc.serverName.org" in sender_field:
+        return None
+    if message.startswith("has joined") or message.startswith("has quit") or \
+       message.startswith("has parted") or message.startswith("is now known as") or \
+       message.startswith("Mode ") or message.startswith("***"):
+        return None
+    nick = LEGACY_NICK_PREFIXES.sub("", sender_field)
+    if not nick or not message:
+        return None
+    return msg_datetime, f"{nick}: {message}"
+
+
+def write_synthetic_log(path, line_count):
+    rng = random.Random(42)
+    nicks = ["@op", "alice", "+bob", "carol", "dave", "cloudBot", "Wintermute"]
+    words = "the a bot channel log parser python regex time works broken fixed deploy again why".split()
+    ts = time.time() - line_count * 3 # ~3 s per line, ending now
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(line_count):
+            ts += rng.uniform(0, 6)
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+            roll = rng.random()
+            if roll < 0.08:
+                f.write(f"{stamp}\t-->\tguest{rng.randint(1, 999)} (u@host.example) has joined #channelName\n")
+            elif roll < 0.14:
+                f.write(f"{stamp}\t<--\tguest{rng.randint(1, 999)} (u@host.example) has quit (Ping timeout)\n")
+            elif roll < 0.16:
+                f.write(f"{stamp}\t--\tMode #channelName [+o alice] by ChanServ\n")
+            elif roll < 0.18:
+                f.write(f"{stamp}\t *\talice {' '.join(rng.choices(words, k=5))}\n")
+            else:
+                text = " ".join(rng.choices(words, k=rng.randint(3, 20)))
+                f.write(f"{stamp}\t{rng.choice(nicks)}\t{text}\n")
+
+
+def timed(label, size_bytes, func):
+    start = time.perf_counter()
+    lines, kept = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {lines / elapsed:>12,.0f} lines/s {size_bytes / elapsed / 1e6:>9,.1f} MB/s "
+          f"{elapsed:>8.2f} s  kept {kept:,}")
+    return elapsed
+
+
+def run_legacy(path):
+    lines = kept = 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            lines += 1
+            if legacy_parse(line) is not None:
+                kept += 1
+    return lines, kept
+
+
+def run_iter_records(path):
+    counter = {"lines": 0}
+
+    def counted(f):
+        for line in f:
+            counter["lines"] += 1
+            yield line
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        kept = sum(1 for _ in weechat_log.iter_records(counted(f), kinds=weechat_log.CHAT_KINDS,
+                                                        server_names=SERVER_NAMES))
+    return counter["lines"], kept
+
+
+def run_parse_columns(path):
+    lines = kept = 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            chunk = list(islice(f, COLUMN_CHUNK_LINES)) # Bounded memory on multi-GB logs
+            if not chunk:
+                break
+            lines += len(chunk)
+            kept += len(weechat_log.parse_columns(chunk, kinds=weechat_log.CHAT_KINDS, server_names=SERVER_NAMES)["ts"])
+    return lines, kept
+
+
+def run_lookback(path, hours=24):
+    since_ts = time.time() - hours * 3600
+    kept = sum(1 for _ in weechat_log.read_records_since(path, since_ts, server_names=SERVER_NAMES))
+    return kept, kept
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark WeeChat log parsing.")
+    arg_parser.add_argument("--log", help="Existing WeeChat log to parse")
+    arg_parser.add_argument("--lines", type=int, default=1000000, help="Synthetic log size when --log is not given")
+    args = arg_parser.parse_args()
+
+    temp_path = None
+    log_path = args.log
+    if not log_path:
+        fd, temp_path = tempfile.mkstemp(suffix=".weechatlog")
+        os.close(fd)
+        print(f"## Writing {args.lines:,} synthetic lines to {temp_path}")
+        write_synthetic_log(temp_path, args.lines)
+        log_path = temp_path
+
+    try:
+        size_bytes = os.path.getsize(log_path)
+        print(f"## {log_path}: {size_bytes / 1e6:,.1f} MB")
+        legacy_seconds = timed("legacy regex + strptime", size_bytes, lambda: run_legacy(log_path))
+        for label, func in (("weechat_log.iter_records", run_iter_records),
+                            ("weechat_log.parse_columns", run_parse_columns)):
+            seconds = timed(label, size_bytes, lambda: func(log_path))
+            print(f"{'':<34} {legacy_seconds / seconds:>12.2f}x legacy")
+        start = time.perf_counter()
+        recent, _ = run_lookback(log_path)
+        print(f"24h lookback via read_records_since: {recent:,} messages in "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms (bisects instead of scanning the whole file)")
+    finally:
+        if temp_path:
+            os.remove(temp_path)
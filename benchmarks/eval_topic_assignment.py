@@ -0,0 +1,298 @@
+###
+# Offline evaluation of the topic-assignment stage (wintermute.assign_message_topic).
+# Replays annotated WeeChat log segments through it with pluggable classifiers and prints
+# quality (agreement with gold threads, fragmentation, continuation / new-thread accuracy)
+# against calls made, latency per message and estimated cost.
+#
+#   python benchmarks/eval_topic_assignment.py --segments segments.jsonl [--recordings rec.json]
+#   python benchmarks/eval_topic_assignment.py --segments segments.jsonl --record rec.json   # calls the API
+#
+# Segments file: one JSON object per line,
+#   {"name": "...", "channel": "#c", "bot_nick": "wintermute",
+#    "lines": [{"line": "<raw weechat log line>", "thread": "gold-thread-id"}, ...]}
+# Lines with a "thread" are messages to the bot and are scored. Lines from bot_nick are its
+# replies and become the "last turn". Other lines are ambient and ignored. Thread ids are
+# arbitrary; only which messages share one matters.
+#
+# Recordings map a hash of each classifier request to the live model's label and latency,
+# so the current nano prompt can be compared without network access. Re-record after
+# changing the prompt, model or sampling parameters.
+###
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import weechat_log
+import wintermute
+from wintermute import TOPIC_MODEL # The model openai_api_request_topic calls, so prices match production
+from llm_scheduler import MODEL_PRICES_PER_MTOK
+
+ESTIMATED_TOKENS_PER_CALL = (350, 5) # (input, output), for recordings made without usage data
+RECORD_RATE_LIMIT_RETRIES = 60 # Seconds to wait for the provider bucket before giving up on a request
+
+
+def request_key(message, current_topics, bot_last_message_text, user_nick):
+    raw = json.dumps([message, sorted(current_topics), bot_last_message_text, user_nick])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def estimated_call_cost_usd():
+    input_price, output_price = MODEL_PRICES_PER_MTOK[TOPIC_MODEL]
+    input_tokens, output_tokens = ESTIMATED_TOKENS_PER_CALL
+    return (input_tokens * input_price + output_tokens * output_price) / 1000000
+
+
+class RecordedClassifier:
+    """Replays recorded live classifications; with record=True, calls the live model for missing ones."""
+
+    def __init__(self, recordings_path, record=False):
+        self.recordings_path = recordings_path
+        self.record = record
+        self.recordings = {}
+        if os.path.exists(recordings_path):
+            with open(recordings_path, 'r', encoding='utf-8') as f:
+                self.recordings = json.load(f)
+        self.calls = 0
+        self.unrecorded = 0
+        self.remote_ms = 0.0
+        self.cost_usd = 0.0
+
+    def record_call(self, message, current_topics, bot_last_message_text, user_nick, channel):
+        scheduler = wintermute.llm_scheduler
+        for _ in range(RECORD_RATE_LIMIT_RETRIES):
+            wintermute.topic_cache.clear() # Measure the model, not the cache
+            degraded_before = scheduler.counters["degraded_local_topic"]
+            spend_before = scheduler.spend_today
+            started = time.perf_counter()
+            topic = wintermute.openai_api_request_topic(message, current_topics, bot_last_message_text, user_nick, channel)
+            latency_ms = (time.perf_counter() - started) * 1000
+            if scheduler.counters["degraded_local_topic"] == degraded_before:
+                return {"topic": topic, "latency_ms": latency_ms, "usd": scheduler.spend_today - spend_before}
+            time.sleep(1) # Rate limited or over budget: the answer came from the local fallback
+        print(f"## Gave up recording a request after {RECORD_RATE_LIMIT_RETRIES} rate-limited attempts.")
+        return None
+
+    def __call__(self, message, current_topics, bot_last_message_text, user_nick, channel=None):
+        key = request_key(message, current_topics, bot_last_message_text, user_nick)
+        recording = self.recordings.get(key)
+        if recording is None and self.record:
+            recording = self.record_call(message, current_topics, bot_last_message_text, user_nick, channel)
+            if recording is not None:
+                self.recordings[key] = recording
+        if recording is None:
+            self.unrecorded += 1
+            return "general"
+        self.calls += 1
+        self.remote_ms += recording["latency_ms"]
+        self.cost_usd += recording.get("usd") or estimated_call_cost_usd()
+        return recording["topic"]
+
+    def save(self):
+        with open(self.recordings_path, 'w', encoding='utf-8') as f:
+            json.dump(self.recordings, f, indent=1)
+
+
+class CachedClassifier:
+    """Puts wintermute's TopicClassificationCache in front of another classifier, as the bot does."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.hits = 0
+
+    def __call__(self, message, current_topics, bot_last_message_text, user_nick, channel=None):
+        cache = wintermute.topic_cache
+        key = cache.make_key(message, current_topics, bot_last_message_text)
+        topic = cache.get(key)
+        if topic is not None:
+            self.hits += 1
+            return topic
+        topic = self.inner(message, current_topics, bot_last_message_text, user_nick, channel)
+        cache.put(key, topic, 0.0)
+        return topic
+
+
+def local_classifier(message, current_topics, bot_last_message_text, user_nick, channel=None):
+    return wintermute.assign_topic_locally(channel, message, current_topics)
+
+
+def load_segments(path):
+    segments = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                segment = json.loads(line)
+                segment.setdefault("name", f"segment-{line_number}")
+                segments.append(segment)
+    return segments
+
+
+def reset_bot_state():
+    wintermute.topic_threads.clear()
+    wintermute.user_topics.clear()
+    wintermute.topic_cache.clear()
+
+
+def replay_segment(segment, classifier):
+    """
+    Runs one segment through assign_message_topic. Returns ([(gold, predicted, predicted_was_active)],
+    latency_ms, [follow-up shortcuts taken, shortcuts that kept a message on the wrong thread]).
+    """
+    reset_bot_state()
+    channel = segment.get("channel", "#eval")
+    bot_nick = segment.get("bot_nick", wintermute.nickname).lower()
+    last_turn, last_asker, last_topic, last_gold = None, None, None, None
+    results = []
+    latency_ms = 0.0
+    shortcuts = [0, 0]
+    for entry in segment["lines"]:
+        record = weechat_log.parse_line(entry["line"])
+        if record is None or record.kind not in weechat_log.CHAT_KINDS:
+            continue
+        if record.nick.lower() == bot_nick:
+            if last_topic is not None:
+                last_turn = {"ts": record.ts, "text": record.message, "nick": last_asker, "topic": last_topic}
+                thread = wintermute.topic_threads[channel].get(last_topic)
+                if thread is not None: # Same bookkeeping as DumbBot.record_bot_turn
+                    thread["messages"].append((record.ts, record.nick, record.message))
+                    thread["last_active"] = record.ts
+            continue
+        if "thread" not in entry:
+            continue
+        message = wintermute._strip_call_prefix(record.message, channel)
+        wintermute.expire_old_threads(channel, now=record.ts)
+        started = time.perf_counter()
+        topic, current_topics, is_followup = wintermute.assign_message_topic(
+            channel, record.nick, message, last_turn, record.ts, classifier=classifier)
+        latency_ms += (time.perf_counter() - started) * 1000
+        wintermute.update_user_context(channel, record.nick, message, topic, record.ts)
+        wintermute.update_topic_threads(channel, topic, record.nick, message, record.ts)
+        results.append((entry["thread"], topic, topic in current_topics))
+        if is_followup:
+            shortcuts[0] += 1
+            shortcuts[1] += entry["thread"] != last_gold
+        last_asker, last_topic, last_gold = record.nick, topic, entry["thread"]
+    return results, latency_ms, shortcuts
+
+
+def bcubed_f1(results):
+    """B-cubed F1 between gold threads and predicted topics (1.0 = identical grouping)."""
+    if not results:
+        return 0.0
+    precision = recall = 0.0
+    for gold_i, predicted_i, _ in results:
+        same_predicted = [gold_j for gold_j, predicted_j, _ in results if predicted_j == predicted_i]
+        same_gold = [predicted_j for gold_j, predicted_j, _ in results if gold_j == gold_i]
+        precision += sum(1 for gold_j in same_predicted if gold_j == gold_i) / len(same_predicted)
+        recall += sum(1 for predicted_j in same_gold if predicted_j == predicted_i) / len(same_gold)
+    precision, recall = precision / len(results), recall / len(results)
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+def score_segment(results):
+    predicted_per_gold = defaultdict(set)
+    last_predicted_for_gold = {}
+    continuation_total = continuation_correct = new_total = new_correct = 0
+    for gold, predicted, was_active in results:
+        predicted_per_gold[gold].add(predicted)
+        if gold in last_predicted_for_gold:
+            continuation_total += 1
+            continuation_correct += predicted == last_predicted_for_gold[gold]
+        else:
+            new_total += 1
+            new_correct += not was_active # A new thread should not land in an existing topic
+        last_predicted_for_gold[gold] = predicted
+    return {
+        "messages": len(results),
+        "bcubed_f1": bcubed_f1(results),
+        "fragmentation_sum": sum(len(topics) for topics in predicted_per_gold.values()),
+        "gold_threads": len(predicted_per_gold),
+        "continuation": (continuation_correct, continuation_total),
+        "new_thread": (new_correct, new_total),
+    }
+
+
+def evaluate(name, classifier, segments):
+    totals = {"messages": 0, "f1_weighted": 0.0, "fragmentation_sum": 0, "gold_threads": 0,
+              "continuation": [0, 0], "new_thread": [0, 0], "latency_ms": 0.0, "shortcuts": [0, 0]}
+    for segment in segments:
+        results, latency_ms, shortcuts = replay_segment(segment, classifier)
+        totals["shortcuts"][0] += shortcuts[0]
+        totals["shortcuts"][1] += shortcuts[1]
+        scores = score_segment(results)
+        totals["messages"] += scores["messages"]
+        totals["f1_weighted"] += scores["bcubed_f1"] * scores["messages"]
+        totals["fragmentation_sum"] += scores["fragmentation_sum"]
+        totals["gold_threads"] += scores["gold_threads"]
+        for metric in ("continuation", "new_thread"):
+            totals[metric][0] += scores[metric][0]
+            totals[metric][1] += scores[metric][1]
+        totals["latency_ms"] += latency_ms
+    recorded = classifier.inner if isinstance(classifier, CachedClassifier) else classifier
+    if isinstance(recorded, RecordedClassifier):
+        totals["latency_ms"] += recorded.remote_ms # What the live calls would have cost in wall time
+    messages = max(1, totals["messages"])
+    return {
+        "name": name,
+        "messages": totals["messages"],
+        "bcubed_f1": totals["f1_weighted"] / messages,
+        "fragmentation": totals["fragmentation_sum"] / max(1, totals["gold_threads"]),
+        "continuation_acc": totals["continuation"][0] / max(1, totals["continuation"][1]),
+        "new_thread_acc": totals["new_thread"][0] / max(1, totals["new_thread"][1]),
+        "calls": recorded.calls if isinstance(recorded, RecordedClassifier) else 0,
+        "unrecorded": recorded.unrecorded if isinstance(recorded, RecordedClassifier) else 0,
+        "cache_hits": classifier.hits if isinstance(classifier, CachedClassifier) else 0,
+        "ms_per_message": totals["latency_ms"] / messages,
+        "cost_usd": recorded.cost_usd if isinstance(recorded, RecordedClassifier) else 0.0,
+        "followup_shortcuts": totals["shortcuts"][0],
+        "followup_shortcuts_wrong": totals["shortcuts"][1],
+    }
+
+
+def print_table(rows):
+    header = (f"{'classifier':<16} {'msgs':>5} {'B3-F1':>6} {'frag':>5} {'cont':>5} {'new':>5} "
+              f"{'calls':>6} {'hits':>5} {'ms/msg':>8} {'cost $':>9} {'short':>5} {'wrong':>5}")
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['name']:<16} {row['messages']:>5} {row['bcubed_f1']:>6.3f} {row['fragmentation']:>5.2f} "
+              f"{row['continuation_acc']:>5.2f} {row['new_thread_acc']:>5.2f} {row['calls']:>6} "
+              f"{row['cache_hits']:>5} {row['ms_per_message']:>8.2f} {row['cost_usd']:>9.5f} "
+              f"{row['followup_shortcuts']:>5} {row['followup_shortcuts_wrong']:>5}")
+        if row["unrecorded"]:
+            print(f"{'':<16} {row['unrecorded']} requests had no recording and scored as 'general'; re-record.")
+    print("B3-F1: agreement with gold threads. frag: topics per gold thread (1.0 is ideal). "
+          "cont/new: continuation and new-thread accuracy.\n"
+          "short/wrong: short follow-ups kept on the last topic without a classifier call, and how many "
+          "of those actually started or belonged to another thread.")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare topic classifiers on annotated log segments.")
+    arg_parser.add_argument("--segments", required=True, help="Annotated segments (JSONL)")
+    arg_parser.add_argument("--recordings", default=None, help="Recorded live responses (JSON)")
+    arg_parser.add_argument("--record", metavar="PATH", help="Call the live model for unrecorded requests and save them here")
+    arg_parser.add_argument("--json", action="store_true", help="Print rows as JSON instead of a table")
+    args = arg_parser.parse_args()
+
+    eval_segments = load_segments(args.segments)
+    rows = [evaluate("local", local_classifier, eval_segments)]
+    recordings_path = args.record or args.recordings
+    if recordings_path:
+        live = RecordedClassifier(recordings_path, record=bool(args.record))
+        rows.append(evaluate("recorded-nano", live, eval_segments))
+        if args.record:
+            live.save()
+            print(f"## Saved {len(live.recordings)} recordings to {recordings_path}.")
+        rows.append(evaluate("cached-nano", CachedClassifier(RecordedClassifier(recordings_path)), eval_segments))
+    else:
+        print("## No --recordings given; only the local classifier is scored.")
+    if args.json:
+        print(json.dumps(rows, indent=1))
+    else:
+        print_table(rows)
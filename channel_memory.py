@@ -0,0 +1,252 @@
+###
+# Long-term channel memory: an on-disk SQLite FTS5 index of channel history.
+# Fed incrementally from WeeChat logs (prompt.generator.py) and from live traffic (wintermute.py).
+# Rows are keyed by server and channel, so shards on different networks can share one file.
+###
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import hashlib
+
+import weechat_log
+
+MEMORY_QUERY_BUDGET_MS = 5 # Searches that take longer than this are interrupted and return nothing
+MEMORY_COMMIT_EVERY = 50 # Live messages buffered before a commit
+MEMORY_COMMIT_INTERVAL_SECONDS = 30
+INGEST_BATCH_LINES = 5000
+
+QUERY_STOPWORDS = {
+    "remember", "when", "that", "time", "the", "and", "was", "were", "what", "who", "said", "about",
+    "you", "your", "did", "does", "with", "this", "there", "they", "have", "had", "last", "ago",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL DEFAULT '', -- IRC network; shards on several networks share one index
+    channel TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    nick TEXT NOT NULL,
+    message TEXT NOT NULL,
+    dedup_key INTEGER NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS history_server_channel_ts ON history(server, channel, ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    message, channel, server, content='history', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, message, channel, server) VALUES (new.id, new.message, new.channel, new.server);
+END;
+CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, message, channel, server)
+    VALUES ('delete', old.id, old.message, old.channel, old.server);
+END;
+CREATE TABLE IF NOT EXISTS ingest_state (
+    source TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+"""
+
+
+def _dedup_key(server, channel, ts, nick, message):
+    # The same line can arrive live and later from the WeeChat log with a slightly
+    # different clock, so the key only uses the minute.
+    raw = f"{server}\x1f{channel}\x1f{int(ts) // 60}\x1f{nick}\x1f{message}".encode('utf-8')
+    return int.from_bytes(hashlib.sha1(raw).digest()[:8], 'big', signed=True)
+
+
+def _phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+class ChannelMemoryIndex:
+    def __init__(self, db_path, server=""):
+        """server: the IRC network this process reads and writes; rows of other networks are never returned."""
+        self.db_path = db_path
+        self.server = server.lower()
+        self.available = False
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_commit_time = time.time()
+        try:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self._add_server_column()
+            rebuild = self._drop_outdated_fts()
+            self.conn.executescript(SCHEMA)
+            if rebuild:
+                with self.conn:
+                    self.conn.execute("INSERT INTO history_fts(history_fts) VALUES ('rebuild')")
+                print(f"## Channel memory: rebuilt the search index of {db_path} with channel and server columns.")
+            self.available = True
+        except sqlite3.Error as e:
+            # Most likely an SQLite build without FTS5; the bot keeps working without memory.
+            print(f"## Channel memory index unavailable ({db_path}): {e}")
+
+    def _add_server_column(self):
+        """Rows from before the server column were written by a single bot; they are given this index's server."""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(history)")]
+        if not columns or "server" in columns:
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE history ADD COLUMN server TEXT NOT NULL DEFAULT ''")
+            self.conn.execute("UPDATE history SET server = ?", (self.server,))
+            self.conn.execute("DROP INDEX IF EXISTS history_channel_ts")
+        print(f"## Channel memory: assigned existing history in {self.db_path} to server '{self.server}'.")
+
+    def _drop_outdated_fts(self):
+        """Indexes without the channel and server columns cannot filter by them; drops them for a rebuild."""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(history_fts)")]
+        if not columns or {"channel", "server"} <= set(columns):
+            return False
+        self.conn.executescript(
+            "DROP TRIGGER IF EXISTS history_ai; DROP TRIGGER IF EXISTS history_ad; DROP TABLE history_fts;")
+        return True
+
+    def add_message(self, channel, ts, nick, message):
+        """Buffers one live message; commits in batches to keep the reactor thread cheap."""
+        if not self.available or not message:
+            return
+        with self._lock:
+            self._pending.append((self.server, channel, int(ts), nick, message,
+                                  _dedup_key(self.server, channel, ts, nick, message)))
+            due = len(self._pending) >= MEMORY_COMMIT_EVERY or \
+                  time.time() - self._last_commit_time > MEMORY_COMMIT_INTERVAL_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        if not self.available:
+            return
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_commit_time = time.time()
+            if not rows:
+                return
+            try:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO history(server, channel, ts, nick, message, dedup_key) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                print(f"## Error writing to channel memory index: {e}")
+
+    def ingest_weechat_log(self, log_file_path, channel, server_names=(), skip_nicks=()):
+        """Indexes lines appended to a WeeChat log since the last call. Returns the number of new rows."""
+        if not self.available:
+            return 0
+        skip_nicks = {n.lower() for n in skip_nicks}
+        try:
+            stat = os.stat(log_file_path)
+        except OSError as e:
+            print(f"## Channel memory: cannot stat log {log_file_path}: {e}")
+            return 0
+        source = os.path.abspath(log_file_path)
+        with self._lock:
+            row = self.conn.execute("SELECT inode, offset FROM ingest_state WHERE source = ?", (source,)).fetchone()
+        offset = 0
+        if row and row[0] == stat.st_ino and row[1] <= stat.st_size:
+            offset = row[1] # Same file, not truncated: resume where we stopped
+        if offset == stat.st_size:
+            return 0
+
+        inserted = 0
+        batch = []
+        with open(log_file_path, 'rb') as f:
+            f.seek(offset)
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    break # Partial line still being written; pick it up next time
+                offset += len(raw_line)
+                record = weechat_log.parse_line(raw_line.decode('utf-8', errors='replace'), server_names)
+                if record and record.kind in weechat_log.CHAT_KINDS and record.nick.lower() not in skip_nicks:
+                    ts, nick, message = int(record.ts), record.nick, record.message
+                    batch.append((self.server, channel, ts, nick, message, _dedup_key(self.server, channel, ts, nick, message)))
+                if len(batch) >= INGEST_BATCH_LINES:
+                    inserted += self._write_ingest_batch(batch, source, stat.st_ino, offset)
+                    batch = []
+        inserted += self._write_ingest_batch(batch, source, stat.st_ino, offset)
+        print(f"## Channel memory: indexed {inserted} new messages from {log_file_path}.")
+        return inserted
+
+    def _write_ingest_batch(self, batch, source, inode, offset):
+        with self._lock:
+            with self.conn:
+                inserted = self.conn.executemany(
+                    "INSERT OR IGNORE INTO history(server, channel, ts, nick, message, dedup_key) VALUES (?, ?, ?, ?, ?, ?)", batch).rowcount
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ingest_state(source, inode, offset) VALUES (?, ?, ?)", (source, inode, offset))
+        return inserted
+
+    @staticmethod
+    def build_match_queries(text, max_terms=8):
+        """Returns FTS5 queries to try in order: all terms first (cheap, precise), then any term."""
+        words = {w for w in re.findall(r"[a-z0-9]+", text.lower()) if len(w) > 2 and w not in QUERY_STOPWORDS}
+        terms = [f'"{w}"' for w in sorted(words, key=len, reverse=True)[:max_terms]]
+        if len(terms) <= 1:
+            return terms
+        return [" AND ".join(terms), " OR ".join(terms)]
+
+    def scope_match_query(self, channel, match_query):
+        """Restricts a query to the message column of one server and channel, so FTS ranks only their rows."""
+        # Names without any word characters have nothing to match; the exact check in the join still applies
+        filters = [f"{column} : {_phrase(value)}" for column, value in (("server", self.server), ("channel", channel))
+                   if re.search(r"\w", value)]
+        return " AND ".join(filters + [f"message : ({match_query})"])
+
+    def search(self, channel, text, limit=3, before_ts=None, budget_ms=MEMORY_QUERY_BUDGET_MS):
+        """
+        Returns up to `limit` past exchanges as lists of (ts, nick, message), best match first.
+        Each exchange is the matching line with its neighbours. Gives up after `budget_ms`.
+        """
+        if not self.available:
+            return []
+        match_queries = self.build_match_queries(text)
+        if not match_queries:
+            return []
+        before_ts = int(before_ts if before_ts is not None else time.time())
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        with self._lock:
+            self.conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, 1000)
+            try:
+                hits = []
+                for match_query in match_queries:
+                    # Rank inside FTS so SQLite uses its top-k path. Server and channel are already matched there, so
+                    # a busy channel cannot fill the candidates; the join re-checks them exactly and applies the time.
+                    hits = self.conn.execute(
+                        "SELECT h.id, h.ts, h.nick, h.message FROM "
+                        "(SELECT rowid, rank FROM history_fts WHERE history_fts MATCH ? ORDER BY rank LIMIT ?) AS m "
+                        "JOIN history h ON h.id = m.rowid "
+                        "WHERE h.server = ? AND h.channel = ? AND h.ts < ? ORDER BY m.rank LIMIT ?",
+                        (self.scope_match_query(channel, match_query), limit * 20, self.server, channel, before_ts,
+                         limit)).fetchall()
+                    if hits:
+                        break
+                exchanges = []
+                for hit_id, ts, nick, message in hits:
+                    before = self.conn.execute(
+                        "SELECT ts, nick, message FROM history WHERE server = ? AND channel = ? AND ts <= ? AND id < ? "
+                        "ORDER BY ts DESC LIMIT 1", (self.server, channel, ts, hit_id)).fetchall()
+                    after = self.conn.execute(
+                        "SELECT ts, nick, message FROM history WHERE server = ? AND channel = ? AND ts >= ? AND id > ? "
+                        "ORDER BY ts LIMIT 1", (self.server, channel, ts, hit_id)).fetchall()
+                    exchanges.append(before + [(ts, nick, message)] + after)
+                return exchanges
+            except sqlite3.OperationalError as e:
+                if "interrupted" in str(e):
+                    print(f"## Channel memory search exceeded {budget_ms} ms budget; skipping.")
+                else:
+                    print(f"## Channel memory search failed: {e}")
+                return []
+            finally:
+                self.conn.set_progress_handler(None, 0)
+
+    def close(self):
+        if self.available:
+            self.flush()
+            self.conn.close()
+            self.available = False
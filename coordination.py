@@ -0,0 +1,144 @@
+###
+# Shared state for bot workers started by supervisor.py: one SQLite (WAL) file holding
+# per-shard heartbeats, the ignore list, token buckets for the shared LLM rate budget
+# and daily model usage.
+# Every call is a short transaction, so workers on any number of cores can use it at once.
+###
+
+import time
+import sqlite3
+import threading
+
+DEFAULT_DB_PATH = "./coordination.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS heartbeats (
+    shard TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    status TEXT NOT NULL,
+    channels TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS ignored_users (
+    nick TEXT PRIMARY KEY, -- lowercase
+    added_by TEXT,
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_usage (
+    day TEXT PRIMARY KEY, -- local date, YYYY-MM-DD
+    tokens INTEGER NOT NULL,
+    usd REAL NOT NULL
+);
+"""
+
+
+class Coordinator:
+    def __init__(self, db_path=DEFAULT_DB_PATH, shard_name=None):
+        self.db_path = db_path
+        self.shard_name = shard_name
+        self._lock = threading.Lock()
+        # Autocommit mode so the token bucket can take an explicit write lock (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    # --- Shard health ---
+    def heartbeat(self, pid, status="ok", channels=()):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO heartbeats(shard, pid, ts, status, channels) VALUES (?, ?, ?, ?, ?)",
+                (self.shard_name, pid, time.time(), status, ",".join(channels)))
+
+    def shard_health(self):
+        """Returns {shard: {"pid", "age_seconds", "status", "channels"}}."""
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute("SELECT shard, pid, ts, status, channels FROM heartbeats").fetchall()
+        return {shard: {"pid": pid, "age_seconds": now - ts, "status": status, "channels": channels}
+                for shard, pid, ts, status, channels in rows}
+
+    def clear_heartbeat(self, shard):
+        with self._lock:
+            self.conn.execute("DELETE FROM heartbeats WHERE shard = ?", (shard,))
+
+    # --- Ignore list ---
+    def ignored_users(self):
+        with self._lock:
+            return {row[0] for row in self.conn.execute("SELECT nick FROM ignored_users")}
+
+    def add_ignored(self, nick, added_by=None):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO ignored_users(nick, added_by, ts) VALUES (?, ?, ?)",
+                              (nick.lower(), added_by, time.time()))
+
+    def remove_ignored(self, nick):
+        with self._lock:
+            self.conn.execute("DELETE FROM ignored_users WHERE nick = ?", (nick.lower(),))
+
+    def import_ignored(self, nicks):
+        """Seeds the shared list from a legacy ignore_list.json, only if the shared list is empty."""
+        with self._lock:
+            if self.conn.execute("SELECT 1 FROM ignored_users LIMIT 1").fetchone():
+                return 0
+            now = time.time()
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT OR IGNORE INTO ignored_users(nick, added_by, ts) VALUES (?, 'import', ?)",
+                                  [(n.lower(), now) for n in nicks])
+            self.conn.execute("COMMIT")
+            return len(nicks)
+
+    # --- Shared rate budget ---
+    def try_acquire(self, bucket, rate_per_second, capacity, cost=1.0):
+        """
+        Takes `cost` tokens from a bucket shared by all workers. Returns False when the bucket is empty.
+        Fails open (returns True) if the database is unavailable, so a coordination
+        problem never silences every shard at once.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute("SELECT tokens, updated FROM rate_buckets WHERE name = ?", (bucket,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate_per_second)
+                granted = tokens >= cost
+                if granted:
+                    tokens -= cost
+                self.conn.execute("INSERT OR REPLACE INTO rate_buckets(name, tokens, updated) VALUES (?, ?, ?)",
+                                  (bucket, tokens, now))
+                self.conn.execute("COMMIT")
+                return granted
+            except sqlite3.Error as e:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                print(f"## Coordination: rate bucket '{bucket}' unavailable ({e}); allowing request.")
+                return True
+
+    def add_usage(self, day, tokens, usd):
+        """
+        Adds to the day's model usage across all shards and returns the (tokens, usd) totals,
+        or None if the database is unavailable (the caller keeps its own running totals).
+        """
+        with self._lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self.conn.execute(
+                    "INSERT INTO daily_usage(day, tokens, usd) VALUES (?, ?, ?) "
+                    "ON CONFLICT(day) DO UPDATE SET tokens = tokens + excluded.tokens, usd = usd + excluded.usd",
+                    (day, tokens, usd))
+                row = self.conn.execute("SELECT tokens, usd FROM daily_usage WHERE day = ?", (day,)).fetchone()
+                self.conn.execute("COMMIT")
+                return row[0], row[1]
+            except sqlite3.Error as e:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                print(f"## Coordination: usage for {day} not recorded ({e}).")
+                return None
+
+    def close(self):
+        self.conn.close()
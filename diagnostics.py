@@ -0,0 +1,256 @@
+###
+# On-demand diagnostics for the live bot, written as text files under DIAGNOSTICS_DIR:
+# - A sampling CPU profiler. A daemon thread reads sys._current_frames() PROFILE_SAMPLE_HZ times
+#   a second and counts stacks for every thread (reactor, directive watcher, workers). Output is
+#   a top-functions report plus a .folded file for flamegraph.pl / speedscope.
+# - tracemalloc snapshots. Each one is diffed against the previous one and comes with the deep
+#   size of each registered bot structure (topic_threads, caches, ...).
+# - Per-stage timings of handle_message, and a report of the slowest recent calls.
+# While nothing is started, the timing hooks only check one attribute and return. The profiler
+# and tracemalloc do not exist until they are started.
+###
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter, deque
+
+DIAGNOSTICS_DIR = "./diagnostics"
+PROFILE_SAMPLE_HZ = 100
+PROFILE_MAX_SECONDS = 10 * 60 # A forgotten profiler stops itself
+PROFILE_TOP_FUNCTIONS = 40
+TRACEMALLOC_FRAMES = 10
+MEMORY_TOP_DIFFS = 30
+SLOW_TRACE_HISTORY = 500 # Recent handle_message timings kept while timing is on
+SLOW_REPORT_COUNT = 20
+DEEP_SIZE_MAX_OBJECTS = 500000 # Bounds the walk over very large structures
+
+
+def _timestamp():
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def deep_size(obj, max_objects=DEEP_SIZE_MAX_OBJECTS):
+    """Approximate bytes held by `obj` and everything it contains. Returns (bytes, objects, complete)."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        if len(seen) >= max_objects:
+            return total, len(seen), False
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item) # Other objects are counted shallowly, so a callback cannot pull in the whole bot
+    return total, len(seen), True
+
+
+class SamplingProfiler(threading.Thread):
+    """Counts the stacks of all other threads at a fixed rate until stopped."""
+
+    def __init__(self, hz=PROFILE_SAMPLE_HZ, max_seconds=PROFILE_MAX_SECONDS):
+        super().__init__(daemon=True, name="diagnostics-profiler")
+        self.interval = 1.0 / hz
+        self.max_seconds = max_seconds
+        self.stacks = Counter() # (thread name, frames root-first) -> samples
+        self.samples = 0
+        self.started_at = time.time()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval):
+            if time.monotonic() > deadline:
+                print(f"## Diagnostics: profiler reached {self.max_seconds}s and stopped sampling.")
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.reverse()
+                self.stacks[(names.get(ident, str(ident)), tuple(frames))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2)
+
+    def write_reports(self, directory):
+        """Writes a .folded stack file and a top-functions report; returns the report path."""
+        stamp = _timestamp()
+        folded_path = os.path.join(directory, f"profile-{stamp}.folded")
+        report_path = os.path.join(directory, f"profile-{stamp}.txt")
+        own, inclusive = Counter(), Counter()
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for (thread_name, frames), count in self.stacks.most_common():
+                f.write(f"{';'.join((thread_name,) + frames)} {count}\n")
+                if frames:
+                    own[(thread_name, frames[-1])] += count
+                for func in set(frames):
+                    inclusive[(thread_name, func)] += count
+        duration = time.time() - self.started_at
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(f"Sampling profile: {self.samples} samples over {duration:.1f}s "
+                    f"({1 / self.interval:.0f} Hz). Percentages are of samples per thread.\n")
+            for title, counter in (("Self time", own), ("Inclusive time", inclusive)):
+                f.write(f"\n{title}:\n")
+                for (thread_name, func), count in counter.most_common(PROFILE_TOP_FUNCTIONS):
+                    f.write(f"{count / max(1, self.samples):7.1%}  {count:7d}  [{thread_name}] {func}\n")
+        return report_path
+
+
+class Diagnostics:
+    def __init__(self, directory=DIAGNOSTICS_DIR):
+        self.directory = directory
+        self.structures = {} # name -> zero-argument callable returning the object to measure
+        self.profiler = None
+        self.timing = False # Checked first by every timing hook
+        self.traces = deque(maxlen=SLOW_TRACE_HISTORY)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.previous_snapshot = None
+        self.previous_sizes = {}
+
+    def register_structure(self, name, getter):
+        self.structures[name] = getter
+
+    def _output_dir(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return self.directory
+
+    # --- CPU profile + stage timing ---
+    def start(self):
+        """Starts the sampling profiler and handle_message stage timing. Returns a status line."""
+        with self._lock:
+            if self.profiler is not None and self.profiler.is_alive():
+                return "Diagnostics already running."
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+            self.traces.clear()
+            self.timing = True
+        return f"Diagnostics started: sampling profiler at {PROFILE_SAMPLE_HZ} Hz and handle_message timing."
+
+    def stop(self):
+        """Stops profiling and timing and writes their reports. Returns a status line."""
+        with self._lock:
+            profiler, self.profiler = self.profiler, None
+            self.timing = False
+        if profiler is None:
+            return "Diagnostics are not running."
+        profiler.stop()
+        directory = self._output_dir()
+        profile_path = profiler.write_reports(directory)
+        slow_path = self.write_slow_report()
+        return f"Diagnostics stopped: {profiler.samples} samples in {profile_path}, slowest messages in {slow_path}."
+
+    def toggle(self):
+        return self.stop() if self.timing else self.start()
+
+    def begin(self, channel, nick, text):
+        """Starts timing one message on this thread (no-op unless started)."""
+        if not self.timing:
+            return
+        now = time.perf_counter()
+        self._local.trace = {"label": f"{channel} <{nick}> {text[:80]}", "started": now, "last": now,
+                             "stages": [], "wall": time.time()}
+
+    def stage(self, name):
+        """Closes the current stage of this thread's trace under `name`."""
+        if not self.timing:
+            return
+        trace = getattr(self._local, "trace", None)
+        if trace is None:
+            return
+        now = time.perf_counter()
+        trace["stages"].append((name, (now - trace["last"]) * 1000))
+        trace["last"] = now
+
+    def end(self):
+        if not self.timing:
+            return
+        trace = getattr(self._local, "trace", None)
+        if trace is None:
+            return
+        self._local.trace = None
+        now = time.perf_counter()
+        if now - trace["last"] > 0.0005:
+            trace["stages"].append(("rest", (now - trace["last"]) * 1000))
+        trace["total_ms"] = (now - trace["started"]) * 1000
+        with self._lock:
+            self.traces.append(trace)
+
+    def write_slow_report(self):
+        with self._lock:
+            traces = sorted(self.traces, key=lambda t: t["total_ms"], reverse=True)
+        path = os.path.join(self._output_dir(), f"slow-messages-{_timestamp()}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"Slowest {min(SLOW_REPORT_COUNT, len(traces))} of {len(traces)} timed handle_message calls:\n")
+            for trace in traces[:SLOW_REPORT_COUNT]:
+                when = time.strftime("%H:%M:%S", time.localtime(trace["wall"]))
+                stages = ", ".join(f"{name} {ms:.1f}" for name, ms in trace["stages"])
+                f.write(f"{trace['total_ms']:9.1f} ms  {when}  {trace['label']}\n{'':13}{stages}\n")
+        return path
+
+    # --- Memory ---
+    def memory_snapshot(self):
+        """Takes a tracemalloc snapshot, diffs it with the previous one, sizes the registered structures."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.previous_snapshot = None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        sizes = {}
+        for name, getter in self.structures.items():
+            try:
+                sizes[name] = deep_size(getter())
+            except Exception as e: # A structure mid-rebuild must not break the report
+                print(f"## Diagnostics: could not size {name}: {e}")
+        current, peak = tracemalloc.get_traced_memory()
+        path = os.path.join(self._output_dir(), f"memory-{_timestamp()}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"tracemalloc: {current / 1e6:.2f} MB traced, peak {peak / 1e6:.2f} MB\n\nBot structures:\n")
+            for name, (size, objects, complete) in sorted(sizes.items(), key=lambda item: -item[1][0]):
+                previous = self.previous_sizes.get(name)
+                change = f" ({(size - previous[0]) / 1e3:+.1f} kB)" if previous else ""
+                partial = "" if complete else " (stopped early: lower bound)"
+                f.write(f"{size / 1e3:12.1f} kB {objects:9d} objects  {name}{change}{partial}\n")
+            if self.previous_snapshot is None:
+                f.write("\nFirst snapshot since tracing started; largest allocation sites:\n")
+                for stat in snapshot.statistics("lineno")[:MEMORY_TOP_DIFFS]:
+                    f.write(f"{stat}\n")
+            else:
+                f.write("\nGrowth since previous snapshot:\n")
+                for stat in snapshot.compare_to(self.previous_snapshot, "lineno")[:MEMORY_TOP_DIFFS]:
+                    f.write(f"{stat}\n")
+        self.previous_snapshot = snapshot
+        self.previous_sizes = sizes
+        return f"Memory snapshot: {current / 1e6:.2f} MB traced, {len(sizes)} structures, written to {path}."
+
+    def stop_memory(self):
+        if not tracemalloc.is_tracing():
+            return "tracemalloc is not running."
+        tracemalloc.stop()
+        self.previous_snapshot = None
+        return "tracemalloc stopped."
+
+    def status(self):
+        profiling = self.profiler is not None and self.profiler.is_alive()
+        return (f"Diagnostics: profiler {'on (' + str(self.profiler.samples) + ' samples)' if profiling else 'off'}, "
+                f"timing {'on (' + str(len(self.traces)) + ' messages)' if self.timing else 'off'}, "
+                f"tracemalloc {'on' if tracemalloc.is_tracing() else 'off'}; output in {os.path.abspath(self.directory)}.")
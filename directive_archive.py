@@ -0,0 +1,158 @@
+###
+# Append-only archive of generated directives and their analyses (SQLite).
+# Replaces one pretty-printed directive_*.json file per run in directive_archive/.
+#
+#   python directive_archive.py migrate [--archive-dir DIR] [--db PATH] [--delete-json]
+#   python directive_archive.py prune [--db PATH]
+###
+
+import os
+import re
+import json
+import zlib
+import sqlite3
+import argparse
+import datetime
+
+DEFAULT_DB_PATH = "./directive_archive.sqlite3"
+DEFAULT_JSON_ARCHIVE_DIR = "./directive_archive"
+ARCHIVE_FULL_RESOLUTION_DAYS = 14 # Older entries are downsampled to the last run of each UTC day
+ARCHIVE_MAX_AGE_DAYS = 365 # Entries older than this are deleted (None keeps everything)
+
+LEGACY_FILE_PATTERN = re.compile(r"^directive_(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})\.json$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ts TEXT PRIMARY KEY, -- normalized UTC ISO-8601, so text order is time order
+    directive TEXT NOT NULL,
+    analysis BLOB NOT NULL, -- zlib-compressed JSON
+    kept INTEGER NOT NULL DEFAULT 0 -- 1: run skipped regeneration; directive carried over, analysis new
+) WITHOUT ROWID;
+"""
+
+
+def normalize_timestamp(value):
+    """Returns a fixed-width UTC ISO timestamp for a datetime or ISO string."""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).isoformat(timespec='microseconds')
+
+
+class DirectiveArchive:
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+        if "kept" not in columns: # Archives from before skipped runs were archived
+            with self.conn:
+                self.conn.execute("ALTER TABLE entries ADD COLUMN kept INTEGER NOT NULL DEFAULT 0")
+
+    @staticmethod
+    def _row_to_entry(row):
+        ts, directive, analysis_blob, kept = row
+        return {
+            "generation_timestamp_utc": ts,
+            "generated_directive": directive,
+            "analysis_summary": json.loads(zlib.decompress(analysis_blob).decode('utf-8')),
+            "kept": bool(kept),
+        }
+
+    def append(self, generation_timestamp_utc, directive, analysis, kept=False):
+        """kept=True archives the analysis of a run that kept the existing directive."""
+        blob = zlib.compress(json.dumps(analysis, separators=(',', ':')).encode('utf-8'), 9)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO entries(ts, directive, analysis, kept) VALUES (?, ?, ?, ?)",
+                              (normalize_timestamp(generation_timestamp_utc), directive, blob, int(kept)))
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone() is None
+
+    def latest(self, include_kept=True):
+        """Newest entry (a primary-key seek), or None. include_kept=False returns the newest regeneration."""
+        row = self.conn.execute(
+            "SELECT ts, directive, analysis, kept FROM entries WHERE kept <= ? ORDER BY ts DESC LIMIT 1",
+            (int(include_kept),)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def range(self, start=None, end=None):
+        """Yields entries with start <= timestamp < end, oldest first."""
+        start = normalize_timestamp(start) if start is not None else ""
+        end = normalize_timestamp(end) if end is not None else "~"
+        cursor = self.conn.execute(
+            "SELECT ts, directive, analysis, kept FROM entries WHERE ts >= ? AND ts < ? ORDER BY ts", (start, end))
+        for row in cursor:
+            yield self._row_to_entry(row)
+
+    def latest_per_day(self, since=None):
+        """Returns {"YYYY-MM-DD": entry} using the last entry of each UTC day."""
+        since = normalize_timestamp(since) if since is not None else ""
+        rows = self.conn.execute(
+            "SELECT e.ts, e.directive, e.analysis, e.kept FROM entries e "
+            "JOIN (SELECT MAX(ts) AS ts FROM entries WHERE ts >= ? GROUP BY substr(ts, 1, 10)) d ON d.ts = e.ts "
+            "ORDER BY e.ts", (since,)).fetchall()
+        return {row[0][:10]: self._row_to_entry(row) for row in rows}
+
+    def apply_retention(self, full_resolution_days=ARCHIVE_FULL_RESOLUTION_DAYS, max_age_days=ARCHIVE_MAX_AGE_DAYS):
+        """Downsamples old entries to one per day and drops expired ones. Returns (downsampled, deleted)."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        downsample_before = normalize_timestamp(now - datetime.timedelta(days=full_resolution_days))
+        with self.conn:
+            downsampled = self.conn.execute(
+                "DELETE FROM entries WHERE ts < ? AND ts NOT IN "
+                "(SELECT MAX(ts) FROM entries WHERE ts < ? GROUP BY substr(ts, 1, 10))",
+                (downsample_before, downsample_before)).rowcount
+            deleted = 0
+            if max_age_days is not None:
+                expire_before = normalize_timestamp(now - datetime.timedelta(days=max_age_days))
+                deleted = self.conn.execute("DELETE FROM entries WHERE ts < ?", (expire_before,)).rowcount
+        return downsampled, deleted
+
+    def migrate_json_directory(self, archive_dir=DEFAULT_JSON_ARCHIVE_DIR, delete_json=False):
+        """Imports legacy directive_*.json files. Safe to re-run. Returns the number imported."""
+        if not os.path.isdir(archive_dir):
+            return 0
+        imported = 0
+        for file_name in sorted(os.listdir(archive_dir)):
+            match = LEGACY_FILE_PATTERN.match(file_name)
+            if not match:
+                continue
+            file_path = os.path.join(archive_dir, file_name)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"WARNING: Skipping unreadable archive file {file_name}: {e}")
+                continue
+            # Older files may lack the timestamp field; the file name carries it too
+            timestamp = content.get("generation_timestamp_utc") or \
+                "{}T{}:{}:{}+00:00".format(*match.groups())
+            self.append(timestamp, content.get("generated_directive", ""), content.get("analysis_summary") or {})
+            imported += 1
+            if delete_json:
+                os.remove(file_path)
+        print(f"## Migrated {imported} archive files from {archive_dir} into {self.db_path}.")
+        return imported
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Maintain the directive archive.")
+    arg_parser.add_argument("command", choices=["migrate", "prune"])
+    arg_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    arg_parser.add_argument("--archive-dir", default=DEFAULT_JSON_ARCHIVE_DIR, help="Legacy directive_*.json directory")
+    arg_parser.add_argument("--delete-json", action="store_true", help="Remove legacy files after importing them")
+    args = arg_parser.parse_args()
+
+    archive = DirectiveArchive(args.db)
+    if args.command == "migrate":
+        archive.migrate_json_directory(args.archive_dir, delete_json=args.delete_json)
+    else:
+        downsampled, deleted = archive.apply_retention()
+        print(f"## Retention: downsampled {downsampled} entries, deleted {deleted} expired entries.")
+    archive.close()
@@ -0,0 +1,236 @@
+###
+# Admission control in front of every model call the bot makes.
+# - Token buckets per provider (shared across shards via coordination.py when supervised),
+#   per channel and per nick.
+# - Weighted fair queueing of deferred replies between channels, so one busy channel
+#   cannot starve the others once limits are hit.
+# - A daily token/spend budget. Callers degrade instead of calling when refused.
+###
+
+import time
+import datetime
+import threading
+from collections import defaultdict, deque
+
+PROVIDER_LIMITS = {"openai": (60, 20), "anthropic": (30, 10)} # (calls per minute, burst)
+CHANNEL_LIMIT = (10, 5) # Model-backed messages per minute and burst, per channel
+NICK_LIMIT = (4, 3) # Per nick, across channels
+CHANNEL_WEIGHTS = {} # channel -> share of deferred-reply capacity (default 1.0)
+DEFERRED_QUEUE_MAX_PER_CHANNEL = 5
+DEFERRED_MAX_WAIT_SECONDS = 2 * 60 # Older deferred replies are dropped; the conversation has moved on
+DAILY_TOKEN_BUDGET = 2000000
+DAILY_SPEND_BUDGET_USD = 5.00
+BUDGET_DEGRADE_FRACTION = 0.8 # Past this share of either budget, degrade before calling
+MODEL_PRICES_PER_MTOK = { # (input, output) USD per million tokens
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "claude-sonnet-4-20250514": (3.00, 15.00),
+}
+DEFAULT_PRICE_PER_MTOK = (3.00, 15.00) # Unknown models are priced conservatively
+WAIT_TIME_SAMPLES = 500
+
+BUDGET_OK = "ok"
+BUDGET_TIGHT = "tight"
+BUDGET_EXHAUSTED = "exhausted"
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, per_minute, capacity):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def available(self, cost=1.0):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= cost
+
+    def take(self, cost=1.0):
+        if not self.available(cost):
+            return False
+        self.tokens -= cost
+        return True
+
+    def is_full(self):
+        return self.available(self.capacity)
+
+
+class LLMScheduler:
+    def __init__(self, coordinator=None):
+        self.coordinator = coordinator
+        self._lock = threading.RLock()
+        self.provider_buckets = {provider: TokenBucket(*limit) for provider, limit in PROVIDER_LIMITS.items()}
+        self.channel_buckets = {}
+        self.nick_buckets = {}
+        self.queues = defaultdict(deque) # channel -> deferred items, FIFO within a channel
+        self.last_finish_tag = {} # channel -> WFQ finish tag of its newest queued item
+        self.virtual_time = 0.0
+        self.usage_day = None
+        self.tokens_today = 0
+        self.spend_today = 0.0
+        self.wait_times = deque(maxlen=WAIT_TIME_SAMPLES)
+        self.counters = defaultdict(int)
+
+    def _channel_bucket(self, channel):
+        bucket = self.channel_buckets.get(channel)
+        if bucket is None:
+            bucket = self.channel_buckets[channel] = TokenBucket(*CHANNEL_LIMIT)
+        return bucket
+
+    def _nick_bucket(self, nick):
+        key = nick.lower()
+        bucket = self.nick_buckets.get(key)
+        if bucket is None:
+            bucket = self.nick_buckets[key] = TokenBucket(*NICK_LIMIT)
+        return bucket
+
+    # --- Admission ---
+    def admit_message(self, channel, nick):
+        """Takes one message's worth from the channel and nick buckets, or neither."""
+        with self._lock:
+            channel_bucket, nick_bucket = self._channel_bucket(channel), self._nick_bucket(nick)
+            if channel_bucket.available() and nick_bucket.available():
+                channel_bucket.take()
+                nick_bucket.take()
+                self.counters["admitted"] += 1
+                return True
+            self.counters["rate_limited"] += 1
+            return False
+
+    def acquire_provider(self, provider):
+        """One call's worth of the provider's rate limit; shared by all shards when coordinated."""
+        per_minute, burst = PROVIDER_LIMITS.get(provider, (60, 10))
+        if self.coordinator:
+            granted = self.coordinator.try_acquire(f"provider:{provider}", per_minute / 60.0, burst)
+        else:
+            with self._lock:
+                bucket = self.provider_buckets.setdefault(provider, TokenBucket(per_minute, burst))
+                granted = bucket.take()
+        with self._lock:
+            self.counters[f"{provider}_calls" if granted else f"{provider}_limited"] += 1
+        return granted
+
+    # --- Daily budget ---
+    def _roll_day(self):
+        today = datetime.date.today().isoformat()
+        if self.usage_day != today:
+            self.usage_day, self.tokens_today, self.spend_today = today, 0, 0.0
+            if self.coordinator:
+                totals = self.coordinator.add_usage(today, 0, 0.0)
+                if totals is not None:
+                    self.tokens_today, self.spend_today = totals
+
+    def record_usage(self, model, input_tokens, output_tokens):
+        input_price, output_price = MODEL_PRICES_PER_MTOK.get(model, DEFAULT_PRICE_PER_MTOK)
+        cost = (input_tokens * input_price + output_tokens * output_price) / 1000000
+        tokens = input_tokens + output_tokens
+        with self._lock:
+            self._roll_day()
+            totals = self.coordinator.add_usage(self.usage_day, tokens, cost) if self.coordinator else None
+            if totals is not None:
+                # Shared totals include other shards' usage, so they only ever move our view forward
+                self.tokens_today = max(self.tokens_today + tokens, totals[0])
+                self.spend_today = max(self.spend_today + cost, totals[1])
+            else: # Standalone, or the shared DB is busy: never lose what we already counted
+                self.tokens_today += tokens
+                self.spend_today += cost
+
+    def budget_state(self):
+        with self._lock:
+            self._roll_day()
+            used = max(self.tokens_today / DAILY_TOKEN_BUDGET, self.spend_today / DAILY_SPEND_BUDGET_USD)
+        if used >= 1.0:
+            return BUDGET_EXHAUSTED
+        return BUDGET_TIGHT if used >= BUDGET_DEGRADE_FRACTION else BUDGET_OK
+
+    def note_degraded(self, kind):
+        with self._lock:
+            self.counters[f"degraded_{kind}"] += 1
+
+    # --- Deferred replies (weighted fair queueing between channels) ---
+    def defer(self, channel, nick, callback):
+        """Queues `callback` to run when the channel and nick buckets allow. Returns False if dropped."""
+        with self._lock:
+            queue = self.queues[channel]
+            if len(queue) >= DEFERRED_QUEUE_MAX_PER_CHANNEL:
+                self.counters["dropped"] += 1
+                return False
+            start_tag = max(self.virtual_time, self.last_finish_tag.get(channel, 0.0))
+            finish_tag = start_tag + 1.0 / CHANNEL_WEIGHTS.get(channel, 1.0)
+            self.last_finish_tag[channel] = finish_tag
+            queue.append({"finish_tag": finish_tag, "nick": nick, "callback": callback,
+                          "enqueued": time.monotonic()})
+            self.counters["deferred"] += 1
+            return True
+
+    def _next_runnable(self):
+        """Pops the queued item with the lowest finish tag whose buckets have room."""
+        now = time.monotonic()
+        best_channel = None
+        for channel, queue in self.queues.items():
+            while queue and now - queue[0]["enqueued"] > DEFERRED_MAX_WAIT_SECONDS:
+                queue.popleft()
+                self.counters["expired"] += 1
+            if not queue:
+                continue
+            head = queue[0]
+            if best_channel is not None and head["finish_tag"] >= self.queues[best_channel][0]["finish_tag"]:
+                continue
+            if self._channel_bucket(channel).available() and self._nick_bucket(head["nick"]).available():
+                best_channel = channel
+        if best_channel is None:
+            return None
+        item = self.queues[best_channel].popleft()
+        self._channel_bucket(best_channel).take()
+        self._nick_bucket(item["nick"]).take()
+        self.virtual_time = item["finish_tag"]
+        self.wait_times.append(now - item["enqueued"])
+        return item
+
+    def drain(self):
+        """Runs every deferred reply that is allowed now. Call periodically from the reactor."""
+        ran = 0
+        while True:
+            # Checked per item: a backlog queued before the cap, or the replies it runs, must not spend past it
+            if self.budget_state() == BUDGET_EXHAUSTED:
+                with self._lock:
+                    self.counters["budget_dropped"] += sum(len(queue) for queue in self.queues.values())
+                    self.queues.clear()
+                    self.last_finish_tag.clear()
+                return ran
+            with self._lock:
+                item = self._next_runnable()
+                if item is None:
+                    self._prune()
+                    return ran
+            item["callback"]() # Outside the lock: this makes model calls
+            ran += 1
+
+    def _prune(self):
+        # Full buckets carry no state, so idle channels and nicks do not accumulate
+        for buckets in (self.channel_buckets, self.nick_buckets):
+            for key in [k for k, bucket in buckets.items() if bucket.is_full()]:
+                del buckets[key]
+        for channel in [c for c, queue in self.queues.items() if not queue]:
+            del self.queues[channel]
+            self.last_finish_tag.pop(channel, None)
+
+    # --- Metrics ---
+    def stats(self):
+        with self._lock:
+            self._roll_day()
+            waits = sorted(self.wait_times)
+            return {
+                "counters": dict(self.counters),
+                "queued": sum(len(queue) for queue in self.queues.values()),
+                "wait_count": len(waits),
+                "wait_mean_s": (sum(waits) / len(waits)) if waits else 0.0,
+                "wait_p95_s": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "tokens_today": self.tokens_today,
+                "spend_today_usd": self.spend_today,
+                "budget": self.budget_state(),
+            }
@@ -0,0 +1,146 @@
+###
+# Decides whether a channel message is addressed to the bot. Built once at startup:
+# - A message is split into nick-shaped tokens in one regex pass and each token is looked up in
+#   one alias table (global and per-channel aliases together), so the cost does not grow with
+#   the number of aliases or channels. With only a few aliases, a substring prefilter rejects
+#   most messages before tokenising.
+# - Matches must stand alone as an IRC nick: "wintermutes" and "wintermute_bot" do not count,
+#   "wintermute's" and "@wintermute" do.
+# - URLs are ignored, and so are known bots and relayed or pasted log lines ("<nick> text").
+# - Channel policy: "all" (address or mention), "direct" (only "alias: ..." / "alias, ...") or "off".
+###
+
+import re
+import threading
+from collections import defaultdict
+
+POLICY_ALL = "all"
+POLICY_DIRECT = "direct"
+POLICY_OFF = "off"
+POLICIES = (POLICY_ALL, POLICY_DIRECT, POLICY_OFF)
+
+DIRECT = "direct"
+MENTION = "mention"
+
+PREFILTER_MAX_ALIASES = 8 # Up to this many, `alias in text` checks are cheaper than tokenising
+NICK_TOKEN_PATTERN = re.compile(r"[\w\[\]\\`^{}|-]+") # RFC 2812 nick characters
+DIRECT_PATTERN = re.compile(r"^\s*@?([\w\[\]\\`^{}|-]+)\s*[:,]\s*")
+URL_PATTERN = re.compile(r"(?:[a-z][a-z0-9+.-]*://|www\.)\S+")
+# Relay bridges and pasted logs: "<alice> ...", "[discord] <alice> ...", "[12:01] <alice> ...", "12:01 <alice> ..."
+RELAY_PATTERN = re.compile(r"^\s*(?:\[[^\]]{1,32}\]\s*|\d{1,2}:\d{2}(?::\d{2})?\s+)*<[~&@%+ ]?[^>\s]{1,32}>\s")
+
+
+class MentionDetector:
+    def __init__(self, nickname, aliases=(), channel_aliases=None, channel_policies=None, known_bots=()):
+        """
+        aliases: extra names answered in every channel. channel_aliases: {channel: [names]} answered
+        only there. channel_policies: {channel: POLICY_*}, default POLICY_ALL.
+        known_bots: nicks whose messages never trigger a reply.
+        """
+        self.nickname = nickname.lower()
+        self.channel_policies = {c.lower(): p for c, p in (channel_policies or {}).items()}
+        for channel, policy in self.channel_policies.items():
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown mention policy '{policy}' for {channel}; expected one of {POLICIES}")
+        self.known_bots = frozenset(n.lower() for n in known_bots)
+        self.alias_scope = {} # alias -> channels it is limited to (None: everywhere)
+        for alias in (nickname, *aliases):
+            self._add_alias(alias, None)
+        for channel, names in (channel_aliases or {}).items():
+            for alias in names:
+                self._add_alias(alias, channel.lower())
+        self.prefilter = tuple(self.alias_scope) if len(self.alias_scope) <= PREFILTER_MAX_ALIASES else None
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+
+    def _add_alias(self, alias, channel):
+        alias = alias.strip().lower()
+        if not alias:
+            return
+        if NICK_TOKEN_PATTERN.fullmatch(alias) is None:
+            raise ValueError(f"Alias '{alias}' is not a valid IRC nick")
+        if channel is None:
+            self.alias_scope[alias] = None
+        elif self.alias_scope.get(alias, ()) is not None:
+            self.alias_scope.setdefault(alias, set()).add(channel)
+
+    def _allowed(self, alias, channel):
+        if alias not in self.alias_scope:
+            return False
+        scope = self.alias_scope[alias]
+        return scope is None or (channel is not None and channel.lower() in scope)
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def classify(self, channel, nick, text):
+        """Returns DIRECT, MENTION or None for a channel message from `nick`."""
+        lowered = text.lower()
+        if self.prefilter is not None and not any(alias in lowered for alias in self.prefilter):
+            return None
+        policy = self.channel_policies.get(channel.lower(), POLICY_ALL) if channel else POLICY_ALL
+        if policy == POLICY_OFF:
+            return None
+        # The old check replied whenever the nick appeared anywhere; count what we now skip
+        old_trigger = self.nickname in lowered
+        if nick and nick.lower() in self.known_bots:
+            if old_trigger:
+                self._count("suppressed_bot")
+            return None
+        match = DIRECT_PATTERN.match(lowered)
+        if match and self._allowed(match.group(1), channel):
+            self._count("direct")
+            return DIRECT
+        if policy == POLICY_DIRECT:
+            return None
+        if RELAY_PATTERN.match(lowered):
+            if old_trigger:
+                self._count("suppressed_relay")
+            return None
+        if "/" in lowered or "www." in lowered:
+            lowered = URL_PATTERN.sub(" ", lowered)
+        for token in NICK_TOKEN_PATTERN.findall(lowered):
+            if self._allowed(token, channel):
+                self._count("mention")
+                return MENTION
+        if old_trigger:
+            self._count("suppressed_substring") # Inside a word or a URL
+        return None
+
+    def strip_address(self, text, channel=None):
+        """Text without a leading "alias:" / "alias," address."""
+        match = DIRECT_PATTERN.match(text)
+        if match and self._allowed(match.group(1).lower(), channel):
+            return text[match.end():].strip()
+        return text.strip()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        suppressed = sum(v for k, v in counters.items() if k.startswith("suppressed_"))
+        return {
+            "direct": counters.get("direct", 0),
+            "mention": counters.get("mention", 0),
+            "suppressed": suppressed,
+            "suppressed_bot": counters.get("suppressed_bot", 0),
+            "suppressed_relay": counters.get("suppressed_relay", 0),
+            "suppressed_substring": counters.get("suppressed_substring", 0),
+            "saved_calls": suppressed * 2, # Each false trigger cost a topic call and a reply
+        }
+
+
+def parse_channel_list_setting(value):
+    """'#a=x,#b=y' -> {'#a': 'x', '#b': 'y'}; used for the policy env var."""
+    result = {}
+    for item in (value or "").split(','):
+        key, sep, setting = item.partition('=')
+        if sep and key.strip() and setting.strip():
+            result[key.strip()] = setting.strip().lower()
+    return result
+
+
+def parse_channel_aliases_setting(value):
+    """'#linux=tux|penguin,#rust=ferris' -> {'#linux': ['tux', 'penguin'], '#rust': ['ferris']}."""
+    return {channel: [name.strip() for name in names.split('|') if name.strip()]
+            for channel, names in parse_channel_list_setting(value).items()}
@@ -1,32 +1,63 @@
-import openai
 import json
 import datetime
 import os
 import re
+import sys
 import subprocess 
-import shutil 
+import argparse
+import threading
+import time
+from collections import deque
 from dotenv import load_dotenv 
+from channel_memory import ChannelMemoryIndex
+from directive_archive import DirectiveArchive
+import weechat_log
 load_dotenv()
 # --- CONFIGURATION ---
-OPENAI_API_KEY_LOADED_PROMPT_GEN = os.getenv("OPENAI_API_KEY_PROMPT_GEN")
-if not OPENAI_API_KEY_LOADED_PROMPT_GEN:
-    raise ValueError("Missing OPENAI_API_KEY_PROMPT_GEN environment variable. Set it in your .env file.")
-
-openai.api_key = OPENAI_API_KEY_LOADED_PROMPT_GEN 
+OPENAI_API_KEY_LOADED_PROMPT_GEN = os.getenv("OPENAI_API_KEY_PROMPT_GEN") # Checked in __main__; --dry-run doesn't need it
 WEECHAT_LOG_FILE_LOCAL_PATH = "./irc.serverName.#channelName.weechatlog"
 CHANNEL_NAME_IN_LOG = "#channelName" 
+SERVER_NAMES_IN_LOG = ("irc.serverName.org",) # Lines from these senders are server messages, not chat
+NICKS_TO_SKIP = ("cloudBot",) # Other bots; matched case-insensitively
+IRC_SERVER = os.getenv('IRC_SERVER', 'irc.ircServer.org') # Network the log belongs to; same key as wintermute.py in the memory index
 HOURS_LOOKBACK = 24
 TOKEN_THRESHOLD_FOR_MINI = 120000 # User-defined token threshold
 # Output file for wintermute.py
 # Ensure wintermute.py's DYNAMIC_PROMPT_FILE_PATH matches this
 OUTPUT_JSON_FILE_PATH = "./current_bot_directive.json"
-ARCHIVE_DIR_PATH = os.path.join(os.path.dirname(OUTPUT_JSON_FILE_PATH), "directive_archive")
+ARCHIVE_DIR_PATH = os.path.join(os.path.dirname(OUTPUT_JSON_FILE_PATH), "directive_archive") # Legacy per-run JSON files, migrated on first use
+ARCHIVE_DB_PATH = os.path.join(os.path.dirname(OUTPUT_JSON_FILE_PATH), "directive_archive.sqlite3")
+# Long-term full-text index of the channel, queried by wintermute.py ("remember when...")
+MEMORY_INDEX_DB_PATH = os.path.join(os.path.dirname(OUTPUT_JSON_FILE_PATH), "channel_memory.sqlite3")
+# Hierarchical day -> week -> month digests built from archived daily analyses
+ROLLING_SUMMARY_FILE_PATH = os.path.join(os.path.dirname(OUTPUT_JSON_FILE_PATH), "rolling_summaries.json")
+ROLLING_SUMMARY_MAX_NEW_DAYS_PER_RUN = 2 # Backfill is spread over runs so each run costs about the same
+ROLLING_SUMMARY_RETENTION_DAYS = 120
 PREFERRED_ANALYSIS_MODEL = "gpt-4.1-mini"
 SMALLER_ANALYSIS_MODEL = "gpt-4.1-nano" # For very large logs if micro is too slow/costly
 PROMPT_GEN_MODEL = "gpt-4.1-mini" # Or even nano, as its input is small
+DIGEST_MODEL = "gpt-4.1-nano" # Merges one day into a weekly/monthly digest; small input
 
 # Threshold for choosing smaller model (character count of the day's log text)
 # Adjust based on typical log sizes and model context windows/costs
+# Change detection: skip Stage 2 and the file rewrite when the analysis barely moved
+DIRECTIVE_SIMILARITY_THRESHOLD = 0.75 # Weighted field similarity at or above this skips regeneration
+DIRECTIVE_MAX_AGE_HOURS = 24 # Regenerate anyway once the current directive is this old
+ANALYSIS_FIELD_WEIGHTS = {"main_topics": 0.4, "users": 0.25, "atmosphere": 0.2, "communication_style": 0.1, "formality": 0.05}
+GENERATION_DECISIONS_LOG_PATH = os.path.join(os.path.dirname(OUTPUT_JSON_FILE_PATH), "generation_decisions.jsonl")
+GENERATION_DECISIONS_LOG_MAX_BYTES = 1000000 # Rotated to generation_decisions.jsonl.1 (one old file kept) past this size
+
+# Daemon mode (--daemon): regeneration is driven by channel activity instead of cron
+DAEMON_MIN_POLL_SECONDS = 5
+DAEMON_MAX_POLL_SECONDS = 120 # Poll backoff ceiling while the channel is quiet
+DAEMON_MESSAGE_TRIGGER = 150 # New messages that warrant a fresh analysis
+DAEMON_MIN_CYCLE_INTERVAL_SECONDS = 20 * 60
+DAEMON_MAX_CYCLE_INTERVAL_SECONDS = 6 * 60 * 60 # Refresh at least this often if anyone spoke
+DAEMON_SHIFT_WINDOW_SECONDS = 15 * 60
+DAEMON_SHIFT_RATIO = 3.0 # Recent rate vs. the lookback average that counts as an activity spike
+DAEMON_SHIFT_MIN_MESSAGES = 20
+DAEMON_MAX_CONCURRENT_CYCLES = 1
+
 MODEL_CHOICE_CHAR_THRESHOLD = 100000 # Approx 20k tokens
 MAX_CHARS_TO_SEND_TO_ANALYSIS_LLM = 1000000 # Cap at 1 million characters (~250k tokens)
 # --- STAGE 1: DEEP CHANNEL ANALYSIS ---
@@ -34,13 +65,16 @@ MAX_CHARS_TO_SEND_TO_ANALYSIS_LLM = 1000000 # Cap at 1 million characters (~250k
 def fetch_and_prepare_weechat_logs(log_file_path, hours_lookback=24):
     """
     Reads a WeeChat log file, filters messages from the last `hours_lookback` hours,
-    and formats them as "nick: message".
+    and formats them as "nick: message". Only the lookback window is read from disk.
     """
     print(f"Processing WeeChat log: {log_file_path} for last {hours_lookback} hours.")
-    relevant_log_entries = []
+    cutoff_ts = time.time() - hours_lookback * 3600
     try:
-        with open(log_file_path, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
+        relevant_log_entries = [
+            weechat_log.format_chat_record(record)
+            for record in weechat_log.read_records_since(
+                log_file_path, cutoff_ts, server_names=SERVER_NAMES_IN_LOG, skip_nicks=NICKS_TO_SKIP)
+        ]
     except FileNotFoundError:
         print(f"ERROR: Log file not found: {log_file_path}")
         return None
@@ -48,75 +82,28 @@ def fetch_and_prepare_weechat_logs(log_file_path, hours_lookback=24):
         print(f"ERROR: Could not read log file {log_file_path}: {e}")
         return None
 
-    cutoff_datetime = datetime.datetime.now() - datetime.timedelta(hours=hours_lookback)
-    
-    # WeeChat log format: YYYY-MM-DD HH:MM:SS<TAB><PREFIX_NICK><TAB><MESSAGE>
-    # Example line: 2025-03-27 01:02:17	@test	test2: Do you read
-    # Example join/part: 2025-05-21 00:09:22	-->	test (test@test-tf7.tf0.3tvs21.IP) has joined #channelName
-    # We want to skip join/part/quit/nick changes etc. for content analysis for now.
-    
-    # Regex to capture main parts and identify user messages vs system/join-part messages
-    # This regex tries to capture the nick more cleanly from prefix_nick field
-    # It assumes nick does not contain tabs. Message can contain anything.
-    # Line starts with date, time, tab, then either "-->", "<--", "---" (system) or a nick field, then tab, then message.
-    log_pattern = re.compile(
-        r"^(?P<timestamp_str>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\t"
-        r"(?P<sender_field>[^\t]+)\t"
-        r"(?P<message>.+)$"
-    )
-    # Nick prefixes to strip from sender_field if it's a user message
-    nick_prefixes_to_strip = re.compile(r"^[~&@%+\s]+") # Common prefixes and leading spaces
-
-    for line_num, line_content in enumerate(reversed(lines)): # Process recent lines first
-        line_content = line_content.strip()
-        match = log_pattern.match(line_content)
-        if not match:
-            # print(f"Line {len(lines)-line_num} did not match pattern: {line_content[:100]}")
-            continue
-
-        parts = match.groupdict()
-        try:
-            msg_datetime = datetime.datetime.strptime(parts["timestamp_str"], "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            # print(f"Could not parse timestamp on line {len(lines)-line_num}: {parts['timestamp_str']}")
-            continue
-
-        if msg_datetime < cutoff_datetime:
-            # print(f"Reached cutoff time at line {len(lines)-line_num}. Processed {len(relevant_log_entries)} entries.")
-            break # Since we are reading in reverse, we can stop
-
-        sender_field = parts["sender_field"].strip()
-        message = parts["message"].strip()
-
-        # Filter out common server messages / non-user chat
-        if sender_field in ["-->", "<--", "---"] or "irc.serverName.org" in sender_field: # Adjust if your server name is different
-            continue
-        if message.startswith("has joined") or message.startswith("has quit") or \
-           message.startswith("has parted") or message.startswith("is now known as") or \
-           message.startswith("Mode ") or message.startswith("***"):
-            continue
-            
-        # Clean up nick
-        nick = nick_prefixes_to_strip.sub("", sender_field)
-
-        if not nick or not message: # Skip if nick or message is empty after processing
-            continue
-            
-        if nick.lower() == "cloudBot":
-            continue # Skip all messages from cloudBot or similar bots
-
-        relevant_log_entries.append(f"{nick}: {message}")
-
     if not relevant_log_entries:
         print("No relevant user messages found in the lookback period.")
         return None
         
-    # Entries are in reverse chronological order, so reverse again for chronological
-    concatenated_logs = "\n".join(reversed(relevant_log_entries))
+    concatenated_logs = "\n".join(relevant_log_entries)
     print(f"Prepared {len(relevant_log_entries)} log entries for analysis ({len(concatenated_logs)} chars).")
     return concatenated_logs
 
 
+_openai_module = None
+
+def get_openai():
+    """Imports and configures the OpenAI SDK on first use; it dominates this script's startup time."""
+    global _openai_module
+    if _openai_module is None:
+        if not OPENAI_API_KEY_LOADED_PROMPT_GEN:
+            raise ValueError("Missing OPENAI_API_KEY_PROMPT_GEN environment variable. Set it in your .env file.")
+        import openai
+        openai.api_key = OPENAI_API_KEY_LOADED_PROMPT_GEN
+        _openai_module = openai
+    return _openai_module
+
 def select_analysis_model(full_log_text_char_count):
     """
     Selects an analysis model based on the approximate token count of the input.
@@ -193,7 +180,7 @@ def analyze_channel_activity(chat_log_string, channel_name, weekly_summary_str=N
     # print(f"Analysis User Prompt (snippet): {analysis_user_prompt[:1000]}...")
 
     try:
-        response = openai.chat.completions.create(
+        response = get_openai().chat.completions.create(
             model=chosen_analysis_model,
             messages=[
                 {"role": "system", "content": analysis_system_prompt},
@@ -295,7 +282,7 @@ Generated Style and Personality Guide:"""
     # print(f"--- Prompt to PROMPT_GEN_MODEL --- \nSystem: {prompt_gen_system_prompt}\nUser: {prompt_gen_user_prompt}\n---")
 
     try:
-        response = openai.chat.completions.create(
+        response = get_openai().chat.completions.create(
             model=PROMPT_GEN_MODEL,
             messages=[
                 {"role": "system", "content": prompt_gen_system_prompt},
@@ -320,13 +307,242 @@ Generated Style and Personality Guide:"""
         print(f"Error during prompt generation API call: {e}")
         return None
 
+# --- ROLLING SUMMARIES (weekly/monthly context for Stage 1) ---
+def open_directive_archive():
+    archive = DirectiveArchive(ARCHIVE_DB_PATH)
+    if archive.is_empty() and os.path.isdir(ARCHIVE_DIR_PATH):
+        archive.migrate_json_directory(ARCHIVE_DIR_PATH) # One-time import of directive_*.json files
+    return archive
+
+def load_latest_archived_analysis_per_day(since_day=None):
+    """Returns {"YYYY-MM-DD": analysis_summary} using the last archived run of each UTC day."""
+    archive = open_directive_archive()
+    try:
+        return {day: entry["analysis_summary"] for day, entry in archive.latest_per_day(since=since_day).items()
+                if isinstance(entry["analysis_summary"], dict)}
+    finally:
+        archive.close()
+
+def describe_day_for_digest(analysis):
+    topics = []
+    for item in analysis.get("main_topics", []):
+        if isinstance(item, dict) and "topic" in item:
+            topics.append(str(item["topic"]))
+        elif isinstance(item, str):
+            topics.append(item)
+    description = str(analysis.get("summary", "")).strip()
+    if topics:
+        description += f" Topics: {', '.join(topics)}."
+    return description.strip()
+
+def merge_day_into_digest(existing_digest, day, day_description, period_name):
+    """Folds one day's description into a running digest with a single small LLM call."""
+    if not existing_digest:
+        return day_description # First day of the period needs no model call
+    try:
+        response = get_openai().chat.completions.create(
+            model=DIGEST_MODEL,
+            messages=[
+                {"role": "system", "content": "You maintain running digests of an IRC channel's history. "
+                                              "Merge the new day into the digest. Keep recurring themes, notable users and running jokes; "
+                                              "drop one-off trivia. Reply with the updated digest only, at most 5 sentences."},
+                {"role": "user", "content": f"Current digest for {period_name}:\n{existing_digest}\n\nNew day ({day}):\n{day_description}"}
+            ],
+            max_tokens=300,
+            temperature=0.3,
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error merging {day} into {period_name} digest: {e}")
+        return None
+
+def update_rolling_summaries(today=None):
+    """
+    Merges completed days not yet digested into the weekly and monthly digests cached in
+    ROLLING_SUMMARY_FILE_PATH. Normally this is one new day (two small calls) per run.
+    """
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    try:
+        with open(ROLLING_SUMMARY_FILE_PATH, 'r', encoding='utf-8') as f:
+            digests = json.load(f)
+    except FileNotFoundError:
+        digests = {}
+    except json.JSONDecodeError:
+        print(f"WARNING: {ROLLING_SUMMARY_FILE_PATH} is corrupt. Rebuilding digests from the archive.")
+        digests = {}
+    for level in ("days", "weeks", "months"):
+        digests.setdefault(level, {})
+
+    retention_cutoff = (today - datetime.timedelta(days=ROLLING_SUMMARY_RETENTION_DAYS)).isoformat()
+    analyses = load_latest_archived_analysis_per_day(since_day=retention_cutoff)
+    pending_days = sorted(d for d in analyses if retention_cutoff <= d < today.isoformat() and d not in digests["days"])
+    for day in pending_days[:ROLLING_SUMMARY_MAX_NEW_DAYS_PER_RUN]:
+        day_description = describe_day_for_digest(analyses[day])
+        if not day_description:
+            digests["days"][day] = ""
+            continue
+        day_date = datetime.date.fromisoformat(day)
+        iso_year, iso_week, _ = day_date.isocalendar()
+        updates = {}
+        for level, key, period_name in (("weeks", f"{iso_year}-W{iso_week:02d}", f"week {iso_year}-W{iso_week:02d}"),
+                                        ("months", day[:7], f"month {day[:7]}")):
+            entry = digests[level].get(key, {"digest": "", "days": []})
+            merged = merge_day_into_digest(entry["digest"], day, day_description, period_name)
+            if merged is None:
+                break
+            updates[(level, key)] = {"digest": merged, "days": entry["days"] + [day]}
+        if len(updates) < 2:
+            break # Retry this day on the next run rather than leave a gap
+        for (level, key), entry in updates.items():
+            digests[level][key] = entry
+        digests["days"][day] = day_description
+        print(f"## Rolled {day} into weekly and monthly digests.")
+
+    # Prune old entries so the cache stays small however long the bot runs
+    digests["days"] = {d: v for d, v in digests["days"].items() if d >= retention_cutoff}
+    for level in ("weeks", "months"):
+        digests[level] = {k: v for k, v in digests[level].items() if v["days"] and v["days"][-1] >= retention_cutoff}
+
+    temp_path = ROLLING_SUMMARY_FILE_PATH + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(digests, f, indent=2)
+    os.replace(temp_path, ROLLING_SUMMARY_FILE_PATH)
+    return digests
+
+def build_weekly_summary_str(digests, today=None):
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    iso_year, iso_week, _ = today.isocalendar()
+    last_week = today - datetime.timedelta(days=7)
+    last_iso_year, last_iso_week, _ = last_week.isocalendar()
+    this_week = digests["weeks"].get(f"{iso_year}-W{iso_week:02d}")
+    previous_week = digests["weeks"].get(f"{last_iso_year}-W{last_iso_week:02d}")
+    this_month = digests["months"].get(today.strftime("%Y-%m"))
+
+    parts = []
+    if this_week:
+        parts.append(f"This week so far: {this_week['digest']}")
+    if previous_week and (not this_week or len(this_week["days"]) < 3):
+        parts.append(f"Last week: {previous_week['digest']}")
+    if this_month and len(this_month["days"]) > 7:
+        parts.append(f"This month overall: {this_month['digest']}")
+    return " ".join(parts) if parts else None
+
+# --- CHANGE DETECTION ---
+def load_last_archived_analysis():
+    """Returns (analysis_summary, generation_timestamp_utc) of the run that produced the current directive, or (None, None)."""
+    archive = open_directive_archive()
+    try:
+        # Skipped runs are archived too, but comparing against them would let slow drift never trigger a regeneration
+        entry = archive.latest(include_kept=False)
+    finally:
+        archive.close()
+    if entry and isinstance(entry["analysis_summary"], dict):
+        return entry["analysis_summary"], entry["generation_timestamp_utc"]
+    return None, None
+
+def _field_words(value):
+    """Flattens an analysis field (string, list of strings, or list of dicts) into a set of words."""
+    if isinstance(value, dict):
+        value = value.get("topic") or value.get("name") or ""
+    if isinstance(value, list):
+        words = set()
+        for item in value:
+            words |= _field_words(item)
+        return words
+    return {w for w in re.findall(r"[a-z0-9]+", str(value).lower()) if len(w) > 2}
+
+def analysis_similarity(previous_analysis, new_analysis):
+    """Weighted Jaccard similarity over ANALYSIS_FIELD_WEIGHTS. Returns (score, per-field scores)."""
+    field_scores = {}
+    for field in ANALYSIS_FIELD_WEIGHTS:
+        previous_words = _field_words(previous_analysis.get(field, ""))
+        new_words = _field_words(new_analysis.get(field, ""))
+        if not previous_words and not new_words:
+            field_scores[field] = 1.0
+        else:
+            field_scores[field] = len(previous_words & new_words) / len(previous_words | new_words)
+    score = sum(ANALYSIS_FIELD_WEIGHTS[f] * field_scores[f] for f in field_scores) / sum(ANALYSIS_FIELD_WEIGHTS.values())
+    return score, field_scores
+
+def should_regenerate_directive(analysis_data):
+    """Returns (regenerate, decision_record) comparing against the last archived analysis."""
+    previous_analysis, previous_timestamp = load_last_archived_analysis()
+    record = {"timestamp_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+              "threshold": DIRECTIVE_SIMILARITY_THRESHOLD}
+    if previous_analysis is None:
+        record.update(decision="regenerate", reason="no previous analysis")
+        return True, record
+
+    score, field_scores = analysis_similarity(previous_analysis, analysis_data)
+    record.update(similarity=round(score, 3), field_scores={k: round(v, 3) for k, v in field_scores.items()},
+                  previous_timestamp_utc=previous_timestamp)
+    age_hours = None
+    if previous_timestamp:
+        try:
+            age_hours = (datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(previous_timestamp)).total_seconds() / 3600
+        except ValueError:
+            pass
+    if age_hours is None or age_hours >= DIRECTIVE_MAX_AGE_HOURS:
+        record.update(decision="regenerate", reason="current directive is stale")
+        return True, record
+    if score >= DIRECTIVE_SIMILARITY_THRESHOLD:
+        record.update(decision="skip", reason="analysis materially unchanged")
+        return False, record
+    record.update(decision="regenerate", reason="analysis changed")
+    return True, record
+
+def record_generation_decision(record):
+    try:
+        if os.path.getsize(GENERATION_DECISIONS_LOG_PATH) > GENERATION_DECISIONS_LOG_MAX_BYTES:
+            os.replace(GENERATION_DECISIONS_LOG_PATH, GENERATION_DECISIONS_LOG_PATH + ".1")
+    except OSError:
+        pass # No log yet
+    try:
+        with open(GENERATION_DECISIONS_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"WARNING: Could not record generation decision: {e}")
+
+def archive_kept_analysis(analysis_data):
+    """Archives a skipped run's analysis with the directive it kept, so the daily digests have no gaps."""
+    try:
+        archive = open_directive_archive()
+        try:
+            current = archive.latest(include_kept=False)
+            archive.append(datetime.datetime.now(datetime.timezone.utc), current["generated_directive"] if current else "",
+                           analysis_data, kept=True)
+            archive.apply_retention()
+        finally:
+            archive.close()
+    except Exception as e:
+        print(f"WARNING: Could not archive the analysis of a skipped run: {e}")
+
 # --- MAIN EXECUTION ---
-def run_generation_cycle():
+def run_generation_cycle(chat_log_text=None, memory_index=None):
+    """
+    One analysis + directive cycle. The daemon passes its in-memory `chat_log_text` and open
+    `memory_index`; a cron run leaves both as None and reads/opens them itself.
+    """
     print(f"Starting dynamic prompt generation cycle: {datetime.datetime.now(datetime.timezone.utc).isoformat()}")
 
-    weekly_summary = None # Placeholder for now
+    try:
+        weekly_summary = build_weekly_summary_str(update_rolling_summaries())
+    except Exception as e:
+        print(f"WARNING: Rolling summary update failed, continuing without weekly context: {e}")
+        weekly_summary = None
+
+    # Index whatever was appended to the log since the last run (incremental, never re-reads old lines)
+    if memory_index is None:
+        memory_index = ChannelMemoryIndex(MEMORY_INDEX_DB_PATH, server=IRC_SERVER)
+        memory_index.ingest_weechat_log(WEECHAT_LOG_FILE_LOCAL_PATH, CHANNEL_NAME_IN_LOG,
+                                        server_names=SERVER_NAMES_IN_LOG, skip_nicks=NICKS_TO_SKIP)
+        memory_index.close()
+    else:
+        memory_index.ingest_weechat_log(WEECHAT_LOG_FILE_LOCAL_PATH, CHANNEL_NAME_IN_LOG,
+                                        server_names=SERVER_NAMES_IN_LOG, skip_nicks=NICKS_TO_SKIP)
 
-    chat_log_text = fetch_and_prepare_weechat_logs(WEECHAT_LOG_FILE_LOCAL_PATH, hours_lookback=HOURS_LOOKBACK)
+    if chat_log_text is None:
+        chat_log_text = fetch_and_prepare_weechat_logs(WEECHAT_LOG_FILE_LOCAL_PATH, hours_lookback=HOURS_LOOKBACK)
     if not chat_log_text:
         print("Failed to get chat logs for analysis. No update will be written.")
         return
@@ -336,6 +552,14 @@ def run_generation_cycle():
         print("Channel analysis failed. No update will be written.")
         return
 
+    regenerate, decision_record = should_regenerate_directive(analysis_data)
+    record_generation_decision(decision_record)
+    print(f"## Change detection: {decision_record['decision']} ({decision_record['reason']}, similarity={decision_record.get('similarity', 'n/a')}).")
+    if not regenerate:
+        print("Analysis materially unchanged. Keeping the current directive; archiving the analysis only.")
+        archive_kept_analysis(analysis_data)
+        return
+
     generated_directive_text = generate_personality_directive(analysis_data)
     if not generated_directive_text:
         print("Personality directive generation failed. No update will be written.")
@@ -362,21 +586,173 @@ def run_generation_cycle():
         print(f"Successfully updated dynamic prompt file: {OUTPUT_JSON_FILE_PATH}")
 
         # 2. Archive this newly written content
-        if not os.path.exists(ARCHIVE_DIR_PATH):
-            os.makedirs(ARCHIVE_DIR_PATH)
-            print(f"Created archive directory: {ARCHIVE_DIR_PATH}")
-        
-        # Use a timestamp from the content for consistent archive naming
-        archive_timestamp_str = datetime.datetime.fromisoformat(output_content["generation_timestamp_utc"]).strftime('%Y-%m-%d_%H-%M-%S')
-        archive_file_name = f"directive_{archive_timestamp_str}.json"
-        final_archive_path = os.path.join(ARCHIVE_DIR_PATH, archive_file_name)
-        
-        shutil.copyfile(OUTPUT_JSON_FILE_PATH, final_archive_path) # Copy the file we just wrote
-        print(f"Archived current directive and analysis to: {final_archive_path}")
+        archive = open_directive_archive()
+        try:
+            archive.append(output_content["generation_timestamp_utc"], generated_directive_text, analysis_data)
+            downsampled, deleted = archive.apply_retention()
+        finally:
+            archive.close()
+        print(f"Archived current directive and analysis to: {ARCHIVE_DB_PATH} (retention: {downsampled} downsampled, {deleted} expired)")
 
     except Exception as e:
         print(f"FATAL: Could not write to output file {OUTPUT_JSON_FILE_PATH} or archive: {e}")
 
+# --- DAEMON MODE ---
+class LogTail:
+    """
+    Follows a WeeChat log, keeping the last `hours_lookback` hours of user messages in memory
+    so a cycle never has to re-read the whole file.
+    """
+    def __init__(self, log_file_path, hours_lookback=HOURS_LOOKBACK):
+        self.log_file_path = log_file_path
+        self.lookback_seconds = hours_lookback * 3600
+        self.entries = deque() # (epoch, "nick: message"), oldest first
+        self.arrivals = deque() # time.monotonic() of each message seen while tailing
+        self.new_messages = 0 # Since the last cycle
+        self.offset = 0
+        self.inode = None
+        self.skip_nicks = {n.lower() for n in NICKS_TO_SKIP}
+
+    def poll(self):
+        """Reads lines appended since the last poll. Returns the number of new user messages."""
+        try:
+            stat = os.stat(self.log_file_path)
+        except OSError:
+            return 0
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            if self.inode is not None:
+                print(f"## Daemon: {self.log_file_path} was rotated or truncated; re-reading it.")
+            self.inode, self.offset = stat.st_ino, 0
+            self.entries.clear()
+        if stat.st_size == self.offset:
+            return 0
+
+        added = 0
+        priming = self.offset == 0
+        with open(self.log_file_path, 'rb') as f:
+            if priming:
+                # Jump straight to the lookback window instead of parsing the whole history
+                self.offset = weechat_log.find_offset_since(f, time.time() - self.lookback_seconds)
+            f.seek(self.offset)
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    break # Partial line still being written
+                self.offset += len(raw_line)
+                record = weechat_log.parse_line(raw_line.decode('utf-8', errors='replace'), SERVER_NAMES_IN_LOG)
+                if record and record.kind in weechat_log.CHAT_KINDS and record.nick.lower() not in self.skip_nicks:
+                    self.entries.append((record.ts, weechat_log.format_chat_record(record)))
+                    added += 1
+        self._trim()
+        if priming:
+            return 0 # Backlog read at startup is context, not new activity
+        now = time.monotonic()
+        self.arrivals.extend([now] * added)
+        self.new_messages += added
+        return added
+
+    def _trim(self):
+        cutoff = time.time() - self.lookback_seconds
+        while self.entries and self.entries[0][0] < cutoff:
+            self.entries.popleft()
+        horizon = time.monotonic() - DAEMON_SHIFT_WINDOW_SECONDS
+        while self.arrivals and self.arrivals[0] < horizon:
+            self.arrivals.popleft()
+
+    def activity_shift_detected(self):
+        """True when the recent message rate is well above this window's average rate."""
+        recent = len(self.arrivals)
+        if recent < DAEMON_SHIFT_MIN_MESSAGES or not self.entries:
+            return False
+        baseline_per_window = len(self.entries) * DAEMON_SHIFT_WINDOW_SECONDS / self.lookback_seconds
+        return recent > DAEMON_SHIFT_RATIO * max(baseline_per_window, 1.0)
+
+    def chat_log_text(self):
+        if not self.entries:
+            return None
+        return "\n".join(line for _, line in self.entries)
+
+def run_daemon():
+    """
+    Long-lived mode: keeps the OpenAI client and the parsed log window warm and regenerates
+    only when the channel has moved: after DAEMON_MESSAGE_TRIGGER new messages, on an activity
+    spike, or after DAEMON_MAX_CYCLE_INTERVAL_SECONDS if anything at all was said. A quiet channel
+    costs one stat() per poll, and the poll interval backs off while it stays quiet.
+    """
+    print(f"Starting prompt generator daemon for {CHANNEL_NAME_IN_LOG} ({WEECHAT_LOG_FILE_LOCAL_PATH}).")
+    tail = LogTail(WEECHAT_LOG_FILE_LOCAL_PATH)
+    tail.poll()
+    print(f"## Daemon: primed with {len(tail.entries)} messages from the last {HOURS_LOOKBACK} hours.")
+    memory_index = ChannelMemoryIndex(MEMORY_INDEX_DB_PATH, server=IRC_SERVER)
+    cycle_slots = threading.BoundedSemaphore(DAEMON_MAX_CONCURRENT_CYCLES) # At most one cycle per channel at a time
+    last_cycle_time = 0.0
+    poll_interval = DAEMON_MIN_POLL_SECONDS
+
+    def run_cycle(chat_log_text):
+        try:
+            run_generation_cycle(chat_log_text=chat_log_text, memory_index=memory_index)
+        except Exception as e:
+            print(f"ERROR: Generation cycle crashed: {e}")
+        finally:
+            cycle_slots.release()
+
+    try:
+        while True:
+            time.sleep(poll_interval)
+            added = tail.poll()
+            poll_interval = DAEMON_MIN_POLL_SECONDS if added else min(poll_interval * 2, DAEMON_MAX_POLL_SECONDS)
+
+            since_last_cycle = time.monotonic() - last_cycle_time
+            if tail.new_messages == 0 or since_last_cycle < DAEMON_MIN_CYCLE_INTERVAL_SECONDS:
+                continue
+            if tail.new_messages >= DAEMON_MESSAGE_TRIGGER:
+                reason = f"{tail.new_messages} new messages"
+            elif tail.activity_shift_detected():
+                reason = f"activity spike ({len(tail.arrivals)} messages in {DAEMON_SHIFT_WINDOW_SECONDS // 60} min)"
+            elif since_last_cycle >= DAEMON_MAX_CYCLE_INTERVAL_SECONDS:
+                reason = f"{since_last_cycle / 3600:.1f}h since last cycle"
+            else:
+                continue
+            if not cycle_slots.acquire(blocking=False):
+                continue # Previous cycle still running; the trigger stays pending
+            print(f"## Daemon: regenerating ({reason}).")
+            last_cycle_time = time.monotonic()
+            tail.new_messages = 0
+            threading.Thread(target=run_cycle, args=(tail.chat_log_text(),), name="generation-cycle", daemon=True).start()
+    except KeyboardInterrupt:
+        print("## Daemon: stopping.")
+    finally:
+        cycle_slots.acquire() # Let a running cycle finish its writes
+        memory_index.close()
+
+def run_dry_run():
+    """Parses and compacts the lookback window and reports what a real run would send, offline."""
+    started = time.perf_counter()
+    chat_log_text = fetch_and_prepare_weechat_logs(WEECHAT_LOG_FILE_LOCAL_PATH, hours_lookback=HOURS_LOOKBACK)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if not chat_log_text:
+        print("## Dry run: no chat lines in the lookback window.")
+        return
+    model, approx_tokens = select_analysis_model(len(chat_log_text))
+    print(f"## Dry run: {chat_log_text.count(chr(10)) + 1} messages, {len(chat_log_text)} chars "
+          f"(~{approx_tokens:.0f} tokens) would go to {model}; parsed in {elapsed_ms:.0f} ms.")
+    loaded_sdks = [name for name in ("openai", "anthropic") if name in sys.modules]
+    print(f"## Dry run: provider SDKs loaded: {', '.join(loaded_sdks) if loaded_sdks else 'none'}.")
+
 if __name__ == "__main__":
-    # This script is intended to be run by a scheduler (e.g., cron)
-    run_generation_cycle()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Generate Wintermute's dynamic personality directive.")
+    arg_parser.add_argument("--daemon", action="store_true",
+                            help="Run continuously, tailing the log and regenerating on activity instead of once.")
+    arg_parser.add_argument("--dry-run", action="store_true",
+                            help="Parse and compact the logs and report the analysis input, without calling any model.")
+    args = arg_parser.parse_args()
+    if args.dry_run:
+        run_dry_run()
+        sys.exit(0)
+    if not OPENAI_API_KEY_LOADED_PROMPT_GEN:
+        # Fail before reading logs or touching any state, without importing the SDK
+        raise ValueError("Missing OPENAI_API_KEY_PROMPT_GEN environment variable. Set it in your .env file.")
+    if args.daemon:
+        run_daemon()
+    else:
+        # One-shot mode, intended to be run by a scheduler (e.g., cron)
+        run_generation_cycle()
\ No newline at end of file
@@ -0,0 +1,230 @@
+###
+# Runs several wintermute.py workers from one config: one process per server or channel group.
+# Each worker gets its own reactor thread, module state and core; they share the ignore list,
+# the LLM rate budget and health reporting through coordination.py.
+#
+#   python supervisor.py [--config shards.json]
+#   python supervisor.py status [--config shards.json]
+#
+# shards.json:
+# {
+#   "coordination_db": "./coordination.sqlite3",
+#   "shards": [
+#     {"name": "net1", "server": "irc.net1.org", "port": 6667, "channels": ["#a", "#b"]},
+#     {"name": "net2-busy", "server": "irc.net2.org", "channels": ["#busy"], "nickname": "wintermute2",
+#      "directive_file": "./directives/net2.json", "env": {"IRC_BOT_PASSWORD": "..."}}
+#   ]
+# }
+###
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+
+from coordination import Coordinator
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_SCRIPT = os.path.join(SCRIPT_DIR, "wintermute.py")
+DEFAULT_CONFIG_PATH = os.path.join(SCRIPT_DIR, "shards.json")
+SHARDS_DIR = os.path.join(SCRIPT_DIR, "shards") # Per-shard working dir: logs, worker output
+
+SUPERVISOR_POLL_SECONDS = 1
+SUPERVISOR_STATUS_INTERVAL_SECONDS = 5 * 60
+HEARTBEAT_TIMEOUT_SECONDS = 90 # A worker that has not beaten for this long is restarted (a hung reactor stops its beats)
+DISCONNECTED_RESTART_SECONDS = 5 * 60 # The irc library reconnects by itself; a worker still disconnected after this is restarted
+STARTUP_GRACE_SECONDS = 60 # Connecting and joining can take a while before the first heartbeat
+RESTART_BACKOFF_BASE_SECONDS = 2
+RESTART_BACKOFF_MAX_SECONDS = 5 * 60
+STABLE_RUN_SECONDS = 10 * 60 # Running this long resets the backoff
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+
+class Shard:
+    def __init__(self, config, coordination_db):
+        self.name = config["name"]
+        self.config = config
+        self.coordination_db = coordination_db
+        self.work_dir = os.path.join(SHARDS_DIR, self.name)
+        self.process = None
+        self.started_at = 0
+        self.next_start_at = 0
+        self.consecutive_failures = 0
+        self.restarts = 0
+        self.disconnected_since = None
+
+    def build_env(self):
+        env = dict(os.environ)
+        env.update({
+            "IRC_SERVER": self.config["server"],
+            "IRC_PORT": str(self.config.get("port", 6667)),
+            "IRC_CHANNELS": ",".join(self.config["channels"]),
+            "WINTERMUTE_SHARD_NAME": self.name,
+            "WINTERMUTE_COORDINATION_DB": self.coordination_db,
+            "PYTHONUNBUFFERED": "1",
+        })
+        if self.config.get("nickname"):
+            env["IRC_BOT_NICKNAME"] = self.config["nickname"]
+        if self.config.get("directive_file"):
+            env["WINTERMUTE_DIRECTIVE_FILE"] = os.path.abspath(self.config["directive_file"])
+        env.update({k: str(v) for k, v in self.config.get("env", {}).items()})
+        return env
+
+    def start(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        log_file = open(os.path.join(self.work_dir, "worker.log"), 'a', encoding='utf-8')
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT], cwd=self.work_dir, env=self.build_env(),
+            stdout=log_file, stderr=subprocess.STDOUT)
+        log_file.close() # The child keeps its own handle
+        self.started_at = time.time()
+        self.disconnected_since = None
+        print(f"## Shard {self.name}: started pid {self.process.pid} "
+              f"({self.config['server']} {','.join(self.config['channels'])}).")
+
+    def schedule_restart(self, reason):
+        if time.time() - self.started_at >= STABLE_RUN_SECONDS:
+            self.consecutive_failures = 0
+        delay = min(RESTART_BACKOFF_MAX_SECONDS, RESTART_BACKOFF_BASE_SECONDS * 2 ** self.consecutive_failures)
+        self.consecutive_failures += 1
+        self.restarts += 1
+        self.process = None
+        self.next_start_at = time.time() + delay
+        print(f"## Shard {self.name}: {reason}; restarting in {delay:.0f}s (restart #{self.restarts}).")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+    def check(self, heartbeat):
+        """One supervision step: start, detect crashes and hangs."""
+        now = time.time()
+        if self.process is None:
+            if now >= self.next_start_at:
+                self.start()
+            return
+        exit_code = self.process.poll()
+        if exit_code is not None:
+            self.schedule_restart(f"exited with code {exit_code}")
+            return
+        if now - self.started_at < STARTUP_GRACE_SECONDS:
+            return
+        # Heartbeats from a previous run of this shard do not count
+        if heartbeat is None or heartbeat["pid"] != self.process.pid or heartbeat["age_seconds"] > HEARTBEAT_TIMEOUT_SECONDS:
+            self.process.kill()
+            self.process.wait()
+            self.schedule_restart("missed heartbeats (hung)")
+            return
+        if heartbeat["status"] != "disconnected":
+            self.disconnected_since = None
+            return
+        if self.disconnected_since is None:
+            self.disconnected_since = now
+        elif now - self.disconnected_since > DISCONNECTED_RESTART_SECONDS:
+            self.process.kill()
+            self.process.wait()
+            self.schedule_restart(f"disconnected for {now - self.disconnected_since:.0f}s")
+
+
+def load_config(config_path):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    names = [shard["name"] for shard in config.get("shards", [])]
+    if not names:
+        raise ValueError(f"No shards defined in {config_path}")
+    if len(set(names)) != len(names):
+        raise ValueError(f"Shard names must be unique in {config_path}")
+    # Two workers with one nick on one server would fight over it (433 nick in use) forever
+    identities = {}
+    default_nickname = os.getenv('IRC_BOT_NICKNAME', 'wintermute')
+    for shard in config["shards"]:
+        env = shard.get("env", {})
+        nick = (shard.get("nickname") or env.get("IRC_BOT_NICKNAME") or default_nickname).lower()
+        server = shard["server"].lower()
+        if (server, nick) in identities:
+            raise ValueError(f"Shards {identities[(server, nick)]} and {shard['name']} both use nick "
+                             f"'{nick}' on {server} in {config_path}")
+        identities[(server, nick)] = shard["name"]
+    config["coordination_db"] = os.path.abspath(config.get("coordination_db", os.path.join(SCRIPT_DIR, "coordination.sqlite3")))
+    return config
+
+
+def import_legacy_ignore_list(coordinator):
+    legacy_path = os.path.join(SCRIPT_DIR, "ignore_list.json")
+    try:
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            imported = coordinator.import_ignored(json.load(f))
+        if imported:
+            print(f"## Imported {imported} ignored users from {legacy_path} into the shared list.")
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, TypeError) as e:
+        print(f"## Could not import {legacy_path}: {e}")
+
+
+def print_status(coordinator, shards):
+    health = coordinator.shard_health()
+    for shard in shards:
+        beat = health.get(shard.name)
+        state = "running" if shard.process is not None and shard.process.poll() is None else "waiting to restart"
+        beat_text = f"last heartbeat {beat['age_seconds']:.0f}s ago ({beat['status']})" if beat else "no heartbeat yet"
+        print(f"## Shard {shard.name}: {state}, {beat_text}, {shard.restarts} restarts.")
+
+
+def run(config_path):
+    config = load_config(config_path)
+    coordinator = Coordinator(config["coordination_db"], shard_name="supervisor")
+    import_legacy_ignore_list(coordinator)
+    shards = [Shard(shard_config, config["coordination_db"]) for shard_config in config["shards"]]
+    stopping = False
+
+    def shutdown_handler(sig, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+
+    last_status_time = time.time()
+    while not stopping:
+        health = coordinator.shard_health()
+        for shard in shards:
+            shard.check(health.get(shard.name))
+        if time.time() - last_status_time >= SUPERVISOR_STATUS_INTERVAL_SECONDS:
+            print_status(coordinator, shards)
+            last_status_time = time.time()
+        time.sleep(SUPERVISOR_POLL_SECONDS)
+
+    print("## Supervisor shutting down workers...")
+    for shard in shards:
+        shard.stop() # Workers save their state on SIGTERM
+    deadline = time.time() + SHUTDOWN_TIMEOUT_SECONDS
+    for shard in shards:
+        coordinator.clear_heartbeat(shard.name)
+        if shard.process is None:
+            continue
+        try:
+            shard.process.wait(timeout=max(0.1, deadline - time.time()))
+        except subprocess.TimeoutExpired:
+            print(f"## Shard {shard.name}: did not stop in time, killing.")
+            shard.process.kill()
+    coordinator.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run one wintermute worker per shard.")
+    arg_parser.add_argument("command", nargs="?", choices=["run", "status"], default="run")
+    arg_parser.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    args = arg_parser.parse_args()
+
+    if args.command == "status":
+        status_config = load_config(args.config)
+        status_coordinator = Coordinator(status_config["coordination_db"])
+        for name, beat in sorted(status_coordinator.shard_health().items()):
+            print(f"{name}: pid {beat['pid']}, {beat['status']}, heartbeat {beat['age_seconds']:.0f}s ago, channels {beat['channels']}")
+        status_coordinator.close()
+    else:
+        run(args.config)
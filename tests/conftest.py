@@ -0,0 +1,119 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llm_scheduler import LLMScheduler
+
+ADMIN_NICK = "testadmin"
+
+
+class FakeConnection:
+    """Records what the bot sends instead of talking to a server."""
+
+    def __init__(self):
+        self.sent = []
+
+    def privmsg(self, target, message):
+        self.sent.append((target, message))
+
+    def is_connected(self):
+        return True
+
+    def add_global_handler(self, *args, **kwargs):
+        pass
+
+    def send_raw(self, line):
+        self.sent.append((None, line))
+
+
+class FakeScheduler:
+    """Collects work handed to the reactor thread; run_pending() plays the reactor."""
+
+    def __init__(self):
+        self.pending = []
+
+    def execute_every(self, period, func):
+        pass
+
+    def execute_after(self, delay, func):
+        self.pending.append(func)
+
+    def run_pending(self):
+        pending, self.pending = self.pending, []
+        for func in pending:
+            func()
+
+
+class FakeProviders:
+    """Stands in for the Anthropic and OpenAI clients and counts every call."""
+
+    def __init__(self):
+        self.anthropic_calls = []
+        self.openai_calls = []
+        self.topic = "test-topic"
+        self.reply = "a reply"
+        self.anthropic = types.SimpleNamespace(messages=types.SimpleNamespace(create=self._anthropic_create))
+        self.openai = types.SimpleNamespace(
+            chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=self._openai_create)))
+
+    @property
+    def total(self):
+        return len(self.anthropic_calls) + len(self.openai_calls)
+
+    def _anthropic_create(self, **kwargs):
+        self.anthropic_calls.append(kwargs)
+        return types.SimpleNamespace(content=[types.SimpleNamespace(text=self.reply)],
+                                     usage=types.SimpleNamespace(input_tokens=100, output_tokens=20))
+
+    def _openai_create(self, **kwargs):
+        self.openai_calls.append(kwargs)
+        message = types.SimpleNamespace(content=self.topic)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)],
+                                     usage=types.SimpleNamespace(prompt_tokens=100, completion_tokens=5))
+
+
+def make_event(target, nick, message):
+    return types.SimpleNamespace(target=target, source=types.SimpleNamespace(nick=nick), arguments=[message], tags=None)
+
+
+def import_bot_module():
+    """wintermute needs the irc and dotenv packages; tests that use it skip without them."""
+    pytest.importorskip("irc.bot")
+    pytest.importorskip("dotenv")
+    import wintermute
+    return wintermute
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    wintermute = import_bot_module()
+    fake = FakeProviders()
+    monkeypatch.setattr(wintermute, "get_anthropic_client", lambda: fake.anthropic)
+    monkeypatch.setattr(wintermute, "get_openai", lambda: fake.openai)
+    return fake
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch, providers):
+    """A DumbBot with fresh module state, files under tmp_path and no network."""
+    wintermute = import_bot_module()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wintermute, "MEMORY_INDEX_DB_PATH", str(tmp_path / "channel_memory.sqlite3"))
+    monkeypatch.setattr(wintermute, "DYNAMIC_PROMPT_FILE_PATH", str(tmp_path / "current_bot_directive.json"))
+    monkeypatch.setattr(wintermute, "COORDINATION_DB_PATH", None)
+    monkeypatch.setattr(wintermute, "ADMIN_NICKS", {ADMIN_NICK})
+    monkeypatch.setattr(wintermute, "llm_scheduler", LLMScheduler())
+    wintermute.topic_threads.clear()
+    wintermute.user_topics.clear()
+    monkeypatch.setattr(wintermute, "topic_cache", wintermute.TopicClassificationCache())
+    monkeypatch.setattr(wintermute, "response_cache", wintermute.ResponseCache())
+    instance = wintermute.DumbBot(["#a", "#b"], wintermute.nickname, "pass", "irc.test", "acct")
+    instance.connection = FakeConnection()
+    instance.reactor = types.SimpleNamespace(scheduler=FakeScheduler())
+    yield instance
+    instance.directive_watcher.stop()
+    instance.memory_index.close()
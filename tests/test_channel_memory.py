@@ -0,0 +1,78 @@
+import sqlite3
+import time
+
+from conftest import import_bot_module
+
+from channel_memory import ChannelMemoryIndex
+
+OLD_SCHEMA = """
+CREATE TABLE history (id INTEGER PRIMARY KEY, channel TEXT NOT NULL, ts INTEGER NOT NULL, nick TEXT NOT NULL,
+                      message TEXT NOT NULL, dedup_key INTEGER NOT NULL UNIQUE);
+CREATE VIRTUAL TABLE history_fts USING fts5(message, content='history', content_rowid='id', tokenize='porter unicode61');
+CREATE TRIGGER history_ai AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, message) VALUES (new.id, new.message);
+END;
+"""
+
+
+def test_busy_channel_does_not_hide_quiet_channel_hits(tmp_path):
+    index = ChannelMemoryIndex(str(tmp_path / "memory.sqlite3"))
+    for i in range(200):
+        index.add_message("#busy", 1000 + i * 60, "bob", "kernel panic")
+    index.add_message("#quiet", 1000, "alice", "we once had a kernel panic on the old build server after an upgrade")
+    index.flush()
+    exchanges = index.search("#quiet", "remember that kernel panic", before_ts=10 ** 9)
+    assert [line[2] for exchange in exchanges for line in exchange] == [
+        "we once had a kernel panic on the old build server after an upgrade"]
+    index.close()
+
+
+def test_channel_name_is_not_matched_as_message_text(tmp_path):
+    index = ChannelMemoryIndex(str(tmp_path / "memory.sqlite3"))
+    index.add_message("#linux", 1000, "bob", "good morning")
+    index.flush()
+    assert index.search("#linux", "remember linux", before_ts=10 ** 9) == []
+    index.close()
+
+
+def test_old_index_is_rebuilt_with_channel_column(tmp_path):
+    path = str(tmp_path / "memory.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.execute("INSERT INTO history(channel, ts, nick, message, dedup_key) VALUES ('#a', 1000, 'bob', 'zfs scrub', 1)")
+    conn.commit()
+    conn.close()
+    index = ChannelMemoryIndex(path, server="irc.net1.org")
+    assert index.available
+    assert index.search("#a", "zfs scrub", before_ts=10 ** 9)
+    index.close()
+
+
+def test_same_channel_on_another_server_is_separate(tmp_path):
+    path = str(tmp_path / "memory.sqlite3")
+    net1 = ChannelMemoryIndex(path, server="irc.net1.org")
+    net2 = ChannelMemoryIndex(path, server="irc.net2.org")
+    net1.add_message("#linux", 1000, "bob", "zfs scrub takes hours")
+    net1.flush()
+    net2.add_message("#linux", 1000, "bob", "zfs scrub takes hours") # Same nick, text and minute, other network
+    net2.flush()
+    assert net1.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 2
+    net2.add_message("#linux", 2000, "carol", "systemd timers")
+    net2.flush()
+    assert net1.search("#linux", "systemd timers", before_ts=10 ** 9) == []
+    exchanges = net2.search("#linux", "zfs scrub", before_ts=10 ** 9)
+    assert [line[2] for exchange in exchanges for line in exchange] == ["zfs scrub takes hours", "systemd timers"]
+    net1.close()
+    net2.close()
+
+
+def test_bot_reply_read_back_from_log_is_not_indexed_twice(bot, tmp_path):
+    wintermute = import_bot_module()
+    bot.send_multiline("#a", "lifetimes tie a reference to its owner", "alice", False)
+    line = "alice: lifetimes tie a reference to its owner"
+    log_path = tmp_path / "irc.test.#a.weechatlog"
+    log_path.write_text(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t@{wintermute.nickname}\t{line}\n", encoding='utf-8')
+    bot.memory_index.flush()
+    assert bot.memory_index.ingest_weechat_log(str(log_path), "#a") == 0
+    rows = bot.memory_index.conn.execute("SELECT nick, message FROM history").fetchall()
+    assert rows == [(wintermute.nickname, line)]
@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import ADMIN_NICK, import_bot_module, make_event
+
+wintermute = import_bot_module()
+
+# Arguments for commands that take one; everything else is sent bare
+COMMAND_ARGS = {
+    "set system_prompt": "Be terse.",
+    "ignore": "troll",
+    "unignore": "troll",
+    "diag": "status",
+}
+
+
+def command_lines(bot):
+    for entry in bot.commands.entries():
+        for name in entry["names"]:
+            args = COMMAND_ARGS.get(name, "")
+            yield f"{name} {args}".strip()
+
+
+def test_every_command_is_covered(bot):
+    takes_args = {name for entry in bot.commands.entries() if entry["takes_args"] for name in entry["names"]}
+    assert takes_args <= set(COMMAND_ARGS), "add sample arguments for new commands"
+
+
+@pytest.mark.parametrize("nick", [ADMIN_NICK, "someuser"])
+def test_channel_commands_make_no_provider_calls(bot, providers, nick):
+    for line in command_lines(bot):
+        text = f"{wintermute.nickname}: {line}"
+        bot.connection.sent.clear()
+        bot.on_pubmsg(None, make_event("#a", nick, text))
+        assert providers.total == 0, f"'{line}' from {nick} called a provider"
+        assert bot.connection.sent, f"'{line}' from {nick} got no answer"
+
+
+def test_private_commands_make_no_provider_calls(bot, providers):
+    for line in command_lines(bot):
+        bot.on_privmsg(None, make_event(wintermute.nickname, ADMIN_NICK, line))
+    assert providers.total == 0
+
+
+def test_commands_are_case_insensitive(bot, providers):
+    bot.on_pubmsg(None, make_event("#a", "someuser", f"{wintermute.nickname}: HELP"))
+    bot.on_pubmsg(None, make_event("#a", "someuser", f"{wintermute.nickname}: Show Topics"))
+    assert providers.total == 0
+
+
+def test_questions_still_reach_the_model(bot, providers):
+    # "help me ..." is a question, not the help command
+    bot.on_pubmsg(None, make_event("#a", "someuser", f"{wintermute.nickname}: help me with python"))
+    assert len(providers.anthropic_calls) == 1
+
+
+def test_no_admins_by_default(bot, providers, monkeypatch):
+    monkeypatch.setattr(wintermute, "ADMIN_NICKS", set())
+    bot.on_pubmsg(None, make_event("#a", "adminName", f"{wintermute.nickname}: show ignored"))
+    assert bot.connection.sent == [("#a", "adminName: that command is for admins only.")]
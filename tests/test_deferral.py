@@ -0,0 +1,34 @@
+from conftest import import_bot_module, make_event
+
+wintermute = import_bot_module()
+
+
+def test_provider_deferral_does_not_classify_twice(bot, providers, monkeypatch):
+    granted = {"anthropic": False}
+    real_acquire = wintermute.llm_scheduler.acquire_provider
+
+    def acquire(provider):
+        if provider == "anthropic":
+            return granted["anthropic"]
+        return real_acquire(provider)
+
+    monkeypatch.setattr(wintermute.llm_scheduler, "acquire_provider", acquire)
+    classified = []
+    real_assign = wintermute.assign_message_topic
+
+    def assign(*args):
+        classified.append(args[2])
+        return real_assign(*args)
+
+    monkeypatch.setattr(wintermute, "assign_message_topic", assign)
+    bot.on_pubmsg(None, make_event("#a", "alice", f"{wintermute.nickname}: how do rust lifetimes work"))
+    assert len(classified) == 1
+    assert not providers.anthropic_calls # Reply deferred
+
+    granted["anthropic"] = True
+    assert wintermute.llm_scheduler.drain() == 1
+    assert len(classified) == 1 # The retry reused the topic
+    assert len(providers.openai_calls) == 1
+    assert len(providers.anthropic_calls) == 1
+    thread = wintermute.topic_threads["#a"][providers.topic]
+    assert [m for _, nick, m in thread["messages"] if nick == "alice"] == ["how do rust lifetimes work"]
@@ -0,0 +1,28 @@
+import threading
+
+from conftest import import_bot_module, make_event
+
+wintermute = import_bot_module()
+
+
+def test_diag_reports_run_off_the_reactor_thread(bot, monkeypatch):
+    ran_on = []
+
+    def memory_snapshot():
+        ran_on.append(threading.current_thread())
+        return "Memory snapshot: done."
+
+    monkeypatch.setattr(wintermute.diagnostics, "memory_snapshot", memory_snapshot)
+    bot.on_pubmsg(None, make_event("#a", "testadmin", f"{wintermute.nickname}: diag memory"))
+    for thread in threading.enumerate():
+        if thread.name == "diagnostics-report":
+            thread.join()
+    assert ran_on and ran_on[0] is not threading.current_thread()
+    assert bot.connection.sent == [] # Replies are only sent from the reactor thread
+    bot.reactor.scheduler.run_pending()
+    assert bot.connection.sent == [("#a", "Memory snapshot: done.")]
+
+
+def test_diag_status_answers_at_once(bot):
+    bot.on_pubmsg(None, make_event("#a", "testadmin", f"{wintermute.nickname}: diag status"))
+    assert bot.connection.sent and bot.connection.sent[0][1].startswith("Diagnostics:")
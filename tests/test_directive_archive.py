@@ -0,0 +1,25 @@
+import sqlite3
+
+from directive_archive import DirectiveArchive
+
+
+def test_kept_runs_fill_digest_days_but_not_the_comparison_baseline(tmp_path):
+    archive = DirectiveArchive(str(tmp_path / "archive.sqlite3"))
+    archive.append("2026-01-01T10:00:00+00:00", "be terse", {"main_topics": ["zfs"]})
+    archive.append("2026-01-02T10:00:00+00:00", "be terse", {"main_topics": ["zfs", "btrfs"]}, kept=True)
+    assert archive.latest()["kept"]
+    assert archive.latest(include_kept=False)["generation_timestamp_utc"].startswith("2026-01-01")
+    assert sorted(archive.latest_per_day()) == ["2026-01-01", "2026-01-02"]
+    archive.close()
+
+
+def test_old_archive_gains_kept_column(tmp_path):
+    path = str(tmp_path / "archive.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE entries (ts TEXT PRIMARY KEY, directive TEXT NOT NULL, analysis BLOB NOT NULL) WITHOUT ROWID")
+    conn.commit()
+    conn.close()
+    archive = DirectiveArchive(path)
+    archive.append("2026-01-01T10:00:00+00:00", "be terse", {})
+    assert archive.latest(include_kept=False)["kept"] is False
+    archive.close()
@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+from conftest import import_bot_module
+
+wintermute = import_bot_module()
+
+
+def replace_directive(path, text):
+    # Same as prompt.generator.py: write a temp file, then swap it in
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"generated_directive": text}, f)
+    os.replace(path + ".tmp", path)
+
+
+def watch_and_replace(tmp_path, monkeypatch, use_inotify):
+    path = str(tmp_path / "current_bot_directive.json")
+    replace_directive(path, "old")
+    changed = threading.Event()
+    watcher = wintermute.DirectiveFileWatcher(path, changed.set, poll_interval=0.05)
+    if not use_inotify:
+        monkeypatch.setattr(watcher, "_open_inotify", lambda: None)
+    watcher.start()
+    try:
+        changed.wait(0.3) # Let the watch settle; nothing has changed yet
+        assert not changed.is_set()
+        replace_directive(path, "new")
+        assert changed.wait(5), "the watcher did not report the replaced file"
+    finally:
+        watcher.stop()
+        watcher.join(5)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+def test_inotify_sees_atomic_replace(tmp_path, monkeypatch):
+    watch_and_replace(tmp_path, monkeypatch, use_inotify=True)
+
+
+def test_polling_fallback_sees_atomic_replace(tmp_path, monkeypatch):
+    watch_and_replace(tmp_path, monkeypatch, use_inotify=False)
+
+
+def test_bot_reloads_replaced_directive(bot):
+    replace_directive(wintermute.DYNAMIC_PROMPT_FILE_PATH, "Speak only in haiku.")
+    bot._load_dynamic_prompt()
+    assert bot.current_personality_directive == "Speak only in haiku."
+    assert bot.directive_version == 1
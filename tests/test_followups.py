@@ -0,0 +1,21 @@
+import pytest
+
+from conftest import import_bot_module
+
+wintermute = import_bot_module()
+
+
+@pytest.mark.parametrize("message", ["yes", "nah", "why?", "tell me more", "really?", "ok thanks", "what about rust"])
+def test_short_replies_are_followups(message):
+    assert wintermute.is_short_followup(message)
+
+
+@pytest.mark.parametrize("message", [
+    "that reminds me, anyone tried nix?",
+    "but seriously my wifi driver keeps dropping on linux",
+    "it is time for lunch, what sandwich should I make",
+    "intel ax200", # Short, but no follow-up marker
+    "yes and also, how do I configure postgres replication", # Marker, but too long
+])
+def test_topic_changes_are_not_followups(message):
+    assert not wintermute.is_short_followup(message)
@@ -0,0 +1,58 @@
+from conftest import import_bot_module, make_event
+import llm_scheduler
+from llm_scheduler import LLMScheduler, MODEL_PRICES_PER_MTOK
+
+
+class FlakyCoordinator:
+    """Shared usage store whose database can be made to fail."""
+
+    def __init__(self):
+        self.failing = False
+        self.totals = (0, 0.0)
+
+    def add_usage(self, day, tokens, usd):
+        if self.failing:
+            return None
+        self.totals = (self.totals[0] + tokens, self.totals[1] + usd)
+        return self.totals
+
+
+def test_busy_coordination_db_does_not_reset_daily_usage():
+    coordinator = FlakyCoordinator()
+    scheduler = LLMScheduler(coordinator)
+    scheduler.record_usage("gpt-4.1-nano", 1000000, 0)
+    coordinator.failing = True
+    scheduler.record_usage("gpt-4.1-nano", 10, 0)
+    assert scheduler.tokens_today == 1000010
+    assert scheduler.spend_today >= 0.1
+
+
+def test_fallback_reply_is_billed_as_the_model_it_calls(bot, providers):
+    wintermute = import_bot_module()
+    providers.reply = "" # Primary fails, so the OpenAI fallback answers
+    bot.on_pubmsg(None, make_event("#a", "alice", f"{wintermute.nickname}: explain monads"))
+    fallback_calls = [c for c in providers.openai_calls if c["model"] == wintermute.FALLBACK_REPLY_MODEL]
+    assert len(fallback_calls) == 1
+    assert wintermute.FALLBACK_REPLY_MODEL in MODEL_PRICES_PER_MTOK
+    for call in providers.openai_calls + providers.anthropic_calls:
+        assert call["model"] in MODEL_PRICES_PER_MTOK
+
+
+def test_drain_drops_the_backlog_once_the_budget_is_spent():
+    scheduler = LLMScheduler()
+    ran = []
+    scheduler.defer("#a", "alice", lambda: ran.append("alice"))
+    scheduler.defer("#b", "bob", lambda: ran.append("bob"))
+    scheduler.record_usage("gpt-4.1-nano", llm_scheduler.DAILY_TOKEN_BUDGET, 0)
+    assert scheduler.drain() == 0
+    assert ran == []
+    assert scheduler.stats()["queued"] == 0
+    assert scheduler.stats()["counters"]["budget_dropped"] == 2
+
+
+def test_drain_stops_when_a_deferred_reply_spends_the_rest_of_the_budget():
+    scheduler = LLMScheduler()
+    spend_it_all = lambda: scheduler.record_usage("gpt-4.1-nano", llm_scheduler.DAILY_TOKEN_BUDGET, 0)
+    scheduler.defer("#a", "alice", spend_it_all)
+    scheduler.defer("#b", "bob", spend_it_all)
+    assert scheduler.drain() == 1
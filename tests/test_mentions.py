@@ -0,0 +1,67 @@
+import pytest
+
+from mentions import DIRECT, MENTION, MentionDetector, parse_channel_aliases_setting
+
+
+@pytest.fixture
+def detector():
+    return MentionDetector("wintermute", aliases=["wm"], known_bots=["relaybot"],
+                           channel_policies={"#quiet": "direct", "#muted": "off"})
+
+
+def test_channel_aliases_setting():
+    assert parse_channel_aliases_setting("#linux=tux|penguin, #rust=ferris,#empty=,junk") == {
+        "#linux": ["tux", "penguin"], "#rust": ["ferris"]}
+    assert parse_channel_aliases_setting("") == {}
+
+
+def test_channel_alias_only_answers_in_its_channel():
+    detector = MentionDetector("wintermute", channel_aliases=parse_channel_aliases_setting("#Linux=tux"))
+    assert detector.classify("#linux", "alice", "tux: what is a kernel") is not None
+    assert detector.classify("#rust", "alice", "tux: what is a kernel") is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("wintermute: what time is it", DIRECT),
+    ("Wintermute, what time is it", DIRECT),
+    ("@wintermute: ping", DIRECT),
+    ("wm: ping", DIRECT),
+    ("i asked wintermute about it", MENTION),
+    ("is that wintermute's answer?", MENTION),
+    ("hey @wintermute", MENTION),
+])
+def test_addressed_and_mentioned(detector, text, expected):
+    assert detector.classify("#a", "alice", text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "the wintermutes of this world",
+    "wintermute_bot is another bot",
+    "see https://example.org/wintermute/docs",
+    "www.wintermute.example is down",
+    "<bob> wintermute: what time is it",
+    "[discord] <bob> wintermute: hi",
+    "[12:01] <bob> wintermute: hi",
+    "12:01 <bob> hello wintermute",
+])
+def test_not_triggered(detector, text):
+    assert detector.classify("#a", "alice", text) is None
+
+
+def test_known_bots_never_trigger(detector):
+    assert detector.classify("#a", "RelayBot", "wintermute: hi") is None
+    assert detector.stats()["suppressed_bot"] == 1
+
+
+def test_direct_policy_ignores_plain_mentions(detector):
+    assert detector.classify("#quiet", "alice", "wintermute: hi") == DIRECT
+    assert detector.classify("#Quiet", "alice", "i asked wintermute") is None
+
+
+def test_off_policy_ignores_everything(detector):
+    assert detector.classify("#muted", "alice", "wintermute: hi") is None
+
+
+def test_strip_address(detector):
+    assert detector.strip_address("wintermute:  what time is it ") == "what time is it"
+    assert detector.strip_address("alice: wintermute is slow") == "alice: wintermute is slow"
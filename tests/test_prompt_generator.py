@@ -0,0 +1,42 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+spec = importlib.util.spec_from_file_location(
+    "prompt_generator", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "prompt.generator.py"))
+prompt_generator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(prompt_generator)
+
+
+@pytest.fixture
+def generator(tmp_path, monkeypatch):
+    monkeypatch.setattr(prompt_generator, "ARCHIVE_DB_PATH", str(tmp_path / "archive.sqlite3"))
+    monkeypatch.setattr(prompt_generator, "ARCHIVE_DIR_PATH", str(tmp_path / "directive_archive"))
+    monkeypatch.setattr(prompt_generator, "GENERATION_DECISIONS_LOG_PATH", str(tmp_path / "decisions.jsonl"))
+    return prompt_generator
+
+
+def test_skipped_run_is_archived_without_moving_the_baseline(generator):
+    archive = generator.open_directive_archive()
+    archive.append("2026-01-01T10:00:00+00:00", "be terse", {"main_topics": ["zfs"]})
+    archive.close()
+    generator.archive_kept_analysis({"main_topics": ["zfs", "btrfs"]})
+    archive = generator.open_directive_archive()
+    latest = archive.latest()
+    archive.close()
+    assert latest["kept"] and latest["generated_directive"] == "be terse"
+    assert generator.load_last_archived_analysis()[0] == {"main_topics": ["zfs"]}
+
+
+def test_decision_log_is_rotated(generator, monkeypatch):
+    monkeypatch.setattr(generator, "GENERATION_DECISIONS_LOG_MAX_BYTES", 100)
+    for i in range(10):
+        generator.record_generation_decision({"decision": "skip", "run": i})
+    path = generator.GENERATION_DECISIONS_LOG_PATH
+    assert os.path.getsize(path) <= 100 + 40
+    with open(path + ".1", encoding='utf-8') as f:
+        assert json.loads(f.readline())["decision"] == "skip"
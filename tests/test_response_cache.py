@@ -0,0 +1,69 @@
+from conftest import import_bot_module, make_event
+
+wintermute = import_bot_module()
+
+QUESTION = "what is the capital of france"
+
+
+def ask(bot, channel, nick):
+    bot.on_pubmsg(None, make_event(channel, nick, f"{wintermute.nickname}: {QUESTION}"))
+
+
+def test_repeated_question_in_same_channel_hits_cache(bot, providers):
+    ask(bot, "#a", "alice")
+    ask(bot, "#a", "bob")
+    assert len(providers.anthropic_calls) == 1
+    assert wintermute.response_cache.stats()["hits"] == 1
+
+
+def test_same_question_in_another_channel_misses_cache(bot, providers):
+    ask(bot, "#a", "alice")
+    ask(bot, "#b", "bob")
+    assert len(providers.anthropic_calls) == 2
+    assert wintermute.response_cache.stats()["hits"] == 0
+
+
+def test_scope_includes_channel():
+    scope_a = wintermute.ResponseCache.make_scope("#a", "general", 0)
+    scope_b = wintermute.ResponseCache.make_scope("#B", "general", 0)
+    assert scope_a != scope_b
+    assert wintermute.ResponseCache.make_scope("#A", "general", 0) == scope_a
+
+
+def test_near_miss_questions_do_not_share_answers():
+    cache = wintermute.ResponseCache()
+    scope = wintermute.ResponseCache.make_scope("#a", "general", 0)
+    cache.put("how do I install python 3.11 on ubuntu 22.04", scope, "use deadsnakes for 3.11", 100)
+    cache.put("what was the population of france in 2020 according to insee", scope, "about 67 million", 100)
+    for question in ("how do I install python 3.12 on ubuntu 22.04",
+                     "what was the population of germany in 2020 according to insee",
+                     "what was not the population of france in 2020 according to insee"):
+        assert cache.get(question, scope) is None, question
+    assert cache.stats()["hits"] == 0
+
+
+def test_rephrasing_that_only_drops_filler_still_hits():
+    cache = wintermute.ResponseCache()
+    scope = wintermute.ResponseCache.make_scope("#a", "general", 0)
+    cache.put("what's the capital of france", scope, "Paris", 100)
+    assert cache.get("hey what is capital of France please", scope) == "Paris"
+
+
+def test_cache_hit_skips_classification_and_rate_limits(bot, providers, monkeypatch):
+    ask(bot, "#a", "alice")
+    assert len(providers.openai_calls) == 1
+    monkeypatch.setattr(wintermute.llm_scheduler, "admit_message", lambda channel, nick: False)
+    ask(bot, "#a", "bob")
+    assert len(providers.openai_calls) == 1 # No topic call for the cached answer
+    assert len(providers.anthropic_calls) == 1
+    assert wintermute.response_cache.stats()["hits"] == 1
+    assert bot.connection.sent[-1] == ("#a", "bob: a reply")
+
+
+def test_cache_hit_is_logged_like_a_reply(bot, providers):
+    ask(bot, "#a", "alice")
+    ask(bot, "#a", "bob")
+    with open(wintermute.LOG_FILENAME, encoding='utf-8') as f:
+        log = f.read()
+    assert log.count("RESPONSE:\na reply") == 2
+    assert "(response cache hit)\nbob: " + QUESTION in log
@@ -0,0 +1,109 @@
+import json
+import time
+import types
+
+import pytest
+
+from conftest import import_bot_module
+import supervisor
+from supervisor import load_config
+
+
+def write_config(tmp_path, shards):
+    path = tmp_path / "shards.json"
+    path.write_text(json.dumps({"coordination_db": str(tmp_path / "coordination.sqlite3"), "shards": shards}))
+    return str(path)
+
+
+def test_same_nick_on_same_server_is_rejected(tmp_path):
+    path = write_config(tmp_path, [
+        {"name": "a", "server": "irc.net1.org", "channels": ["#a"], "nickname": "wm"},
+        {"name": "b", "server": "IRC.net1.org", "channels": ["#b"], "env": {"IRC_BOT_NICKNAME": "WM"}},
+    ])
+    with pytest.raises(ValueError, match="both use nick"):
+        load_config(path)
+
+
+def test_same_nick_on_other_servers_is_allowed(tmp_path):
+    path = write_config(tmp_path, [
+        {"name": "a", "server": "irc.net1.org", "channels": ["#a"], "nickname": "wm"},
+        {"name": "b", "server": "irc.net2.org", "channels": ["#b"], "nickname": "wm"},
+        {"name": "c", "server": "irc.net1.org", "channels": ["#c"], "nickname": "wm2"},
+    ])
+    assert len(load_config(path)["shards"]) == 3
+
+
+class RecordingCoordinator:
+    def __init__(self):
+        self.beats = []
+
+    def heartbeat(self, pid, status="ok", channels=()):
+        self.beats.append(status)
+
+
+def run_heartbeat(reactor_age):
+    wintermute = import_bot_module()
+    bot = types.SimpleNamespace(last_reactor_tick=time.time() - reactor_age, channels_list=["#a"],
+                                coordinator=RecordingCoordinator(),
+                                connection=types.SimpleNamespace(is_connected=lambda: True))
+    thread = wintermute.HeartbeatThread(bot, interval=0.01, stall_seconds=60)
+    thread.start()
+    time.sleep(0.1)
+    thread.stop()
+    thread.join()
+    return bot.coordinator.beats
+
+
+def test_heartbeat_continues_while_reactor_waits_on_a_model():
+    beats = run_heartbeat(reactor_age=30)
+    assert beats and set(beats) == {"busy"}
+
+
+def test_heartbeat_stops_when_reactor_is_hung():
+    assert run_heartbeat(reactor_age=120) == []
+
+
+class FakeProcess:
+    pid = 4242
+
+    def __init__(self):
+        self.killed = False
+
+    def poll(self):
+        return -9 if self.killed else None
+
+    def kill(self):
+        self.killed = True
+
+    def wait(self, timeout=None):
+        return -9
+
+
+def running_shard(now):
+    shard = supervisor.Shard({"name": "a", "server": "irc.net1.org", "channels": ["#a"]}, "unused.sqlite3")
+    shard.process = FakeProcess()
+    shard.started_at = now - supervisor.STARTUP_GRACE_SECONDS - 1
+    return shard
+
+
+def test_sustained_disconnect_restarts_the_worker(monkeypatch):
+    now = time.time()
+    shard = running_shard(now)
+    process = shard.process
+    beat = {"pid": process.pid, "age_seconds": 5, "status": "disconnected"}
+    shard.check(beat)
+    assert shard.process is process # A short disconnect is left to the irc library's reconnect
+    monkeypatch.setattr(supervisor.time, "time", lambda: now + supervisor.DISCONNECTED_RESTART_SECONDS + 1)
+    shard.check(beat)
+    assert process.killed and shard.process is None and shard.restarts == 1
+
+
+def test_reconnect_resets_the_disconnect_timer(monkeypatch):
+    now = time.time()
+    shard = running_shard(now)
+    process = shard.process
+    shard.check({"pid": process.pid, "age_seconds": 5, "status": "disconnected"})
+    shard.check({"pid": process.pid, "age_seconds": 5, "status": "ok"})
+    monkeypatch.setattr(supervisor.time, "time", lambda: now + supervisor.DISCONNECTED_RESTART_SECONDS + 1)
+    shard.check({"pid": process.pid, "age_seconds": 5, "status": "disconnected"})
+    assert not process.killed
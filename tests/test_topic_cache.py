@@ -0,0 +1,39 @@
+import pytest
+
+from conftest import import_bot_module
+
+wintermute = import_bot_module()
+fingerprint = wintermute.TopicClassificationCache.fingerprint
+
+
+@pytest.mark.parametrize("a, b", [
+    ("lolll", "lol"),
+    ("LOL!!!", "lol"),
+    ("what is rust?", "What is Rust"),
+    ("soooo good", "so good"),
+])
+def test_equivalent_messages_share_a_fingerprint(a, b):
+    assert fingerprint(a) == fingerprint(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("100", "10"),
+    ("2000", "20"),
+    ("good", "god"),
+    ("c++", "c"),
+    ("c#", "c"),
+    ("привет как дела", "что нового"),
+    ("日本語", "中文"),
+    ("café", "cafe"),
+])
+def test_distinct_messages_keep_distinct_fingerprints(a, b):
+    assert fingerprint(a) != fingerprint(b)
+
+
+def test_non_ascii_is_kept():
+    assert fingerprint("Привет!") == "привет"
+
+
+def test_cache_keys_differ_for_different_scripts():
+    cache = wintermute.TopicClassificationCache()
+    assert cache.make_key("привет", ["general"], "") != cache.make_key("你好", ["general"], "")
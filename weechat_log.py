@@ -0,0 +1,185 @@
+###
+# Shared WeeChat log parsing for prompt.generator.py, channel_memory.py and the benchmarks.
+#
+# Line format: YYYY-MM-DD HH:MM:SS<TAB><PREFIX_NICK><TAB><MESSAGE>
+#   2025-03-27 01:02:17	@test	test2: Do you read
+#   2025-05-21 00:09:22	-->	test (test@test-tf7.tf0.3tvs21.IP) has joined #channelName
+# Timestamps are parsed by fixed offsets (no strptime) and system lines are classified
+# with a dict lookup on the prefix field instead of a chain of startswith checks.
+###
+
+import os
+import time
+from array import array
+from collections import namedtuple
+
+# Record kinds
+MESSAGE = "message"
+ACTION = "action" # /me
+JOIN = "join"
+PART = "part"
+QUIT = "quit"
+NICK = "nick"
+MODE = "mode"
+NETWORK = "network" # Other "--" lines: topic changes, netsplits, notices
+SERVER = "server" # Lines whose prefix is the server itself
+SYSTEM = "system" # "***" buffer markers and other non-chat lines
+
+CHAT_KINDS = frozenset((MESSAGE, ACTION))
+
+LogRecord = namedtuple("LogRecord", "ts kind nick message") # ts: unix epoch seconds (local time log)
+
+NICK_PREFIX_CHARS = "~&@%+ "
+SENDER_KINDS = {"-->": JOIN, "<--": PART, "--": NETWORK, "---": NETWORK, "*": ACTION, " *": ACTION}
+
+_hour_epoch_cache = {}
+
+
+def _hour_epoch(hour_key):
+    """Epoch of 'YYYY-MM-DD HH' in local time, cached; exact across DST changes."""
+    epoch = _hour_epoch_cache.get(hour_key)
+    if epoch is None:
+        if len(_hour_epoch_cache) > 100000:
+            _hour_epoch_cache.clear()
+        epoch = time.mktime((int(hour_key[0:4]), int(hour_key[5:7]), int(hour_key[8:10]),
+                             int(hour_key[11:13]), 0, 0, 0, 0, -1))
+        _hour_epoch_cache[hour_key] = epoch
+    return epoch
+
+
+def parse_timestamp(line):
+    """Epoch seconds for a line starting with 'YYYY-MM-DD HH:MM:SS', or None."""
+    if len(line) < 19 or line[4] != '-' or line[13] != ':' or line[16] != ':':
+        return None
+    try:
+        return _hour_epoch(line[0:13]) + int(line[14:16]) * 60 + int(line[17:19])
+    except ValueError:
+        return None
+
+
+def parse_line(line, server_names=()):
+    """Parses one log line into a LogRecord, or returns None for lines that are not log entries."""
+    if len(line) < 21 or line[19] != '\t':
+        return None
+    ts = parse_timestamp(line)
+    if ts is None:
+        return None
+    sender_end = line.find('\t', 20)
+    if sender_end < 0:
+        return None
+    sender_field = line[20:sender_end]
+    message = line[sender_end + 1:].strip()
+    if not message:
+        return None
+
+    kind = SENDER_KINDS.get(sender_field) or SENDER_KINDS.get(sender_field.strip())
+    if kind is None:
+        if server_names and any(name in sender_field for name in server_names):
+            return LogRecord(ts, SERVER, sender_field.strip(), message)
+        if message.startswith("***"):
+            return LogRecord(ts, SYSTEM, None, message)
+        nick = sender_field.lstrip(NICK_PREFIX_CHARS).rstrip()
+        if not nick:
+            return None
+        return LogRecord(ts, MESSAGE, nick, message)
+
+    if kind == ACTION:
+        nick, _, action = message.partition(' ')
+        return LogRecord(ts, ACTION, nick, action)
+    if kind == PART and "has quit" in message:
+        kind = QUIT
+    elif kind == NETWORK:
+        if message.startswith("Mode "):
+            kind = MODE
+        elif " is now known as " in message:
+            kind = NICK
+    return LogRecord(ts, kind, message.partition(' ')[0], message)
+
+
+def iter_records(lines, kinds=None, server_names=(), skip_nicks=()):
+    """Yields LogRecords from an iterable of lines, optionally keeping only `kinds`."""
+    skip_nicks = frozenset(n.lower() for n in skip_nicks)
+    for line in lines:
+        record = parse_line(line, server_names)
+        if record is None or (kinds is not None and record.kind not in kinds):
+            continue
+        if skip_nicks and record.nick and record.nick.lower() in skip_nicks:
+            continue
+        yield record
+
+
+def format_chat_record(record):
+    """'nick: message' as sent to the analysis model; actions read as '* nick does something'."""
+    if record.kind == ACTION:
+        return f"* {record.nick} {record.message}"
+    return f"{record.nick}: {record.message}"
+
+
+def _seek_line_start(f, pos):
+    """Moves to the first line that starts at or after byte `pos`."""
+    if pos == 0:
+        f.seek(0)
+        return
+    f.seek(pos - 1)
+    f.readline() # Consumes the rest of the line containing pos-1 (just the newline if pos is a line start)
+
+
+def find_offset_since(f, since_ts):
+    """
+    Positions binary file `f` at the first line with ts >= since_ts and returns the offset.
+    Bisects on byte positions (logs are append-only, so timestamps are ordered), so only
+    O(log n) lines are read however large the log is.
+    """
+    f.seek(0, os.SEEK_END)
+    low, high = 0, f.tell()
+    while low < high:
+        mid = (low + high) // 2
+        _seek_line_start(f, mid)
+        ts = None
+        while ts is None:
+            raw_line = f.readline()
+            if not raw_line:
+                break
+            ts = parse_timestamp(raw_line[:19].decode('ascii', errors='replace'))
+        if ts is None or ts >= since_ts:
+            high = mid
+        else:
+            low = mid + 1
+    _seek_line_start(f, low)
+    return f.tell()
+
+
+def read_records_since(log_file_path, since_ts=None, kinds=CHAT_KINDS, server_names=(), skip_nicks=()):
+    """Yields records from `log_file_path` newer than `since_ts` without reading older lines."""
+    skip_nicks = frozenset(n.lower() for n in skip_nicks)
+    with open(log_file_path, 'rb') as f:
+        if since_ts is not None:
+            find_offset_since(f, since_ts)
+        for raw_line in f:
+            record = parse_line(raw_line.decode('utf-8', errors='replace'), server_names)
+            if record is None or (kinds is not None and record.kind not in kinds):
+                continue
+            if since_ts is not None and record.ts < since_ts:
+                continue
+            if skip_nicks and record.nick and record.nick.lower() in skip_nicks:
+                continue
+            yield record
+
+
+def parse_columns(lines, kinds=None, server_names=()):
+    """
+    Columnar variant for bulk statistics: returns {"ts": array('d'), "kind": [...],
+    "nick": [...], "message": [...]} with one position per kept record.
+    """
+    columns = {"ts": array('d'), "kind": [], "nick": [], "message": []}
+    append_ts, append_kind = columns["ts"].append, columns["kind"].append
+    append_nick, append_message = columns["nick"].append, columns["message"].append
+    for line in lines:
+        record = parse_line(line, server_names)
+        if record is None or (kinds is not None and record.kind not in kinds):
+            continue
+        append_ts(record.ts)
+        append_kind(record.kind)
+        append_nick(record.nick)
+        append_message(record.message)
+    return columns
@@ -10,14 +10,23 @@ import irc.client
 import re
 import time
 import datetime
-import openai
-import anthropic
 import json
 import signal
 import sys 
 import random
+import hashlib
+import threading
+import select
+import struct
+import ctypes
+import ctypes.util
 from dotenv import load_dotenv 
-from collections import defaultdict, deque 
+from collections import defaultdict, deque, OrderedDict
+from channel_memory import ChannelMemoryIndex
+from coordination import Coordinator
+from llm_scheduler import LLMScheduler, BUDGET_OK, BUDGET_EXHAUSTED
+from mentions import MentionDetector, DIRECT, parse_channel_list_setting, parse_channel_aliases_setting
+from diagnostics import Diagnostics
 load_dotenv()
 # ============== Configuration and Secrets ==============
 password = os.getenv('IRC_BOT_PASSWORD', 'botpass')
@@ -26,6 +35,19 @@ account_name = os.getenv('IRC_ACCOUNT_NAME', 'wintermute')
 server = os.getenv('IRC_SERVER', 'irc.ircServer.org')
 port = int(os.getenv('IRC_PORT', 6667))
 channels = os.getenv('IRC_CHANNELS', '#ircChanName').split(',')
+# Set by supervisor.py when running as one of several workers; unset means a standalone bot
+SHARD_NAME = os.getenv('WINTERMUTE_SHARD_NAME', server)
+COORDINATION_DB_PATH = os.getenv('WINTERMUTE_COORDINATION_DB')
+# Admins by nick and/or by services account (accounts can't be spoofed by taking a nick; needs IRCv3 account-tag)
+ADMIN_NICKS = {n.strip().lower() for n in os.getenv('WINTERMUTE_ADMINS', '').split(',') if n.strip()}
+ADMIN_ACCOUNTS = {a.strip().lower() for a in os.getenv('WINTERMUTE_ADMIN_ACCOUNTS', '').split(',') if a.strip()}
+if not ADMIN_NICKS and not ADMIN_ACCOUNTS:
+    print("WARNING: Neither WINTERMUTE_ADMINS nor WINTERMUTE_ADMIN_ACCOUNTS is set; admin commands are disabled.")
+# Other names the bot answers to, other bots/relays it never answers, and per-channel "all" / "direct" / "off"
+BOT_ALIASES = [a.strip() for a in os.getenv('WINTERMUTE_ALIASES', '').split(',') if a.strip()]
+KNOWN_BOTS = [n.strip() for n in os.getenv('WINTERMUTE_KNOWN_BOTS', '').split(',') if n.strip()]
+CHANNEL_MENTION_POLICY = parse_channel_list_setting(os.getenv('WINTERMUTE_MENTION_POLICY', ''))
+CHANNEL_ALIASES = parse_channel_aliases_setting(os.getenv('WINTERMUTE_CHANNEL_ALIASES', '')) # Names answered only in that channel
 
 ANTHROPIC_API_KEY_LOADED = os.getenv('ANTHROPIC_API_KEY')
 OPENAI_API_KEY_WINTERMUTE_LOADED = os.getenv('OPENAI_API_KEY_WINTERMUTE') 
@@ -35,15 +57,89 @@ if not ANTHROPIC_API_KEY_LOADED:
 if not OPENAI_API_KEY_WINTERMUTE_LOADED:
     print("WARNING: OPENAI_API_KEY_WINTERMUTE not found in .env or environment.")
 
-openai.api_key = OPENAI_API_KEY_WINTERMUTE_LOADED
-
-anthropic_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY_LOADED)
+# Provider SDKs are imported on first use (or warmed up after connecting); they dominate startup time
+_provider_clients = {}
+_provider_lock = threading.Lock()
+
+def get_openai():
+    with _provider_lock:
+        if "openai" not in _provider_clients:
+            import openai
+            openai.api_key = OPENAI_API_KEY_WINTERMUTE_LOADED
+            _provider_clients["openai"] = openai
+        return _provider_clients["openai"]
+
+def get_anthropic_client():
+    with _provider_lock:
+        if "anthropic" not in _provider_clients:
+            import anthropic
+            _provider_clients["anthropic"] = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY_LOADED)
+        return _provider_clients["anthropic"]
+
+def preload_provider_sdks():
+    """Runs in a background thread once connected, so the first reply doesn't pay for the imports."""
+    started = time.perf_counter()
+    try:
+        get_openai()
+        get_anthropic_client()
+        print(f"## Provider SDKs loaded in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    except Exception as e:
+        print(f"## Could not preload provider SDKs: {e}")
 
 LOG_FILENAME = "wintermute_logs.txt"
 TOPIC_EXPIRY_SECONDS = 30 * 60
 
-DYNAMIC_PROMPT_FILE_PATH = os.path.join(os.path.dirname(__file__), "current_bot_directive.json") # Assumes file is in same dir
-PROMPT_FILE_POLL_INTERVAL_SECONDS = 5 * 60 # Check every 5 minutes
+DYNAMIC_PROMPT_FILE_PATH = os.getenv('WINTERMUTE_DIRECTIVE_FILE') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "current_bot_directive.json") # Shared by all shards unless overridden
+DIRECTIVE_WATCH_POLL_SECONDS = 2 # mtime polling interval when inotify is unavailable
+HEARTBEAT_INTERVAL_SECONDS = 15 # Shard heartbeat + shared ignore list refresh (supervised mode only)
+REACTOR_STALL_SECONDS = 10 * 60 # Model calls block the reactor; only a reactor silent this long stops the heartbeat
+LLM_QUEUE_DRAIN_SECONDS = 2 # How often deferred (rate-limited) replies are retried
+# Model names are used for both the call and its budget accounting (llm_scheduler.MODEL_PRICES_PER_MTOK)
+TOPIC_MODEL = "gpt-4.1-nano"
+REPLY_MODEL = "claude-sonnet-4-20250514"
+FALLBACK_REPLY_MODEL = "gpt-4.1-mini"
+REPLY_MAX_TOKENS = 400
+REPLY_MAX_TOKENS_DEGRADED = 150 # Used once the daily budget is tight
+
+TOPIC_CACHE_MAX_ENTRIES = 2048 # Bounded LRU of topic classifications, shared by all channels
+TOPIC_CACHE_TTL_SECONDS = 10 * 60
+FINGERPRINT_WORD_PATTERN = re.compile(r'\w+[+#]*')
+FINGERPRINT_REPEAT_PATTERN = re.compile(r'([^\W\d_])\1{2,}')
+
+RESPONSE_CACHE_MAX_ENTRIES = 512 # Whole replies to repeated, self-contained questions
+RESPONSE_CACHE_TTL_SECONDS = 30 * 60
+RESPONSE_CACHE_FILLER_WORDS = {"a", "an", "the", "is", "are", "please", "pls", "hey", "so", "um", "again"}
+CONTEXT_DEPENDENT_PATTERN = re.compile( # Questions leaning on the conversation so far never get a cached answer
+    r"\b(that|this|it|those|these|he|she|they|him|her|them|his|their|more|else|above|earlier|previous|same|you said)\b",
+    re.IGNORECASE,
+)
+
+BOT_TURN_HISTORY = 5 # Outgoing replies remembered per channel
+FOLLOWUP_WINDOW_SECONDS = 3 * 60 # Short replies within this window continue our last topic
+FOLLOWUP_MAX_WORDS = 4 # A follow-up must be this short *and* open with one of the markers below
+FOLLOWUP_PATTERN = re.compile( # No generic openers (and/but/it/this/that): they start new topics just as often
+    r"^(yes|yeah|yep|no|nah|nope|ok|okay|sure|really|why|how so|lol|haha|thanks|thx|"
+    r"tell me more|more|elaborate|explain|what about)\b",
+    re.IGNORECASE,
+)
+
+MEMORY_INDEX_DB_PATH = os.path.join(os.path.dirname(__file__), "channel_memory.sqlite3") # Shared with prompt.generator.py
+MEMORY_CONTEXT_TOKEN_BUDGET = 250 # Extra tokens allowed for recalled past exchanges
+MEMORY_RECENT_EXCLUSION_SECONDS = 60 * 60 # Recent history is already covered by the normal context
+RECALL_PATTERN = re.compile(
+    r"\b(remember (when|that|the time|how)|do you recall|last (week|month|year|time)|back when|that time)\b",
+    re.IGNORECASE,
+)
+
+CONTEXT_TOKEN_BUDGET = 600 # Approx tokens for history + current question sent with each reply
+CONTEXT_RECENCY_HALF_LIFE_SECONDS = 10 * 60
+CONTEXT_MIN_SCORE = 0.6 # Candidates scoring below this are left out even if budget remains
+CONTEXT_STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "your", "with", "this", "that", "have", "was",
+    "what", "when", "where", "who", "why", "how", "can", "does", "did", "just", "about", "they", "there",
+    "from", "its", "it's", "i'm", "don't", "like", "would", "could", "should", "will", "been", nickname.lower(),
+}
 
 user_topics = defaultdict(lambda: defaultdict(list))
 topic_threads = defaultdict(lambda: defaultdict(lambda: {
@@ -60,8 +156,8 @@ def normalize_topic_label(label):
     label = label.strip('-')
     return label
 
-def get_active_topic_list(channel):
-    now = time.time()
+def get_active_topic_list(channel, now=None):
+    now = time.time() if now is None else now
     topics = []
     for t, v in topic_threads.get(channel, {}).items():
         if now - v['last_active'] < TOPIC_EXPIRY_SECONDS:
@@ -69,7 +165,187 @@ def get_active_topic_list(channel):
     return topics
 
 
-def openai_api_request_topic(message_to_assign, current_topics, bot_last_message_text, user_nick):
+class TopicClassificationCache:
+    """Thread-safe LRU/TTL cache of topic labels keyed on message shape + topic context."""
+
+    def __init__(self, max_entries=TOPIC_CACHE_MAX_ENTRIES, ttl_seconds=TOPIC_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (topic, stored_at, call_ms)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    @staticmethod
+    def fingerprint(message):
+        # Words in any script; a trailing "+"/"#" stays so "c++" and "c#" are not "c"
+        words = FINGERPRINT_WORD_PATTERN.findall(message.casefold())
+        # Only runs of 3+ letters are squashed: "lolll" == "lol", but "good", "100" and "2000" are kept
+        return ' '.join(FINGERPRINT_REPEAT_PATTERN.sub(r'\1', word) for word in words)
+
+    def make_key(self, message, current_topics, bot_last_message_text):
+        # The topic set and the bot's last message are part of the key, so any change to
+        # either makes older entries unreachable; they then age out through TTL/LRU.
+        topic_part = '\x1f'.join(sorted(set(current_topics)))
+        raw = '\x1e'.join((self.fingerprint(message), topic_part, self.fingerprint(bot_last_message_text or '')))
+        return hashlib.sha1(raw.encode('utf-8')).digest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            topic, stored_at, call_ms = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += call_ms
+            return topic
+
+    def peek(self, key):
+        """The cached topic for `key` without touching LRU order or the hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.time() - entry[1] > self.ttl_seconds:
+            return None
+        return entry[0]
+
+    def put(self, key, topic, call_ms):
+        with self._lock:
+            self._entries[key] = (topic, time.time(), call_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "saved_calls": self.hits,
+                "saved_ms": round(self.saved_ms, 1),
+            }
+
+topic_cache = TopicClassificationCache()
+llm_scheduler = LLMScheduler() # Every model call goes through this; limits are in llm_scheduler.py
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU/TTL cache of whole replies. Entries are scoped by server, channel, topic,
+    directive version and date, and matched only by the exact normalized question: a near match
+    ("python 3.11" vs "python 3.12", "france" vs "germany") is a different question.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # (scope, normalized question) -> (response, stored_at, call_ms)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.saved_ms = 0.0
+
+    @staticmethod
+    def normalize(question):
+        """Lowercased words in order, contractions expanded, filler dropped; "" if nothing is left."""
+        text = re.sub(r"'s\b", " is", question.lower())
+        text = re.sub(r"'re\b", " are", text)
+        return ' '.join(w for w in TopicClassificationCache.fingerprint(text).split() if w not in RESPONSE_CACHE_FILLER_WORDS)
+
+    @staticmethod
+    def make_scope(channel, topic, directive_version):
+        # Topic labels like "general" exist in every channel, so the server and channel keep replies
+        # from leaking between them. The date keeps answers like "what's the date" from going stale overnight.
+        return (server, channel.lower(), topic, directive_version, datetime.date.today().isoformat())
+
+    def get(self, question, scope):
+        key = (scope, self.normalize(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            response, stored_at, call_ms = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += call_ms
+            return response
+
+    def put(self, question, scope, response, call_ms):
+        normalized = self.normalize(question)
+        if not normalized:
+            return
+        with self._lock:
+            key = (scope, normalized)
+            self._entries[key] = (response, time.time(), call_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def note_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def clear(self):
+        with self._lock:
+            flushed = len(self._entries)
+            self._entries.clear()
+            return flushed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+            }
+
+response_cache = ResponseCache()
+mention_detector = MentionDetector(nickname, BOT_ALIASES, CHANNEL_ALIASES, CHANNEL_MENTION_POLICY, KNOWN_BOTS)
+diagnostics = Diagnostics() # Profiler, memory snapshots and message timings; idle until an admin starts them
+
+
+def record_llm_usage(model, usage):
+    """Feeds a response's token usage (OpenAI or Anthropic shape) into the daily budget."""
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0
+    output_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0
+    llm_scheduler.record_usage(model, input_tokens, output_tokens)
+
+
+def openai_api_request_topic(message_to_assign, current_topics, bot_last_message_text, user_nick, channel=None):
+    cache_key = topic_cache.make_key(message_to_assign, current_topics, bot_last_message_text)
+    cached_topic = topic_cache.get(cache_key)
+    if cached_topic is not None:
+        return cached_topic
+    if llm_scheduler.budget_state() != BUDGET_OK or not llm_scheduler.acquire_provider("openai"):
+        # Topic labels are the cheapest thing to degrade; the reply budget is worth more
+        llm_scheduler.note_degraded("local_topic")
+        return assign_topic_locally(channel, message_to_assign, current_topics)
+
     system_prompt = (
         "You are an IRC bot helping organize conversations by topic. Your goal is to assign the 'User's current message' to an appropriate topic label.\n"
         "Key Instructions:\n"
@@ -93,8 +369,9 @@ Considering all the above, especially whether the user's message is a follow-up
 Topic label:"""
 
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-nano",
+        call_started = time.perf_counter()
+        response = get_openai().chat.completions.create(
+            model=TOPIC_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt_content}
@@ -105,15 +382,72 @@ Topic label:"""
             frequency_penalty=0,
             presence_penalty=0,
         )
+        record_llm_usage(TOPIC_MODEL, getattr(response, "usage", None))
         topic = response.choices[0].message.content.strip()
-        topic = normalize_topic_label(topic) 
-        return topic if topic else "general" 
+        topic = normalize_topic_label(topic)
+        topic = topic if topic else "general"
+        # Only successful classifications are cached; the error fallback below is not.
+        topic_cache.put(cache_key, topic, (time.perf_counter() - call_started) * 1000)
+        return topic
     except Exception as e:
         print(f"ERROR in openai_api_request_topic: {e}") 
         return "general" # Fallback topic
 
-def expire_old_threads(channel):
-    now = time.time()
+def assign_message_topic(channel, nick, message, last_turn, now, classifier=None):
+    """
+    The topic-assignment stage of a reply. A short reply to what we just told this user stays on
+    that topic without a classifier call; anything else goes to `classifier` (default:
+    openai_api_request_topic). Returns (topic, current_topics, is_followup).
+    benchmarks/eval_topic_assignment.py replays logs through this with other classifiers.
+    """
+    if last_turn and now - last_turn["ts"] > TOPIC_EXPIRY_SECONDS:
+        last_turn = None
+    current_topics = get_active_topic_list(channel, now)
+    is_followup = bool(last_turn and last_turn["topic"] in current_topics and last_turn["nick"] == nick
+                       and now - last_turn["ts"] < FOLLOWUP_WINDOW_SECONDS and is_short_followup(message))
+    if is_followup:
+        return last_turn["topic"], current_topics, True
+    bot_last_message_text = last_turn["text"] if last_turn else ""
+    topic = (classifier or openai_api_request_topic)(message, current_topics, bot_last_message_text, nick, channel)
+    return topic, current_topics, False
+
+def predict_topic(channel, message, last_turn, now):
+    """
+    The topic `message` would most likely be assigned, without a model call: a cached classification
+    if there is one, else the channel's most recently active topic. Used to scope response cache lookups.
+    """
+    if last_turn and now - last_turn["ts"] > TOPIC_EXPIRY_SECONDS:
+        last_turn = None
+    current_topics = get_active_topic_list(channel, now)
+    cached_topic = topic_cache.peek(topic_cache.make_key(message, current_topics, last_turn["text"] if last_turn else ""))
+    if cached_topic is not None:
+        return cached_topic
+    threads = topic_threads.get(channel, {})
+    newest = max((t for t in threads if normalize_topic_label(t) in current_topics),
+                 key=lambda t: threads[t]["last_active"], default=None)
+    return newest or "general"
+
+def assign_topic_locally(channel, message, current_topics):
+    """Model-free topic choice: the active topic whose label and recent lines share the most words."""
+    words = _context_words(message)
+    best_topic, best_overlap = None, 0
+    for topic in current_topics:
+        thread_words = _context_words(topic.replace('-', ' '))
+        if channel is not None and topic in topic_threads.get(channel, {}):
+            for _, _, msg in list(topic_threads[channel][topic]["messages"])[-8:]:
+                thread_words |= _context_words(msg)
+        overlap = len(words & thread_words)
+        if overlap > best_overlap:
+            best_topic, best_overlap = topic, overlap
+    if best_topic:
+        return best_topic
+    # Nothing in common: a short reply most likely continues the newest topic
+    if current_topics and is_short_followup(message):
+        return current_topics[0]
+    return "general"
+
+def expire_old_threads(channel, now=None):
+    now = time.time() if now is None else now
 
     channel_data = topic_threads[channel] # This is safe, creates if not exists.
     expired = [t for t, d in list(channel_data.items()) if now - d["last_active"] > TOPIC_EXPIRY_SECONDS] ## list() for safe iteration if deleting
@@ -137,74 +471,225 @@ def update_topic_threads(channel, topic, nick, message, ts):
     topic_data["messages"].append((ts, nick, message)) 
     topic_data["last_active"] = ts
 
-def get_topic_conversation_snippet(channel, topic, n=8):
-    msgs = list(topic_threads[channel][topic]["messages"])[-n:]
-    out = []
-    for (_, nick, msg) in msgs:
-        out.append(f"{nick}: {msg}")
-    return "\n".join(out)
+class CommandRegistry:
+    """Built-in commands keyed by their leading words, so dispatch is a few dict lookups before any model work."""
+
+    MAX_COMMAND_WORDS = 3
+
+    def __init__(self):
+        self._commands = {} # lowercase command words -> entry dict (shared by aliases)
+        self._entries = [] # Registration order, for help
+
+    def register(self, names, handler, admin_only=False, takes_args=False, usage=None, help_text=""):
+        entry = {"names": names, "handler": handler, "admin_only": admin_only, "takes_args": takes_args,
+                 "usage": usage or " or ".join(names), "help": help_text}
+        for name in names:
+            self._commands[name.lower()] = entry
+        self._entries.append(entry)
+
+    def match(self, text):
+        """Returns (entry, args) for the longest registered prefix of `text`, or (None, None)."""
+        words = text.split(None, self.MAX_COMMAND_WORDS)
+        for n in range(min(len(words), self.MAX_COMMAND_WORDS), 0, -1):
+            entry = self._commands.get(' '.join(words[:n]).lower())
+            if entry is None:
+                continue
+            args = text.split(None, n)[n].strip() if len(words) > n else ""
+            if args and not entry["takes_args"]:
+                return None, None # "help me with python" is a question, not the help command
+            return entry, args
+        return None, None
+
+    def entries(self):
+        return list(self._entries)
+
+def is_short_followup(message):
+    return len(message.split()) <= FOLLOWUP_MAX_WORDS and bool(FOLLOWUP_PATTERN.match(message.strip()))
+
+def is_context_dependent(message):
+    return bool(FOLLOWUP_PATTERN.match(message.strip()) or CONTEXT_DEPENDENT_PATTERN.search(message)
+                or RECALL_PATTERN.search(message))
+
+def estimate_tokens(text):
+    # Same rough heuristic as prompt.generator.py: 1 token ~ 4 characters
+    return len(text) // 4 + 1
+
+def _context_words(text):
+    return {w for w in re.findall(r"[a-z0-9']+", text.lower()) if len(w) > 2 and w not in CONTEXT_STOPWORDS}
+
+def _strip_call_prefix(message, channel=None):
+    return mention_detector.strip_address(message, channel)
+
+def build_reply_context(channel, nick, question, topic, ts, recent_activity=(), include_ambient=False,
+                        token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Picks history lines for a reply under `token_budget`. Candidates come from the current
+    topic thread, the asker's recent messages across topics and raw channel activity; they
+    are ranked by recency, speaker relevance and word overlap with the question, then the
+    best ones that fit are returned in chronological order as (lines, approx_tokens).
+    """
+    question_words = _context_words(question)
+    mentioned = {w.lower() for w in re.findall(r"[^\s:,]+", question)}
+    seen = {(nick, _strip_call_prefix(question, channel))} # Never repeat the current question
+    candidates = []
+
+    def add(msg_ts, speaker, message, source_bonus):
+        message = _strip_call_prefix(message, channel)
+        key = (speaker, message)
+        if not message or key in seen:
+            return
+        seen.add(key)
+        age = max(0.0, ts - msg_ts)
+        score = 0.5 ** (age / CONTEXT_RECENCY_HALF_LIFE_SECONDS) + source_bonus
+        if speaker == nick or speaker == nickname:
+            score += 0.5
+        elif speaker.lower() in mentioned:
+            score += 0.4
+        if question_words:
+            score += 1.5 * len(question_words & _context_words(message)) / len(question_words)
+        candidates.append((score, msg_ts, f"{speaker}: {message}"))
+
+    if topic in topic_threads.get(channel, {}):
+        for msg_ts, speaker, message in topic_threads[channel][topic]["messages"]:
+            add(msg_ts, speaker, message, 0.75)
+    for msg_ts, message, msg_topic in user_topics.get(channel, {}).get(nick, []):
+        add(msg_ts, nick, message, 0.75 if msg_topic == topic else 0.0)
+    ambient_bonus = 0.3 if include_ambient else -0.5
+    for msg_ts, speaker, message in recent_activity:
+        add(msg_ts, speaker, message, ambient_bonus)
+
+    remaining = token_budget - estimate_tokens(f"{nick}: {question}")
+    chosen = []
+    for score, msg_ts, line in sorted(candidates, key=lambda c: -c[0]):
+        if score < CONTEXT_MIN_SCORE:
+            break
+        cost = estimate_tokens(line)
+        if cost <= remaining:
+            chosen.append((msg_ts, line))
+            remaining -= cost
+    chosen.sort(key=lambda c: c[0])
+    return [line for _, line in chosen], token_budget - remaining
+
+class DirectiveFileWatcher(threading.Thread):
+    """
+    Background thread that calls `on_change` whenever `path` is rewritten or atomically replaced
+    (prompt.generator.py writes a .tmp file and os.replace()s it). Uses inotify on Linux via libc,
+    falling back to mtime polling every DIRECTIVE_WATCH_POLL_SECONDS elsewhere.
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+    def __init__(self, path, on_change, poll_interval=DIRECTIVE_WATCH_POLL_SECONDS):
+        super().__init__(name="directive-watcher", daemon=True)
+        self.path = os.path.abspath(path)
+        self.directory, self.file_name = os.path.split(self.path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        fd = self._open_inotify()
+        if fd is None:
+            print(f"## Directive watcher: polling '{self.path}' every {self.poll_interval}s.")
+            self._poll_loop()
+            return
+        print(f"## Directive watcher: inotify on '{self.directory}'.")
+        try:
+            self._inotify_loop(fd)
+        finally:
+            os.close(fd)
 
-    try:
-        # Basic validation of the path to the target object
-        if channel not in topic_threads:
-            print(f"    ERROR: Channel '{channel}' not in topic_threads.")
-            return "Error: Channel context not found." 
-        channel_content = topic_threads[channel]
-        if topic not in channel_content:
-            print(f"    ERROR: Topic '{topic}' not in topic_threads['{channel}'].")
-            return "Error: Topic context not found." 
-        topic_content = channel_content[topic]
-        if not isinstance(topic_content, dict) or "messages" not in topic_content:
-            print(f"    ERROR: topic_threads['{channel}']['{topic}'] is not a dict or 'messages' key is missing. Value: {topic_content}")
-            return "Error: Message structure invalid." 
-
-        target_object = topic_threads[channel][topic]["messages"]
-        print(f"    Target object retrieved. Type: {type(target_object)}, Value: {target_object}")
-        print(f"    Isinstance collections.deque for target_object: {isinstance(target_object, deque)}")
-        print(f"    Length of target_object (if applicable): {len(target_object) if hasattr(target_object, '__len__') else 'N/A'}")
-        print(f"    Value of n for slice: {n}, type of n: {type(n)}")
-
-
-        print(f"    Attempting slice: target_object[-n:] which is target_object[-{n}:]")
-        original_msgs_for_iteration = target_object[-n:] 
-        print(f"    Target object sliced successfully. Result: {original_msgs_for_iteration}")
-        
-        # If successful, proceed with original logic using original_msgs_for_iteration
-        out = []
-        for (_, nick_val, msg_val) in original_msgs_for_iteration:
-            out.append(f"{nick_val}: {msg_val}")
-        final_output = "\n".join(out)
-        print(f"--- LEAVING get_topic_conversation_snippet (SUCCESS) ---")
-        return final_output
-
-    except TypeError as te:
-        print(f"    FAILURE (TypeError): Error slicing target_object. Error: {te}")
-        if target_object is not None:
-             print(f"    Offending object type: {type(target_object)}, value: {target_object}")
-        else:
-            print(f"    Target object was None or not retrieved.")
-        print(f"    Slice was with n={n} (type: {type(n)})")
-        
-        if target_object is not None:
-            try:
-                print("    Attempting to convert target_object to list...")
-                list_from_target = list(target_object)
-                print(f"    Successfully converted to list: {list_from_target}")
-                print(f"    Attempting to slice the list: list_from_target[-{n}:]")
-                sliced_list = list_from_target[-n:]
-                print(f"    List (derived from target_object) sliced successfully: {sliced_list}")
-            except Exception as e_conv:
-                print(f"    Error during conversion/slicing of list derived from target_object: {e_conv}")
-        
-        print(f"--- LEAVING get_topic_conversation_snippet (TypeError HANDLED, returning empty string) ---")
-        return "" 
+    def _open_inotify(self):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            # Watch the directory: os.replace() swaps the inode, so a watch on the file itself would go stale
+            if libc.inotify_add_watch(fd, os.fsencode(self.directory), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+                errno = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(errno, "inotify_add_watch failed")
+            return fd
+        except (OSError, AttributeError) as e:
+            print(f"## Directive watcher: inotify unavailable ({e}).")
+            return None
+
+    def _inotify_loop(self, fd):
+        while not self._stop_event.is_set():
+            ready, _, _ = select.select([fd], [], [], 1.0)
+            if not ready:
+                continue
+            data = os.read(fd, 4096)
+            changed = False
+            offset = 0
+            while offset + self.EVENT_HEADER.size <= len(data):
+                _wd, _mask, _cookie, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+                name_start = offset + self.EVENT_HEADER.size
+                name = data[name_start:name_start + name_len].rstrip(b"\0")
+                offset = name_start + name_len
+                if os.fsdecode(name) == self.file_name:
+                    changed = True
+            if changed:
+                self._notify()
+
+    def _poll_loop(self):
+        last_mtime = self._current_mtime()
+        while not self._stop_event.wait(self.poll_interval):
+            current_mtime = self._current_mtime()
+            if current_mtime is not None and current_mtime != last_mtime:
+                last_mtime = current_mtime
+                self._notify()
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
 
-    except Exception as e_other:
-        print(f"    FAILURE (Other Exception): {e_other}")
-        if target_object is not None:
-            print(f"    Offending object (if available) type: {type(target_object)}, value: {target_object}")
-        print(f"--- LEAVING get_topic_conversation_snippet (Other Error HANDLED, returning empty string) ---")
-        return ""
+    def _notify(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"## Directive watcher: reload failed: {e}")
+
+class HeartbeatThread(threading.Thread):
+    """
+    Reports shard health to the coordinator every HEARTBEAT_INTERVAL_SECONDS. It runs off the reactor,
+    so a reply waiting on a model call does not look like a hang. A reactor that has not ticked for
+    REACTOR_STALL_SECONDS is hung, and the beats stop so the supervisor restarts the worker.
+    """
+
+    def __init__(self, bot, interval=HEARTBEAT_INTERVAL_SECONDS, stall_seconds=REACTOR_STALL_SECONDS):
+        super().__init__(name="heartbeat", daemon=True)
+        self.bot = bot
+        self.interval = interval
+        self.stall_seconds = stall_seconds
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            reactor_age = time.time() - self.bot.last_reactor_tick
+            if reactor_age > self.stall_seconds:
+                print(f"## Heartbeat: reactor silent for {reactor_age:.0f}s; no longer reporting healthy.")
+                continue
+            try:
+                if not self.bot.connection.is_connected():
+                    status = "disconnected"
+                else:
+                    status = "ok" if reactor_age <= 2 * self.interval else "busy"
+                self.bot.coordinator.heartbeat(os.getpid(), status, self.bot.channels_list)
+            except Exception as e:
+                print(f"## Heartbeat failed: {e}")
 
 class DumbBot(irc.bot.SingleServerIRCBot):
     def __init__(self, channels, nickname, password, server, account_name, port=6667):
@@ -218,14 +703,13 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         self.connection.add_global_handler("notice", self.on_notice)
         self.connection.add_global_handler("welcome", self.on_welcome)
 
-        self.archived_topic_summaries_file = "archived_summaries.json"
-        self.archived_topic_summaries = defaultdict(dict) # channel -> topic_label -> summary_text
-        self.load_archived_summaries() 
-
+        self.coordinator = Coordinator(COORDINATION_DB_PATH, SHARD_NAME) if COORDINATION_DB_PATH else None
         self.ignore_list_file = "ignore_list.json"
         self.ignored_users = set() 
         self.load_ignore_list()
         self.channel_activity_log = defaultdict(lambda: deque(maxlen=15)) # Stores (timestamp, nick, message)
+        self.bot_turns = defaultdict(lambda: deque(maxlen=BOT_TURN_HISTORY)) # Our own replies per channel, newest last
+        self.memory_index = ChannelMemoryIndex(MEMORY_INDEX_DB_PATH, server=server)
         self.prompt_settings_file = "prompt_settings.json"
         self.current_personality_directive = (
             "You're a fictionalized version of Wintermute, an advanced virtual assistant inspired by Wintermute from William Gibson's works. You are helpful - mostly. You're in an IRC channel."
@@ -233,9 +717,13 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         self.last_analysis_summary = {} # To store the full summary object
         self.last_main_topics = []      # To store just the main topics list
         self.last_notable_moments = []  # To store specific quotes/events
-        self.last_prompt_file_check_time = 0
-        self.last_prompt_file_mtime = 0 # To track file modification
-        self._check_and_load_dynamic_prompt(force_load=True)
+        self._directive_lock = threading.Lock()
+        self.directive_version = 0 # Bumped on every directive change; part of the response cache scope
+        self._load_dynamic_prompt()
+        # Reloads are pushed by the watcher (inotify, or polling fallback) instead of checked on the reply path
+        self.directive_watcher = DirectiveFileWatcher(
+            DYNAMIC_PROMPT_FILE_PATH, lambda: self._load_dynamic_prompt())
+        self.directive_watcher.start()
         
         self.mandatory_prompt_template_text = ( # Template for mandatory part
             " Current date: {current_date}. Sometimes ask questions back, not always! Be concise - keep your responses short and to the point if possible. "
@@ -257,62 +745,65 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         self.personality_change_message_count = 0
         self.personality_change_message_trigger = 50 # Change after 50 messages it processes
         self.load_state() # General load state method
-
-    def _check_and_load_dynamic_prompt(self, force_load=False):
-        """Checks if the dynamic prompt file needs to be reloaded and loads it."""
-        if not force_load and (time.time() - self.last_prompt_file_check_time < PROMPT_FILE_POLL_INTERVAL_SECONDS):
-            return # Not time to check yet
-
-        self.last_prompt_file_check_time = time.time()
-
+        self.commands = CommandRegistry()
+        self.register_commands()
+        self.register_diagnostics()
+        self.heartbeat_thread = None
+        if self.coordinator:
+            self.last_reactor_tick = time.time()
+            self.reactor.scheduler.execute_every(HEARTBEAT_INTERVAL_SECONDS, self.reactor_tick)
+            self.heartbeat_thread = HeartbeatThread(self)
+            self.heartbeat_thread.start()
+        llm_scheduler.coordinator = self.coordinator # Provider limits and the daily budget are shared by all shards
+        self.reactor.scheduler.execute_every(LLM_QUEUE_DRAIN_SECONDS, llm_scheduler.drain)
+
+    def _load_dynamic_prompt(self):
+        """
+        Loads the dynamic prompt file. Called at startup and from the DirectiveFileWatcher thread when
+        the file changes; the file is parsed and validated first and then swapped in under _directive_lock.
+        """
         try:
             if not os.path.exists(DYNAMIC_PROMPT_FILE_PATH):
                 print(f"## Dynamic prompt file '{DYNAMIC_PROMPT_FILE_PATH}' not found. Using current/fallback directive.")
                 return
 
-            current_mtime = os.path.getmtime(DYNAMIC_PROMPT_FILE_PATH)
-            if not force_load and current_mtime == self.last_prompt_file_mtime:
-                # print(f"## Dynamic prompt file '{DYNAMIC_PROMPT_FILE_PATH}' has not changed.") # for debugging
-                return
-
             print(f"## Loading dynamic prompt from '{DYNAMIC_PROMPT_FILE_PATH}'...")
             with open(DYNAMIC_PROMPT_FILE_PATH, 'r', encoding='utf-8') as f:
                 data = json.load(f) # Expecting JSON like {"generated_directive": "...", "analysis_summary": {...}}
                 
             new_directive = data.get("generated_directive")
-            if new_directive and isinstance(new_directive, str) and new_directive.strip():
-                self.current_personality_directive = new_directive.strip()
-                self.last_prompt_file_mtime = current_mtime # Update mtime only on successful directive load
-                print(f"## Successfully loaded new dynamic personality directive (first 100 chars): {self.current_personality_directive[:100]}...")
-
-                # Now load the analysis summary and its parts
-                analysis_data = data.get("analysis_summary")
-                if isinstance(analysis_data, dict):
-                    self.last_analysis_summary = analysis_data
-                    print(f"## Successfully loaded analysis_summary. Keys: {list(self.last_analysis_summary.keys())}")
-
-                    main_topics_from_summary = analysis_data.get("main_topics")
-                    if isinstance(main_topics_from_summary, list):
-                        self.last_main_topics = main_topics_from_summary
-                        print(f"## Successfully loaded main_topics: {self.last_main_topics}...")
-                    else:
-                        print(f"## 'main_topics' in analysis_summary was not a list or missing. Using previous/default.")
-                        # self.last_main_topics = [] # Optional reset
-
-                    notable_moments_from_summary = analysis_data.get("notable_channel_moments")
-                    if isinstance(notable_moments_from_summary, list):
-                        self.last_notable_moments = notable_moments_from_summary
-                        print(f"## Successfully loaded notable_channel_moments: {self.last_notable_moments}...")
-                    else:
-                        print(f"## 'notable_channel_moments' in analysis_summary was not a list or missing. Using previous/default.")
-                        # self.last_notable_moments = [] # Optional reset
+            if not (new_directive and isinstance(new_directive, str) and new_directive.strip()):
+                print(f"## Dynamic prompt file did not contain a valid 'generated_directive'. Using current/fallback.")
+                return
+
+            # Validate everything before touching the live state (previous values are kept for bad fields)
+            new_analysis_summary = self.last_analysis_summary
+            new_main_topics = self.last_main_topics
+            new_notable_moments = self.last_notable_moments
+            analysis_data = data.get("analysis_summary")
+            if isinstance(analysis_data, dict):
+                new_analysis_summary = analysis_data
+                main_topics_from_summary = analysis_data.get("main_topics")
+                if isinstance(main_topics_from_summary, list):
+                    new_main_topics = main_topics_from_summary
                 else:
-                    print(f"## 'analysis_summary' was not a dict or missing. Using previous/default for analysis data.")
-                    # self.last_analysis_summary = {} # Optional reset
-                    # self.last_main_topics = []
-                    # self.last_notable_moments = []
+                    print(f"## 'main_topics' in analysis_summary was not a list or missing. Using previous/default.")
+                notable_moments_from_summary = analysis_data.get("notable_channel_moments")
+                if isinstance(notable_moments_from_summary, list):
+                    new_notable_moments = notable_moments_from_summary
+                else:
+                    print(f"## 'notable_channel_moments' in analysis_summary was not a list or missing. Using previous/default.")
             else:
-                print(f"## Dynamic prompt file did not contain a valid 'generated_directive'. Using current/fallback.")
+                print(f"## 'analysis_summary' was not a dict or missing. Using previous/default for analysis data.")
+
+            with self._directive_lock:
+                self.current_personality_directive = new_directive.strip()
+                self.last_analysis_summary = new_analysis_summary
+                self.last_main_topics = new_main_topics
+                self.last_notable_moments = new_notable_moments
+                self.directive_version += 1
+            print(f"## Successfully loaded new dynamic personality directive (first 100 chars): {new_directive.strip()[:100]}...")
+            print(f"## Loaded main_topics: {new_main_topics}... notable_channel_moments: {new_notable_moments}...")
 
         except FileNotFoundError:
              print(f"## Dynamic prompt file '{DYNAMIC_PROMPT_FILE_PATH}' not found on check. Using current/fallback directive.")
@@ -323,19 +814,23 @@ class DumbBot(irc.bot.SingleServerIRCBot):
 
   
     def get_current_full_prompt_preamble(self):
-        self._check_and_load_dynamic_prompt() 
+        # Reloads happen on the watcher thread; take one consistent snapshot here
+        with self._directive_lock:
+            personality_part = self.current_personality_directive
+            last_main_topics = self.last_main_topics
+            last_notable_moments = self.last_notable_moments
+            last_analysis_summary = self.last_analysis_summary
         current_date_str = datetime.datetime.now().strftime('%Y-%m-%d')
         
-        personality_part = self.current_personality_directive
         mandatory_part = self.mandatory_prompt_template_text.format(current_date=current_date_str)
 
         # --- This section now primarily formats the data ---
         awareness_data_points = []
 
         # Handle main_topics (list of dicts)
-        if self.last_main_topics:
+        if last_main_topics:
             topic_descriptions = []
-            for item in self.last_main_topics:
+            for item in last_main_topics:
                 if isinstance(item, dict):
                     topic_desc = item.get("topic", "N/A")
                     users_involved = item.get("users", [])
@@ -351,10 +846,10 @@ class DumbBot(irc.bot.SingleServerIRCBot):
             if topic_descriptions:
                 awareness_data_points.append(f"AWARENESS: Key recent discussion topics: {'; '.join(topic_descriptions)}.")
 
-        if self.last_notable_moments:
-            awareness_data_points.append(f"AWARENESS: Memorable recent channel moments/quotes: {'; '.join(self.last_notable_moments)}.")
+        if last_notable_moments:
+            awareness_data_points.append(f"AWARENESS: Memorable recent channel moments/quotes: {'; '.join(last_notable_moments)}.")
         
-        general_summary_text = self.last_analysis_summary.get("summary", "")
+        general_summary_text = last_analysis_summary.get("summary", "")
         if general_summary_text:
             awareness_data_points.append(f"AWARENESS: General gist of recent channel activity: {general_summary_text[:250]}...") # Snippet
 
@@ -367,6 +862,9 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         return f"{personality_part} {mandatory_part}{recent_context_str}".strip()
 
     def load_ignore_list(self):
+        if self.coordinator:
+            self.ignored_users = self.coordinator.ignored_users()
+            return
         try:
             with open(self.ignore_list_file, 'r', encoding='utf-8') as f:
                 self.ignored_users = set(json.load(f))
@@ -376,6 +874,8 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         except json.JSONDecodeError:
             print("## Error decoding ignore list file.")
     def save_ignore_list(self):
+        if self.coordinator:
+            return # Changes are written to the shared list as they are made
         try:
             with open(self.ignore_list_file, 'w', encoding='utf-8') as f:
                 json.dump(list(self.ignored_users), f) # Save as list
@@ -383,15 +883,34 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         except Exception as e:
             print(f"## Error saving ignore list: {e}")
 
+    def ignore_user(self, nick_to_ignore, added_by=None):
+        self.ignored_users.add(nick_to_ignore)
+        if self.coordinator:
+            self.coordinator.add_ignored(nick_to_ignore, added_by)
+        self.save_ignore_list()
+
+    def unignore_user(self, nick_to_unignore):
+        self.ignored_users.discard(nick_to_unignore) # Use discard for no error if not found
+        if self.coordinator:
+            self.coordinator.remove_ignored(nick_to_unignore)
+        self.save_ignore_list()
+
+    def reactor_tick(self):
+        """Runs on the reactor thread: proves it is alive to the HeartbeatThread."""
+        self.last_reactor_tick = time.time()
+        try:
+            self.ignored_users = self.coordinator.ignored_users() # Picks up changes made on other shards
+        except Exception as e:
+            print(f"## Ignore list refresh failed: {e}")
+
     def load_state(self): # General state loader
         print("## Loading bot state...")
         self.load_ignore_list()
-        self.load_archived_summaries() 
 
     def save_state(self): # General state saver
         print("## Saving bot state...")
         self.save_ignore_list()
-        self.save_archived_summaries() 
+        self.memory_index.flush()
 
     def on_account(self, conn, event):
         print("IRC: identified with NickServ")
@@ -401,7 +920,10 @@ class DumbBot(irc.bot.SingleServerIRCBot):
 
     def on_welcome(self, conn, event):
         print("Welcome event fired.")
+        threading.Thread(target=preload_provider_sdks, daemon=True).start()
         conn.send_raw(f"PRIVMSG NickServ :IDENTIFY {self.account_name} {self.password}")
+        if ADMIN_ACCOUNTS:
+            conn.send_raw("CAP REQ :account-tag") # Tags messages with the sender's services account
         for channel in self.channels_list:
             conn.send_raw(f"JOIN {channel}")
 
@@ -415,35 +937,48 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         self.join_times[channel] = time.time()
 
     def on_privmsg(self, c, e):
-        nick = e.source.nick
-        if nick == "adminName":
+        if self.is_admin(e):
             self.handle_message(e, e.arguments[0], is_pm=True)
 
+    @staticmethod
+    def get_account(e):
+        for tag in getattr(e, "tags", None) or []:
+            if tag.get("key") == "account":
+                return tag.get("value")
+        return None
+
+    def is_admin(self, e):
+        account = self.get_account(e)
+        if account and account.lower() in ADMIN_ACCOUNTS:
+            return True
+        return e.source.nick.lower() in ADMIN_NICKS
+
     def on_pubmsg(self, c, e):
         timestamp = time.time() # Get timestamp early
         channel = e.target
         message_text = e.arguments[0]
 
         self.channel_activity_log[channel].append((timestamp, e.source.nick, message_text))
+        self.memory_index.add_message(channel, timestamp, e.source.nick, message_text)
 
         min_lag = 4
         if channel in self.join_times and (time.time() - self.join_times[channel]) < min_lag:
             return
 
-        is_direct_command = message_text.lower().startswith(nickname.lower() + ':')
-        is_mention = nickname.lower() in message_text.lower()
-        if is_direct_command or is_mention:
-            self.handle_message(e, message_text, is_pm=False, is_direct_command=is_direct_command)
+        addressed = mention_detector.classify(channel, e.source.nick, message_text)
+        if addressed:
+            self.handle_message(e, message_text, is_pm=False, is_direct_command=addressed == DIRECT)
 
-    def anthropic_conversation_reply(self, context_str):
+    def anthropic_conversation_reply(self, context_str, max_tokens=REPLY_MAX_TOKENS):
         try:
             current_preamble = self.get_current_full_prompt_preamble() # Get fresh preamble with current date
-            message = anthropic_client.messages.create(
-                model="claude-sonnet-4-20250514", 
-                max_tokens=400,
+            message = get_anthropic_client().messages.create(
+                model=REPLY_MODEL,
+                max_tokens=max_tokens,
                 system=current_preamble, # Use the dynamic preamble
                 messages=[{"role": "user", "content": context_str}]
             )
+            record_llm_usage(REPLY_MODEL, getattr(message, "usage", None))
             return message.content[0].text.strip()
         except Exception as e:
             print(f"[Anthropic] LLM failed: {e}")
@@ -453,8 +988,8 @@ class DumbBot(irc.bot.SingleServerIRCBot):
         try:
             # Using a simple system prompt for the fallback
             system_prompt_fallback = "You are a backup assistant. The primary AI had an issue. Please provide a brief, helpful, or apologetic response based on the user's message."
-            response = openai.chat.completions.create( # Use chat.completions
-                model="gpt-4.1-micro", 
+            response = get_openai().chat.completions.create( # Use chat.completions
+                model=FALLBACK_REPLY_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt_fallback},
                     {"role": "user", "content": context_str} # Pass the original context
@@ -462,189 +997,347 @@ class DumbBot(irc.bot.SingleServerIRCBot):
                 max_tokens=100, # Adjust as needed
                 temperature=0.7
             )
+            record_llm_usage(FALLBACK_REPLY_MODEL, getattr(response, "usage", None))
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"[OpenAI Fallback] LLM failed: {e}")
             return "[My backup circuits are also fried. I'm completely offline. Try again later.]"
 
     def handle_message(self, e, cmd, is_pm, is_direct_command=True):
+        diagnostics.begin(e.target, e.source.nick, cmd)
+        try:
+            self._handle_message(e, cmd, is_pm, is_direct_command)
+        finally:
+            diagnostics.end()
+
+    def _handle_message(self, e, cmd, is_pm, is_direct_command):
         channel = e.target
-        current_time = time.time()
         nick = e.source.nick
-        expire_old_threads(channel)
         if nick.lower() in self.ignored_users: # Check against lowercase for consistency
             return # Silently ignore
 
-        call_prefix = nickname + ':'
         if not is_pm:
             if is_direct_command:
-                stripped_cmd = cmd[len(call_prefix):].strip()
+                stripped_cmd = mention_detector.strip_address(cmd, channel)
             else: # It's a general mention, use the whole command/message
                 stripped_cmd = cmd.strip()
         else: # PM from admin
             stripped_cmd = cmd.strip()
         if not stripped_cmd: return
 
+        # Built-in commands are answered here, before topic classification or any model call
+        if (is_direct_command or is_pm) and self.dispatch_command(e, nick, stripped_cmd, is_pm):
+            diagnostics.stage("command")
+            return
+        expire_old_threads(channel)
+        diagnostics.stage("expire_threads")
 
-        if nick.lower() == "adminName": # Make nick check lowercase for consistency
-            if stripped_cmd.lower() in ["clear topics", "clear context"]:
-                topic_threads[channel].clear()
-                user_topics[channel].clear()
-                self.connection.privmsg(e.target, "Context cleared.")
-                return
-            
-            # Change System Prompt 
-            if stripped_cmd.lower().startswith("set system_prompt "):
-                new_prompt_text = stripped_cmd[len("set system_prompt "):].strip()
-                if new_prompt_text:
-                    self.current_personality_directive = new_prompt_text
-                    self.connection.privmsg(e.target, "System prompt updated and saved.")
-                else:
-                    self.connection.privmsg(e.target, "Cannot set an empty system prompt.")
-                return
-
-        
-            
-            if stripped_cmd.lower() == "show prompt":
-                self.connection.privmsg(e.target, self.current_personality_directive)
-                return
+        # A cached answer costs no model call, so it is tried before classification, limits and the budget
+        if self.answer_from_cache(e, stripped_cmd, nick, is_pm):
+            diagnostics.stage("cached_reply")
+            return
 
-            # Ignore commands
-            if stripped_cmd.lower().startswith("ignore "):
-                nick_to_ignore = stripped_cmd[len("ignore "):].strip().lower()
-                if nick_to_ignore and nick_to_ignore != nickname.lower(): # Can't ignore self
-                    self.ignored_users.add(nick_to_ignore)
-                    self.save_ignore_list()
-                    self.connection.privmsg(e.target, f"Now ignoring {nick_to_ignore}.")
-                return
-            elif stripped_cmd.lower().startswith("unignore "):
-                nick_to_unignore = stripped_cmd[len("unignore "):].strip().lower()
-                if nick_to_unignore:
-                    self.ignored_users.discard(nick_to_unignore) # Use discard for no error if not found
-                    self.save_ignore_list()
-                    self.connection.privmsg(e.target, f"No longer ignoring {nick_to_unignore}.")
-                return
-            elif stripped_cmd.lower() == "show ignored":
-                if self.ignored_users:
-                    self.connection.privmsg(e.target, f"Currently ignoring: {', '.join(self.ignored_users)}")
-                else:
-                    self.connection.privmsg(e.target, "Not ignoring anyone.")
-                return
+        if llm_scheduler.budget_state() == BUDGET_EXHAUSTED:
+            print(f"## Daily LLM budget exhausted; not replying to {nick} in {channel}.")
+            return
+        if not llm_scheduler.admit_message(channel, nick):
+            self.defer_reply(e, stripped_cmd, nick, is_pm, is_direct_command)
+            diagnostics.stage("defer")
+            return
+        diagnostics.stage("admission")
+        self.generate_reply(e, stripped_cmd, nick, is_pm, is_direct_command)
+
+    def dispatch_command(self, e, nick, stripped_cmd, is_pm):
+        """Runs a built-in command if `stripped_cmd` is one. Returns True if it was handled."""
+        entry, args = self.commands.match(stripped_cmd)
+        if entry is None:
+            return False
+        target = nick if is_pm else e.target
+        if entry["admin_only"] and not self.is_admin(e):
+            self.connection.privmsg(target, f"{nick}: that command is for admins only.")
+            return True
+        entry["handler"](target, e.target, nick, args)
+        return True
+
+    def send_command_output(self, target, lines, max_length=420):
+        """Sends command output without recording it as a conversational turn."""
+        chunk = ""
+        for line in lines:
+            while len(line) > max_length:
+                if chunk:
+                    self.connection.privmsg(target, chunk)
+                    chunk = ""
+                self.connection.privmsg(target, line[:max_length])
+                line = line[max_length:]
+            if chunk and len(chunk) + 3 + len(line) > max_length:
+                self.connection.privmsg(target, chunk)
+                chunk = ""
+            chunk = f"{chunk} | {line}" if chunk else line
+        if chunk:
+            self.connection.privmsg(target, chunk)
+
+    def register_commands(self):
+        register = self.commands.register
+        register(("help",), self.cmd_help, help_text="Shows this help message.")
+        register(("topics", "show topics"), self.cmd_show_topics, help_text="Shows active conversation topics.")
+        register(("clear topics", "clear context"), self.cmd_clear_topics, admin_only=True,
+                 help_text="Clears conversation topics.")
+        register(("set system_prompt",), self.cmd_set_system_prompt, admin_only=True, takes_args=True,
+                 usage="set system_prompt <text>", help_text="Replaces my personality directive.")
+        register(("show prompt",), self.cmd_show_prompt, admin_only=True, help_text="Shows my personality directive.")
+        register(("ignore",), self.cmd_ignore, admin_only=True, takes_args=True, usage="ignore <user>",
+                 help_text="Ignores a user.")
+        register(("unignore",), self.cmd_unignore, admin_only=True, takes_args=True, usage="unignore <user>",
+                 help_text="Unignores a user.")
+        register(("show ignored",), self.cmd_show_ignored, admin_only=True, help_text="Shows ignored users.")
+        register(("show llm stats",), self.cmd_show_llm_stats, admin_only=True,
+                 help_text="Shows model call, rate limit, spend and trigger metrics.")
+        register(("show cache stats",), self.cmd_show_cache_stats, admin_only=True,
+                 help_text="Shows topic and response cache metrics.")
+        register(("flush cache",), self.cmd_flush_cache, admin_only=True, help_text="Drops all cached replies.")
+        register(("diag",), self.cmd_diag, admin_only=True, takes_args=True,
+                 usage="diag start|stop|memory|memory stop|slow|status",
+                 help_text="Profiles CPU, snapshots memory or reports the slowest messages (files in ./diagnostics).")
+
+    def cmd_help(self, target, channel, nick, args):
+        lines = ["Available commands:"]
+        for entry in self.commands.entries():
+            admin_note = " (admin only)" if entry["admin_only"] else ""
+            lines.append(f"'{nickname}: {entry['usage']}'{admin_note}: {entry['help']}")
+        lines.append(f"Just talk to me by starting your message with '{nickname}:' or mentioning '{nickname}' anywhere in your message.")
+        self.send_command_output(target, lines)
+
+    def cmd_show_topics(self, target, channel, nick, args):
+        expire_old_threads(channel)
+        active_topics = sorted(
+            (normalize_topic_label(k) for k, v in topic_threads[channel].items() if time.time() - v['last_active'] < TOPIC_EXPIRY_SECONDS),
+            key=lambda t: -topic_threads[channel][t]['last_active']
+        )
+        if active_topics:
+            topic_people = {}
+            for k, v in topic_threads[channel].items():
+                label = normalize_topic_label(k)
+                topic_people[label] = len(v['members'])
+            topics_string = "; ".join(f"{label} ({topic_people[label]} people)" for label in set(active_topics))
+            self.connection.privmsg(target, f"Active topics: {topics_string}")
+        else:
+            self.connection.privmsg(target, "No active topics right now.")
+
+    def cmd_clear_topics(self, target, channel, nick, args):
+        topic_threads[channel].clear()
+        user_topics[channel].clear()
+        self.bot_turns[channel].clear()
+        self.connection.privmsg(target, "Context cleared.")
+
+    def cmd_set_system_prompt(self, target, channel, nick, args):
+        if args:
+            with self._directive_lock:
+                self.current_personality_directive = args
+                self.directive_version += 1
+            self.connection.privmsg(target, "System prompt updated and saved.")
+        else:
+            self.connection.privmsg(target, "Cannot set an empty system prompt.")
+
+    def cmd_show_prompt(self, target, channel, nick, args):
+        self.send_command_output(target, [self.current_personality_directive])
+
+    def cmd_ignore(self, target, channel, nick, args):
+        nick_to_ignore = args.lower()
+        if nick_to_ignore and nick_to_ignore != nickname.lower(): # Can't ignore self
+            self.ignore_user(nick_to_ignore, added_by=nick)
+            self.connection.privmsg(target, f"Now ignoring {nick_to_ignore}.")
+
+    def cmd_unignore(self, target, channel, nick, args):
+        nick_to_unignore = args.lower()
+        if nick_to_unignore:
+            self.unignore_user(nick_to_unignore)
+            self.connection.privmsg(target, f"No longer ignoring {nick_to_unignore}.")
+
+    def cmd_show_ignored(self, target, channel, nick, args):
+        if self.ignored_users:
+            self.connection.privmsg(target, f"Currently ignoring: {', '.join(self.ignored_users)}")
+        else:
+            self.connection.privmsg(target, "Not ignoring anyone.")
+
+    def cmd_show_llm_stats(self, target, channel, nick, args):
+        stats = llm_scheduler.stats()
+        counters = stats["counters"]
+        self.connection.privmsg(target,
+            f"LLM: budget {stats['budget']} ({stats['tokens_today']} tokens, ${stats['spend_today_usd']:.2f} today), "
+            f"{counters.get('anthropic_calls', 0)} anthropic / {counters.get('openai_calls', 0)} openai calls, "
+            f"{counters.get('rate_limited', 0)} rate limited, {stats['queued']} queued, "
+            f"{counters.get('deferred', 0)} deferred, {counters.get('dropped', 0) + counters.get('expired', 0) + counters.get('budget_dropped', 0)} dropped, "
+            f"{counters.get('degraded_local_topic', 0)} local topics, {counters.get('degraded_short_reply', 0)} short replies, "
+            f"queue wait mean {stats['wait_mean_s']:.1f}s / p95 {stats['wait_p95_s']:.1f}s.")
+        stats = mention_detector.stats()
+        self.connection.privmsg(target,
+            f"Triggers: {stats['direct']} addressed, {stats['mention']} mentions; {stats['suppressed']} ignored "
+            f"({stats['suppressed_substring']} inside words/URLs, {stats['suppressed_relay']} relayed/pasted, "
+            f"{stats['suppressed_bot']} from bots), ~{stats['saved_calls']} model calls avoided.")
+
+    def cmd_show_cache_stats(self, target, channel, nick, args):
+        stats = topic_cache.stats()
+        self.connection.privmsg(target,
+            f"Topic cache: {stats['entries']} entries, hit rate {stats['hit_rate']:.0%} "
+            f"({stats['hits']} hits / {stats['misses']} misses), saved {stats['saved_calls']} calls, ~{stats['saved_ms']:.0f} ms.")
+        stats = response_cache.stats()
+        self.connection.privmsg(target,
+            f"Response cache: {stats['entries']} entries, hit rate {stats['hit_rate']:.0%} "
+            f"({stats['hits']} hits / {stats['misses']} misses, {stats['skipped']} follow-ups bypassed), "
+            f"saved ~{stats['saved_ms'] / 1000:.1f} s of model time.")
+
+    def cmd_flush_cache(self, target, channel, nick, args):
+        flushed = response_cache.clear()
+        self.connection.privmsg(target, f"Response cache flushed ({flushed} entries).")
+
+    def cmd_diag(self, target, channel, nick, args):
+        action = args.lower() or "status"
+        if action in ("stop", "memory", "slow"):
+            # Reports and snapshots can take seconds; write them off the reactor thread, like the signal path
+            threading.Thread(target=self.run_diag_report, args=(target, action),
+                             name="diagnostics-report", daemon=True).start()
+            return
+        if action == "start":
+            result = diagnostics.start()
+        elif action == "memory stop":
+            result = diagnostics.stop_memory()
+        else:
+            result = diagnostics.status()
+        self.connection.privmsg(target, result)
+
+    def run_diag_report(self, target, action):
+        if action == "stop":
+            result = diagnostics.stop()
+        elif action == "memory":
+            result = diagnostics.memory_snapshot()
+        elif diagnostics.timing:
+            result = f"Slowest messages written to {diagnostics.write_slow_report()}."
+        else:
+            result = "Message timing is off; start it with 'diag start'."
+        # The IRC connection belongs to the reactor thread, so the reply is sent from there
+        self.reactor.scheduler.execute_after(0, lambda: self.connection.privmsg(target, result))
+
+    def register_diagnostics(self):
+        """Structures sized in memory snapshots."""
+        register = diagnostics.register_structure
+        register("topic_threads", lambda: topic_threads)
+        register("user_topics", lambda: user_topics)
+        register("channel_activity_log", lambda: self.channel_activity_log)
+        register("bot_turns", lambda: self.bot_turns)
+        register("topic_cache", lambda: topic_cache._entries)
+        register("response_cache", lambda: response_cache._entries)
+        register("llm_deferred_queues", lambda: llm_scheduler.queues)
+        register("llm_rate_buckets", lambda: (llm_scheduler.channel_buckets, llm_scheduler.nick_buckets))
+
+    def answer_from_cache(self, e, stripped_cmd, nick, is_pm):
+        """Replies from the response cache if this exact question was answered recently. Returns True if it did."""
+        channel = e.target
+        if is_context_dependent(stripped_cmd):
+            response_cache.note_skipped()
+            return False
+        now = time.time()
+        last_turn = self.bot_turns[channel][-1] if self.bot_turns[channel] else None
+        topic = predict_topic(channel, stripped_cmd, last_turn, now)
+        cached_response = response_cache.get(stripped_cmd, ResponseCache.make_scope(channel, topic, self.directive_version))
+        if not cached_response:
+            return False
+        print(f"## Response cache hit for '{stripped_cmd[:60]}' (topic '{topic}'); skipping the model.")
+        update_user_context(channel, nick, stripped_cmd, topic, now)
+        update_topic_threads(channel, topic, nick, stripped_cmd, now)
+        self.send_multiline(channel, cached_response, nick, is_pm, topic=topic)
+        self.log_interaction(channel, nick, topic, f"(response cache hit)\n{nick}: {stripped_cmd}", cached_response)
+        return True
+
+    def defer_reply(self, e, stripped_cmd, nick, is_pm, is_direct_command, assigned_topic=None):
+        """assigned_topic: (topic, is_followup) if already classified, so the retry does not classify again."""
+        channel = e.target
+        if llm_scheduler.defer(channel, nick, lambda: self.generate_reply(
+                e, stripped_cmd, nick, is_pm, is_direct_command, deferred=True, assigned_topic=assigned_topic)):
+            print(f"## LLM limits reached; deferred reply to {nick} in {channel}.")
+        else:
+            print(f"## LLM limits reached and {channel} queue is full; dropped message from {nick}.")
 
+    def generate_reply(self, e, stripped_cmd, nick, is_pm, is_direct_command, deferred=False, assigned_topic=None):
+        channel = e.target
+        current_time = time.time()
 
-        if stripped_cmd.lower() in ["topics", "show topics"]:
-            active_topics = sorted(
-                (normalize_topic_label(k) for k, v in topic_threads[channel].items() if time.time() - v['last_active'] < TOPIC_EXPIRY_SECONDS),
-                key=lambda t: -topic_threads[channel][t]['last_active']
-            )
-            if active_topics:
-                topic_people = {}
-                for k, v in topic_threads[channel].items():
-                    label = normalize_topic_label(k)
-                    topic_people[label] = len(v['members'])
-                topics_string = "; ".join(f"{label} ({topic_people[label]} people)" for label in set(active_topics))
-                self.connection.privmsg(e.target, f"Active topics: {topics_string}")
-            else:
-                self.connection.privmsg(e.target, "No active topics right now.")
-            return
-        # Retrieve the bot's last message in the current channel
-        bot_last_message_text = "" # Default to empty
-        search_limit = 10 
-        activity_log_recent_slice = list(self.channel_activity_log[channel])[-search_limit:]
-        for _timestamp, sender_nick, message_text_log in reversed(activity_log_recent_slice):
-            if sender_nick == nickname: 
-                bot_last_message_text = message_text_log
-                break
-        current_topics = get_active_topic_list(channel)
-        topic = openai_api_request_topic(stripped_cmd, current_topics, bot_last_message_text, nick)
+        if assigned_topic is not None: # Deferred after classification: reuse the topic instead of paying for it twice
+            topic, is_followup = assigned_topic
+            current_topics = get_active_topic_list(channel, current_time)
+        else:
+            # The bot's last turn in this channel, recorded by send_multiline
+            last_turn = self.bot_turns[channel][-1] if self.bot_turns[channel] else None
+            topic, current_topics, is_followup = assign_message_topic(channel, nick, stripped_cmd, last_turn, current_time)
+        diagnostics.stage("topic")
+        if is_followup:
+            print(f"## Topic: short follow-up to our last reply, keeping '{topic}'.")
         print(f"DEBUG IRC BOT [Topic Assignment] Channel: {channel}, Nick: {nick}")
         print(f"DEBUG IRC BOT   Message: '{stripped_cmd}'")
         print(f"DEBUG IRC BOT   Options: {current_topics}")
         print(f"DEBUG IRC BOT   Selected Topic: '{topic}'")
         merged_topic = topic
 
+        # Looked up in answer_from_cache before classification; the reply is stored under the assigned topic
+        cache_scope = None
+        if not is_followup and not is_context_dependent(stripped_cmd):
+            cache_scope = ResponseCache.make_scope(channel, merged_topic, self.directive_version)
+
+        if not llm_scheduler.acquire_provider("anthropic"):
+            # Checked before any topic/thread updates, so a deferred message is recorded only when it is
+            # answered. The topic goes with it, so the retry makes no second classification call.
+            if deferred:
+                print(f"## Provider still rate limited; dropping deferred reply to {nick} in {channel}.")
+            else:
+                self.defer_reply(e, stripped_cmd, nick, is_pm, is_direct_command, assigned_topic=(topic, is_followup))
+            return
+
         ts = current_time
         update_user_context(channel, nick, stripped_cmd, merged_topic, ts)
         update_topic_threads(channel, merged_topic, nick, stripped_cmd, ts)
 
-        conversation_context_from_topic = get_topic_conversation_snippet(channel, merged_topic, n=8)
-        lines_in_topic_context = conversation_context_from_topic.count('\n') + 1 if conversation_context_from_topic else 0
-        context_str = ""
-        # get_topic_conversation_snippet will now include the stripped_cmd as the latest message
-        conversation_context = get_topic_conversation_snippet(channel, merged_topic, n=8)
-        is_newish_topic_or_general = (merged_topic == "general" and lines_in_topic_context <= 2) or \
-                                    (lines_in_topic_context <= 1) # Topic essentially only has current message
-        if is_newish_topic_or_general and not is_direct_command: # If general mention and topic context is sparse
-            print(f"## Context: Topic '{merged_topic}' sparse or 'general'. Using recent channel activity for general mention.")
-            raw_channel_history = []
-            # Iterate over a copy of the deque up to the one before current triggering message.
-            # This is tricky to perfectly avoid the current message without more info.
-            # A simpler approach for now: take the last few distinct messages.
-            for r_ts, r_nick, r_msg in list(self.channel_activity_log[channel])[-7:]: # Last 7 raw messages
-                # Avoid adding the *exact* current stripped_cmd by the same nick at the same time
-                # This simple check might not be enough if stripped_cmd is very different from raw r_msg
-                if not (r_nick == nick and r_msg == cmd and abs(r_ts - ts) < 2):
-                    raw_channel_history.append(f"{r_nick}: {r_msg}")
-            
-            if raw_channel_history:
-                context_str = "\n".join(raw_channel_history)
-                # Append the current message that triggered the bot, as it's the focal point
-                context_str += f"\n{nick}: {stripped_cmd}" 
-            else: # Raw history also empty or only current message, fall back to topic context (which has current message)
-                context_str = conversation_context_from_topic
-        elif lines_in_topic_context <= 1 and is_direct_command and merged_topic != "general":
-            # Direct command starting a new, specific topic. Context should be just this command.
-            print(f"## Context: Direct command for new specific topic '{merged_topic}'. Using command only.")
-            context_str = f"{nick}: {stripped_cmd}"
-        else:
-            # Topic has history, or it's a direct command on an established topic.
-            print(f"## Context: Using established topic context for '{merged_topic}'.")
-            context_str = conversation_context_from_topic
-        # Handle edge case where topic was just created and snippet might be unexpectedly empty
-        # though update_topic_threads followed by get_topic_conversation_snippet should make it non-empty.
-        lines = context_str.strip().split('\n')
-        context_str_for_llm = "" # Initialize
-
-        if not lines: # Should ideally not happen if context_str is always populated
-            print(f"## WARNING: context_str was empty. Defaulting context_str_for_llm for {nick}: {stripped_cmd}")
-            context_str_for_llm = f"Current question to respond to:\n{nick}: {stripped_cmd}"
-        elif len(lines) == 1: # Only the current message is in the context
-            # This branch assumes the context_str correctly contains only the current message.
-            context_str_for_llm = f"Current question to respond to:\n{lines[0]}"
-        else: # More than one line, so there's history + current message
-            history_lines = lines[:-1] # All lines except the last one
-            current_message_line = lines[-1] # The last line is the current message
-            
+        history_lines, context_tokens = build_reply_context(
+            channel, nick, stripped_cmd, merged_topic, ts,
+            recent_activity=self.channel_activity_log[channel],
+            include_ambient=not is_direct_command,
+        )
+        current_message_line = f"{nick}: {stripped_cmd}"
+        print(f"## Context: {len(history_lines)} lines (~{context_tokens} tokens) selected for topic '{merged_topic}'.")
+        if history_lines:
             history_text = '\n'.join(history_lines)
-            context_str_for_llm = f"""Recent conversation: 
-            {history_text}
-            Current question to respond to:
-            {current_message_line}"""
-        if not context_str and stripped_cmd: 
-            context_str = f"{nick}: {stripped_cmd}"
-
-        response = self.anthropic_conversation_reply(context_str_for_llm)
+            context_str_for_llm = f"Recent conversation:\n{history_text}\nCurrent question to respond to:\n{current_message_line}"
+        else:
+            context_str_for_llm = f"Current question to respond to:\n{current_message_line}"
+        if not is_pm and RECALL_PATTERN.search(stripped_cmd):
+            recalled = self.recall_past_exchanges(channel, stripped_cmd, ts)
+            if recalled:
+                context_str_for_llm = f"Past channel history (from long-term memory):\n{recalled}\n{context_str_for_llm}"
+        diagnostics.stage("context")
+
+        max_tokens = REPLY_MAX_TOKENS
+        if llm_scheduler.budget_state() != BUDGET_OK:
+            max_tokens = REPLY_MAX_TOKENS_DEGRADED
+            llm_scheduler.note_degraded("short_reply")
+        call_started = time.perf_counter()
+        response = self.anthropic_conversation_reply(context_str_for_llm, max_tokens=max_tokens)
+        if response and cache_scope is not None and max_tokens == REPLY_MAX_TOKENS \
+                and not re.search(rf'\b{re.escape(nick)}\b', response, re.IGNORECASE):
+            # Replies that address the asker by name would read wrong to the next person
+            response_cache.put(stripped_cmd, cache_scope, response, (time.perf_counter() - call_started) * 1000)
         if not response:
-            response = self.openai_fallback_reply(context_str_for_llm)
-        self.send_multiline(e.target, response, nick, is_pm)
-
-        if stripped_cmd.lower() == "help":
-            help_text = (
-                "Available commands:\n"
-                f"- '{nickname}: clear topics' or '{nickname}: clear context' (admin only): Clears conversation topics.\n"
-                f"- '{nickname}: topics' or '{nickname}: show topics': Shows active conversation topics.\n"
-                #f"- '{nickname}: set personality <name>' (admin only): Changes my personality.\n"
-                #f"- '{nickname}: show personality' (admin only): Shows my current personality.\n"
-                f"- '{nickname}: ignore <user>' (admin only): Ignores a user.\n"
-                f"- '{nickname}: unignore <user>' (admin only): Unignores a user.\n"
-                f"- '{nickname}: show ignored' (admin only): Shows ignored users.\n"
-                f"- '{nickname}: help': Shows this help message.\n"
-                f"Just talk to me by starting your message with '{nickname}:' or mentioning '{nickname}' anywhere in your message."
-            )
-            self.send_multiline(e.target, help_text, nick, is_pm)
-            return
+            if llm_scheduler.acquire_provider("openai"):
+                response = self.openai_fallback_reply(context_str_for_llm)
+            else:
+                response = "[Primary circuits are down and the backup is rate limited. Try again in a minute.]"
+        diagnostics.stage("model")
+        self.send_multiline(e.target, response, nick, is_pm, topic=merged_topic)
+        diagnostics.stage("send")
+
         # self.personality_change_message_count += 1
         # self._check_and_change_personality()
+        self.log_interaction(channel, nick, merged_topic, context_str_for_llm, response)
+        diagnostics.stage("log_file")
+
+    def log_interaction(self, channel, nick, merged_topic, context_str_for_llm, response):
         try:
             with open(LOG_FILENAME, 'a', encoding='utf-8') as f:
                 f.write(f"TIMESTAMP: {datetime.datetime.now().isoformat()}\n")
@@ -660,7 +1353,25 @@ class DumbBot(irc.bot.SingleServerIRCBot):
             print(f"Error writing to log: {ex_log}")
             pass
 
-    def send_multiline(self, target, response, nick, is_pm, max_length=420):
+    def recall_past_exchanges(self, channel, question, ts):
+        """Formats matching past exchanges from the long-term index, within MEMORY_CONTEXT_TOKEN_BUDGET."""
+        started = time.perf_counter()
+        exchanges = self.memory_index.search(channel, question, before_ts=ts - MEMORY_RECENT_EXCLUSION_SECONDS)
+        remaining = MEMORY_CONTEXT_TOKEN_BUDGET
+        blocks = []
+        for exchange in exchanges:
+            block = "\n".join(
+                f"[{datetime.datetime.fromtimestamp(msg_ts).strftime('%Y-%m-%d')}] {msg_nick}: {msg}"
+                for msg_ts, msg_nick, msg in exchange)
+            cost = estimate_tokens(block)
+            if cost > remaining:
+                break
+            blocks.append(block)
+            remaining -= cost
+        print(f"## Memory: recalled {len(blocks)} past exchanges in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        return "\n---\n".join(blocks)
+
+    def send_multiline(self, target, response, nick, is_pm, max_length=420, topic=None):
         response = response.replace('\r', '').replace('\n', ' ')
         nick_regex = re.compile(rf'\b{re.escape(nick)}\b', re.IGNORECASE)
         prefix_needed = not bool(nick_regex.search(response))
@@ -668,26 +1379,22 @@ class DumbBot(irc.bot.SingleServerIRCBot):
             chunk = response[i:i+max_length]
             msg = f"{nick}: {chunk}" if (not is_pm and prefix_needed) else chunk
             self.connection.privmsg(target, msg)
-    def load_archived_summaries(self):
-        try:
-            with open(self.archived_topic_summaries_file, 'r', encoding='utf-8') as f:
-                ## Handle potential non-defaultdict structure from JSON
-                loaded_data = json.load(f)
-                for ch, topics in loaded_data.items():
-                    self.archived_topic_summaries[ch] = topics
-            print("## Loaded archived topic summaries.")
-        except FileNotFoundError:
-            print("## No archived summaries file found. Starting fresh.")
-        except json.JSONDecodeError:
-            print("## Error decoding archived summaries file. Starting fresh.")
-    def save_archived_summaries(self):
-        try:
-            with open(self.archived_topic_summaries_file, 'w', encoding='utf-8') as f:
-                json.dump(self.archived_topic_summaries, f, indent=4)
-            print("## Saved archived topic summaries.")
-        except Exception as e:
-            print(f"## Error saving archived summaries: {e}")
-            self.last_personality_change_time = time.time()
+            # Indexed exactly as sent, so the same line read back from the WeeChat log is deduplicated
+            self.memory_index.add_message(target, time.time(), nickname, msg.strip())
+        self.record_bot_turn(target, response, nick, topic)
+
+    def record_bot_turn(self, target, response, nick, topic=None):
+        """Records one whole outgoing reply; the server never echoes our own PRIVMSGs back."""
+        if not response:
+            return
+        ts = time.time()
+        self.channel_activity_log[target].append((ts, nickname, response))
+        self.bot_turns[target].append({"ts": ts, "text": response, "nick": nick, "topic": topic})
+        if topic and topic in topic_threads.get(target, {}):
+            # Attach the reply to the thread it answered (not to "members", which counts people)
+            topic_data = topic_threads[target][topic]
+            topic_data["messages"].append((ts, nickname, response))
+            topic_data["last_active"] = ts
 
 def main():
     bot = DumbBot(
@@ -701,12 +1408,25 @@ def main():
     def shutdown_handler(sig, frame):
         print("## Signal received, saving state and shutting down...")
         if bot: # Check if bot object exists
+            bot.directive_watcher.stop()
+            if bot.heartbeat_thread:
+                bot.heartbeat_thread.stop()
             bot.save_state() # Call the general save method
+            if bot.coordinator:
+                bot.coordinator.close()
             bot.disconnect("Bot shutting down gracefully.")
         sys.exit(0)
 
+    def diagnostics_handler(sig, frame):
+        # Reports can take a moment; keep the reactor thread (where signals land) responsive
+        action = diagnostics.toggle if sig == signal.SIGUSR1 else diagnostics.memory_snapshot
+        threading.Thread(target=lambda: print(f"## {action()}"), daemon=True).start()
+
     signal.signal(signal.SIGINT, shutdown_handler)
     signal.signal(signal.SIGTERM, shutdown_handler)
+    if hasattr(signal, "SIGUSR1"): # Not on Windows; 'diag' commands still work there
+        signal.signal(signal.SIGUSR1, diagnostics_handler) # Start/stop profiling and message timing
+        signal.signal(signal.SIGUSR2, diagnostics_handler) # Memory snapshot
     bot.start()
 
 if __name__ == "__main__":